@@ -9,7 +9,9 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 
 from ..services.faq_tool import get_faq_context
-from ..services.rag_service import retrieve_similar_context
+from ..services.llm_factory import get_chat_model
+from ..services.rag_service import RetrievalResult, retrieve_similar_context
+from ..services.streaming import invoke_chain
 
 load_dotenv(override=True)
 logger = logging.getLogger(__name__)
@@ -37,11 +39,7 @@ class AgentePerguntas:
         )
         
         try:
-            return ChatGoogleGenerativeAI(
-                model=nome_modelo,
-                google_api_key=chave_api,
-                temperature=0.1,
-            )
+            return get_chat_model(nome_modelo, temperature=0.1, api_key=chave_api)
         except Exception:
             return None
 
@@ -137,13 +135,19 @@ Responda usando APENAS as informações do contexto acima.""",
                     return (partes["conteudo"] or ctx).strip()
         return None
 
-    def gerar_resposta(self, pergunta: str, contextos: Optional[List[str]] = None) -> Tuple[str, str]:
+    def gerar_resposta(
+        self,
+        pergunta: str,
+        contextos: Optional[List[str]] = None,
+        recuperacao: Optional[RetrievalResult] = None,
+    ) -> Tuple[str, str]:
         """
         Gera resposta usando contextos ou payload FAQ
         
         Args:
             pergunta: Texto da pergunta
             contextos: Lista opcional de contextos
+            recuperacao: Recuperação já feita na requisição (evita nova busca)
             
         Returns:
             Tupla (resposta, contexto_usado)
@@ -151,7 +155,7 @@ Responda usando APENAS as informações do contexto acima.""",
         try:
             # Resolve texto do contexto
             if contextos is None:
-                payload = get_faq_context(pergunta)
+                payload = get_faq_context(pergunta, retrieval=recuperacao)
                 contexto = payload.get("context", "") if isinstance(payload, dict) else str(payload or "")
             else:
                 if isinstance(contextos, list):
@@ -179,8 +183,7 @@ Responda usando APENAS as informações do contexto acima.""",
                 return (trecho[:1200], contexto)
 
             chain = self.prompt | self.modelo
-            saida = chain.invoke({"context": contexto, "query": pergunta})
-            resposta = getattr(saida, "content", None) or str(saida)
+            resposta = invoke_chain(chain, {"context": contexto, "query": pergunta})
             logger.info("Resposta gerada (truncada): %s", (resposta or "")[:200].replace("`n", " "))
             return resposta.strip(), contexto
 
@@ -203,10 +206,20 @@ def executar_agente_perguntas(pergunta: str, contextos: Optional[List[str]] = No
 
 # Compatibilidade com o restante do código que espera English API
 class FAQAgent(AgentePerguntas):
-    def generate_response(self, query: str, contexts: Optional[List[str]] = None) -> Tuple[str, str]:
-        return super().gerar_resposta(query, contexts)
-
-
-def run_faq_agent(query: str, contexts: Optional[List[str]] = None) -> Tuple[str, str]:
+    def generate_response(
+        self,
+        query: str,
+        contexts: Optional[List[str]] = None,
+        retrieval: Optional[RetrievalResult] = None,
+    ) -> Tuple[str, str]:
+        return super().gerar_resposta(query, contexts, retrieval)
+
+
+def run_faq_agent(
+    query: str,
+    contexts: Optional[List[str]] = None,
+    *,
+    retrieval: Optional[RetrievalResult] = None,
+) -> Tuple[str, str]:
     agent = FAQAgent()
-    return agent.generate_response(query, contexts)
+    return agent.generate_response(query, contexts, retrieval)
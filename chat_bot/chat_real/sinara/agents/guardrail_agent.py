@@ -1,20 +1,18 @@
 import os
-import json
 import logging
+import re
+import unicodedata
 from typing import Union
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts.few_shot import FewShotChatMessagePromptTemplate
-from langchain_core.prompts import (
-    ChatPromptTemplate,
-    MessagesPlaceholder,
-    HumanMessagePromptTemplate,
-    AIMessagePromptTemplate,
-)
 
+from ..services.llm_factory import get_chat_model
 from ..services.memory_tecnico import get_memory
+from ..services.model_health import call_with_fallback
+from ..services.prompt_registry import get_prompt, prompt_version, register_prompt
+from ..utils.deadline import retry_with_jitter
+from ..utils.ttl_cache import TTLCache
 
 
 def _load_api_key() -> str | None:
@@ -37,89 +35,88 @@ class GuardrailOutput(BaseModel):
     )
 
 
-# Lê o template do prompt
-system_prompt_path = os.path.join(
-    os.path.dirname(__file__), "../prompts/guardrail/system_prompt.txt"
-)
-with open(system_prompt_path, "r", encoding="utf-8") as x:
-    system_text = x.read()
-system_prompt = ("system", system_text)
-
-# Lê exemplos few-shot
-fewshots_path = os.path.join(
-    os.path.dirname(__file__), "../prompts/guardrail/fewshot.json"
-)
-with open(fewshots_path, "r", encoding="utf-8-sig") as x:
-    shots = json.load(x)
-
-example_prompt = ChatPromptTemplate.from_messages(
-    [
-        HumanMessagePromptTemplate.from_template("{human}"),
-        AIMessagePromptTemplate.from_template("{ai}"),
-    ]
-)
-
-fewshots = FewShotChatMessagePromptTemplate(
-    examples=shots,
-    example_prompt=example_prompt,
-)
-
-# Monta prompt final (inclui histórico opcional e query)
-guardrail_prompt = ChatPromptTemplate.from_messages(
-    [
-        system_prompt,
-        fewshots,
-        MessagesPlaceholder("memory"),
-        ("human", "{query}"),
-    ]
-)
-
-
-# Conecta com o Gemini para geração de respostas (instanciado sob demanda)
+# Prompt compilado uma vez (sistema + few-shots de prompts/guardrail; inclui histórico opcional e query)
+register_prompt("guardrail", "{query}")
+
+
+# Cache de veredictos por texto normalizado: aprovações e bloqueios (com a mensagem) têm TTLs próprios;
+# TTL de bloqueio menor limita o efeito de um falso positivo
+GUARDRAIL_CACHE_ENABLED = os.getenv("SINARA_GUARDRAIL_CACHE", "1").strip().lower() in ("1", "true", "on")
+GUARDRAIL_PASS_TTL = float(os.getenv("SINARA_GUARDRAIL_PASS_TTL", "43200"))
+GUARDRAIL_BLOCK_TTL = float(os.getenv("SINARA_GUARDRAIL_BLOCK_TTL", "3600"))
+_verdicts = TTLCache(maxsize=int(os.getenv("SINARA_GUARDRAIL_CACHE_SIZE", "4096")), ttl=GUARDRAIL_PASS_TTL)
+
+
+def _verdict_key(query: str, model_name: str) -> tuple | None:
+    """
+    Chave do veredicto: texto sem acentos, pontuação e espaços extras, mais o
+    modelo e a versão do prompt (uma recarga do prompt não reaproveita veredictos antigos)
+    """
+    text = unicodedata.normalize("NFKD", str(query or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = " ".join(re.sub(r"[^\w\s]", " ", text).split())
+    if not text:
+        return None
+    return model_name, prompt_version("guardrail"), text
+
+
+def _verdict_ttl(verdict: tuple[bool, str | None]) -> float:
+    return GUARDRAIL_PASS_TTL if verdict[0] else GUARDRAIL_BLOCK_TTL
+
+
+def guardrail_cache_stats() -> dict:
+    """Métricas do cache de veredictos do guardrail (hits, misses, hit_rate...)"""
+    return _verdicts.stats()
+
+
+# Conecta com o Gemini para geração de respostas (cliente compartilhado, criado sob demanda)
 def _get_chat_model(model_name: str):
     api_key = _load_api_key()
     if not api_key:
         raise RuntimeError("API key ausente")
-    return ChatGoogleGenerativeAI(
-        model=model_name,
-        google_api_key=api_key,
-    ).with_structured_output(GuardrailOutput)
+    return get_chat_model(model_name, schema=GuardrailOutput, api_key=api_key)
+
+
+def _classify(query: str, session_id: str, preferred: str) -> tuple[bool, str | None]:
+    """
+    Chamada ao modelo do guardrail, com fallback entre modelos (ver services.model_health)
+    Levanta exceção se nenhum modelo avaliou a entrada (nada vai para o cache)
+    """
+    memory = get_memory(session_id)
+    candidates = []
+    for m in [
+        preferred,
+        "gemini-1.5-flash-latest",
+        "gemini-1.5-flash-8b",
+        "gemini-1.5-pro-latest",
+        "gemini-1.5-pro",
+    ]:
+        if m and m not in candidates:
+            candidates.append(m)
+
+    def classify(m: str):
+        pipeline = get_prompt("guardrail") | _get_chat_model(m)
+        return retry_with_jitter(pipeline.invoke, {"query": query, "memory": getattr(memory, "messages", [])})
+
+    # Só modelo inexistente passa ao próximo candidato; as demais falhas vão para o pass-through
+    output = call_with_fallback("guardrail", candidates, classify)
+    if getattr(output, "flag", 1) == 0:
+        return True, None
+    else:
+        return False, getattr(output, "message", None)
 
 
 def run_guardrail_agent(query: str, session_id: str):
     try:
-        memory = get_memory(session_id)
-
         preferred = os.getenv("GEMINI_MODEL_GUARDRAIL") or os.getenv(
             "GEMINI_CHAT_MODEL", "gemini-1.5-flash-latest"
         )
-        candidates = []
-        for m in [
-            preferred,
-            "gemini-1.5-flash-latest",
-            "gemini-1.5-flash-8b",
-            "gemini-1.5-pro-latest",
-            "gemini-1.5-pro",
-        ]:
-            if m and m not in candidates:
-                candidates.append(m)
-
-        for m in candidates:
-            try:
-                model = _get_chat_model(m)
-                pipeline = guardrail_prompt | model
-                output = pipeline.invoke(
-                    {"query": query, "memory": getattr(memory, "messages", [])}
-                )
-                if getattr(output, "flag", 1) == 0:
-                    return True, None
-                else:
-                    return False, getattr(output, "message", None)
-            except Exception as e:
-                msg = str(e)
-                if ("NotFound" in msg) or ("is not found" in msg):
-                    continue
-                raise
+        key = _verdict_key(query, preferred) if GUARDRAIL_CACHE_ENABLED else None
+        if key is None:
+            return _classify(query, session_id, preferred)
+        # Entradas repetidas (aprovadas ou bloqueadas) não chamam o modelo de novo;
+        # mensagens iguais concorrentes fazem uma única chamada
+        return _verdicts.get_or_set(key, lambda: _classify(query, session_id, preferred), ttl=_verdict_ttl)
 
     except Exception as e:
         print(f"Erro no guardrail: {e}")
@@ -13,6 +13,8 @@ from pydantic import BaseModel, Field, validator
 from langchain.tools import tool
 from dotenv import load_dotenv
 
+from ..utils.deadline import remaining_time
+
 
 # Carrega variáveis do .env
 load_dotenv(override=True)
@@ -22,7 +24,15 @@ TZ = ZoneInfo("America/Sao_Paulo")
 
 
 def get_conn():
-    return psycopg2.connect(DATABASE_URL)
+    # Dentro de uma requisição com prazo, conexão e consultas respeitam o tempo restante
+    remaining = remaining_time()
+    if remaining is None:
+        return psycopg2.connect(DATABASE_URL)
+    return psycopg2.connect(
+        DATABASE_URL,
+        connect_timeout=max(1, int(remaining)),
+        options=f"-c statement_timeout={max(1, int(remaining * 1000))}",
+    )
 
 
 # Schemas Pydantic
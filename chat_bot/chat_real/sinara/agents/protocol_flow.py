@@ -4,7 +4,6 @@ from zoneinfo import ZoneInfo
 from typing import Dict, Any
 
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
@@ -17,7 +16,9 @@ from .rag_agent_assistente import run_rag_agent_assistente
 from .rag_agent_tecnico import run_rag_agent_tecnico
 from .rag_agent_organizacional import run_rag_agent_organizacional
 from .faq_agent import run_faq_agent
-from ..services.rag_service import retrieve_similar_context_with_scores
+from ..services.llm_factory import get_chat_model
+from ..services.rag_service import retrieve
+from .router_agent import FAQ_ROUTE_THRESHOLD, faq_route_score
 
 
 load_dotenv(override=True)
@@ -30,7 +31,7 @@ def _llm(model: str | None = None, temperature: float = 0.0):
     if not api:
         return None
     m = model or os.getenv("GEMINI_CHAT_MODEL", "gemini-1.5-flash-latest")
-    return ChatGoogleGenerativeAI(model=m, google_api_key=api, temperature=temperature)
+    return get_chat_model(m, temperature=temperature, api_key=api)
 
 
 # ----------------- Roteador -----------------
@@ -143,6 +144,11 @@ def executar_fluxo(query: str, session_id: str) -> str:
     # 0) Heurística early para priorizar técnico/organizacional e evitar quedas no assistente
     q = (query or "").strip()
     qlow = q.lower()
+    # Recuperação única, compartilhada entre roteamento e agentes
+    try:
+        retrieval = retrieve(q)
+    except Exception:
+        retrieval = None
     tecnico_kw = [
     # Parâmetros de qualidade
     "ph", "turbidez", "ntu", "cor aparente", "cor verdadeira", "tds", "std", "sdt",
@@ -262,9 +268,8 @@ def executar_fluxo(query: str, session_id: str) -> str:
         # 0.1) Sinal forte de FAQ pelo contexto.json
         route = None
         try:
-            pairs = retrieve_similar_context_with_scores(q, top_k=3)
-            top_score = pairs[0][0] if pairs else 0.0
-            if top_score >= 0.65:
+            top_score = faq_route_score(retrieval) if retrieval is not None else 0.0
+            if top_score >= FAQ_ROUTE_THRESHOLD:
                 route = "faq"
         except Exception:
             pass
@@ -287,7 +292,7 @@ def executar_fluxo(query: str, session_id: str) -> str:
                 pass
 
     if route == "faq":
-        resposta, contexto = run_faq_agent(query)
+        resposta, contexto = run_faq_agent(query, retrieval=retrieval)
         json_text = _wrap_json("faq", resposta)
         orch = _get_orchestrator_chain()
         if orch is not None:
@@ -300,13 +305,13 @@ def executar_fluxo(query: str, session_id: str) -> str:
 
     # Usa os agentes existentes para gerar resposta e envolve em JSON simples
     if route == "assistente":
-        resposta, contexto = run_rag_agent_assistente(query, session_id)
+        resposta, contexto = run_rag_agent_assistente(query, session_id, retrieval=retrieval)
         json_text = _wrap_json("assistente", resposta)
     elif route == "tecnico":
-        resposta, contexto = run_rag_agent_tecnico(query, session_id)
+        resposta, contexto = run_rag_agent_tecnico(query, session_id, retrieval=retrieval)
         json_text = _wrap_json("tecnico", resposta)
     else:  # organizacional
-        resposta, contexto = run_rag_agent_organizacional(query, session_id)
+        resposta, contexto = run_rag_agent_organizacional(query, session_id, retrieval=retrieval)
         json_text = _wrap_json("organizacional", resposta)
 
     orch = _get_orchestrator_chain()
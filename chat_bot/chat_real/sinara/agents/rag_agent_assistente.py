@@ -1,18 +1,19 @@
 ﻿import os
-import json
 import logging
+from typing import Optional
 from dotenv import load_dotenv
-from langchain.prompts.few_shot import FewShotChatMessagePromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import (
-    ChatPromptTemplate,
-    MessagesPlaceholder,
-    HumanMessagePromptTemplate,
-    AIMessagePromptTemplate,
-)
 
+from ..services.llm_factory import get_chat_model
 from ..services.memory_assistente import get_memory
-from ..services.rag_service import retrieve_similar_context, retrieve_similar_context_with_scores
+from ..services.model_health import call_with_fallback
+from ..services.prompt_registry import get_prompt, register_prompt
+from ..services.streaming import invoke_chain
+from ..services.rag_service import (
+    RetrievalResult,
+    retrieval_for_agent,
+    retrieve_similar_context,
+    retrieve_similar_context_with_scores,
+)
 
 
 load_dotenv(override=True)
@@ -22,14 +23,7 @@ logger = logging.getLogger(__name__)
 
 
 def _get_chat_model(model_name: str):
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("API key ausente")
-    return ChatGoogleGenerativeAI(
-        model=model_name,
-        google_api_key=api_key,
-        temperature=0.3,
-    )
+    return get_chat_model(model_name, temperature=0.3)
 
 
 FALLBACK_MODELS = [
@@ -38,44 +32,23 @@ FALLBACK_MODELS = [
 ]
 
 
-system_prompt_path = os.path.join(
-    os.path.dirname(__file__), "../prompts/rag/assistente/system_prompt_assistente.txt"
-)
-with open(system_prompt_path, "r", encoding="utf-8") as x:
-    system_text = x.read()
-system_prompt = ("system", system_text)
-
-fewshots_path = os.path.join(
-    os.path.dirname(__file__), "../prompts/rag/assistente/fewshot.json"
-)
-with open(fewshots_path, "r", encoding="utf-8") as x:
-    shots = json.load(x)
-
-example_prompt = ChatPromptTemplate.from_messages(
-    [
-        HumanMessagePromptTemplate.from_template("{human}"),
-        AIMessagePromptTemplate.from_template("{ai}"),
-    ]
-)
+# Prompt RAG compilado uma vez (sistema + few-shots de prompts/rag/assistente)
+register_prompt("rag/assistente", "Contexto:\n{context}\n\nPergunta:\n{query}")
 
-fewshots = FewShotChatMessagePromptTemplate(
-    examples=shots,
-    example_prompt=example_prompt,
-)
 
-rag_prompt = ChatPromptTemplate.from_messages(
-    [
-        system_prompt,
-        fewshots,
-        MessagesPlaceholder("memory"),
-        ("human", "Contexto:\n{context}\n\nPergunta:\n{query}"),
-    ]
-)
+def _fallback_pairs(query: str, retrieval: Optional[RetrievalResult]):
+    if retrieval is not None:
+        return retrieval.with_scores(3)
+    return retrieve_similar_context_with_scores(query, top_k=3)
 
 
-def run_rag_agent_assistente(query, session_id):
+def run_rag_agent_assistente(query, session_id, *, retrieval: Optional[RetrievalResult] = None):
+    retrieval = retrieval_for_agent(query, "assistente", retrieval)
     try:
-        ctx = retrieve_similar_context(query)
+        if retrieval is not None:
+            ctx = retrieval.similar_context()
+        else:
+            ctx = retrieve_similar_context(query)
         context = "\n".join(ctx) if isinstance(ctx, list) else str(ctx or "")
     except Exception as e:
         logger.error(f"Erro na recuperação de contexto: {e}")
@@ -89,27 +62,28 @@ def run_rag_agent_assistente(query, session_id):
         env_model = os.getenv("GEMINI_MODEL_ASSISTENTE") or os.getenv("GEMINI_CHAT_MODEL")
         candidates = [m for m in [env_model, *FALLBACK_MODELS] if m]
 
-        for candidate in candidates:
-            try:
-                logger.info(f"Tentando modelo: {candidate}")
-                model = _get_chat_model(candidate)
-                chain = rag_prompt | model
-                output = chain.invoke(
-                    {
-                        "context": context,
-                        "query": query,
-                        "memory": getattr(memory, "messages", []),
-                    }
-                )
-                content = getattr(output, "content", None) or str(output)
-                return content, context
-            except Exception as e:
-                logger.warning(f"Modelo {candidate} falhou: {e}")
-                continue
+        def generate(candidate: str):
+            logger.info(f"Tentando modelo: {candidate}")
+            chain = get_prompt("rag/assistente") | _get_chat_model(candidate)
+            return invoke_chain(
+                chain,
+                {
+                    "context": context,
+                    "query": query,
+                    "memory": getattr(memory, "messages", []),
+                },
+            )
+
+        # Qualquer falha de um modelo passa ao próximo candidato; sem cota no limitador
+        # ou sem prazo, vai direto ao fallback extrativo
+        try:
+            return call_with_fallback("assistente", candidates, generate, fall_through=lambda e: True), context
+        except Exception as e:
+            logger.warning(f"Sem resposta dos modelos: {e}")
 
         logger.error("Nenhum modelo disponível respondeu com sucesso.")
         # Fallback baseado na melhor correspondÃªncia
-        pairs = retrieve_similar_context_with_scores(query, top_k=3)
+        pairs = _fallback_pairs(query, retrieval)
         if pairs:
             _score, text = pairs[0]           
             return (str(text).strip()[:1200], context)
@@ -117,7 +91,7 @@ def run_rag_agent_assistente(query, session_id):
 
     except Exception as e:
         logger.error(f"Erro na geração da resposta: {e}")
-        pairs = retrieve_similar_context_with_scores(query, top_k=3)
+        pairs = _fallback_pairs(query, retrieval)
         if pairs:
             _score, text = pairs[0]
             return (str(text).strip()[:1200], context)
@@ -125,7 +99,7 @@ def run_rag_agent_assistente(query, session_id):
 
     except Exception as e:
         logger.error(f"Erro na geração da resposta: {e}")
-        pairs = retrieve_similar_context_with_scores(query, top_k=3)
+        pairs = _fallback_pairs(query, retrieval)
         if pairs:
             _score, text = pairs[0]
             return (str(text).strip()[:1200], context)
@@ -1,26 +1,40 @@
 ﻿import os
-import json
 import logging
 import re
 from typing import Tuple, Optional, List, Iterable
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts.few_shot import FewShotChatMessagePromptTemplate
-from langchain_core.prompts import (
-    ChatPromptTemplate,
-    MessagesPlaceholder,
-    HumanMessagePromptTemplate,
-    AIMessagePromptTemplate,
-)
+from langchain_core.prompts import ChatPromptTemplate
 
+from ..services.llm_factory import get_chat_model
 from ..services.memory_tecnico import get_memory
-from ..services.rag_service import retrieve_similar_context, retrieve_similar_context_with_scores
+from ..services.prompt_registry import get_prompt, register_prompt
+from ..services.streaming import invoke_chain
+from ..services.rag_service import (
+    RetrievalResult,
+    retrieval_for_agent,
+    retrieve_similar_context,
+    retrieve_similar_context_with_scores,
+)
 
 
 load_dotenv(override=True)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Prompt compilado uma vez (sistema + few-shots de prompts/rag/organizacional)
+register_prompt(
+    "rag/organizacional",
+    (
+        "Contexto disponível:\n{context}\n\n"
+        "Pergunta do usuário:\n{query}\n\n"
+        "Instruções:\n"
+        "1) Primeiro verifique se a resposta existe no contexto. Se existir, responda com base no contexto (use o texto do contexto, seja objetivo).\n"
+        "2) Se não existir no contexto, responda usando seu conhecimento geral apenas se tiver confiança na resposta.\n"
+        "3) Se não tiver certeza, informe que não há informação suficiente.\n"
+    ),
+)
+
 
 class RAGAgent:
     def __init__(self):
@@ -32,49 +46,10 @@ class RAGAgent:
         if not api_key:
             raise RuntimeError("Missing API key for Google generative model")
         model_name = os.getenv("GEMINI_MODEL_ORG") or os.getenv("GEMINI_CHAT_MODEL", "gemini-pro")
-        return ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key, temperature=0.2)
+        return get_chat_model(model_name, temperature=0.2, api_key=api_key)
 
     def _load_prompt(self) -> ChatPromptTemplate:
-        base_path = os.path.dirname(__file__)
-        system_path = os.path.join(base_path, "../prompts/rag/organizacional/system_prompt_organizacional.txt")
-        fewshot_path = os.path.join(base_path, "../prompts/rag/organizacional/fewshot.json")
-
-        with open(system_path, "r", encoding="utf-8") as f:
-            system_text = f.read()
-
-        with open(fewshot_path, "r", encoding="utf-8") as f:
-            raw_shots = json.load(f)
-
-        # converte fewshots para o formato esperado
-        examples = []
-        for ex in raw_shots:
-            # Garantir chaves 'human' e 'ai'
-            examples.append({"human": ex.get("human", ""), "ai": ex.get("ai", "")})
-
-        example_prompt = ChatPromptTemplate.from_messages([
-            HumanMessagePromptTemplate.from_template("{human}"),
-            AIMessagePromptTemplate.from_template("{ai}"),
-        ])
-
-        fewshots = FewShotChatMessagePromptTemplate(
-            examples=examples,
-            example_prompt=example_prompt,
-        )
-
-        #prompt final
-        return ChatPromptTemplate.from_messages([
-            ("system", system_text),
-            fewshots,
-            MessagesPlaceholder("memory"),
-            ("human", (
-                "Contexto disponível:\n{context}\n\n"
-                "Pergunta do usuário:\n{query}\n\n"
-                "Instruções:\n"
-                "1) Primeiro verifique se a resposta existe no contexto. Se existir, responda com base no contexto (use o texto do contexto, seja objetivo).\n"
-                "2) Se não existir no contexto, responda usando seu conhecimento geral apenas se tiver confiança na resposta.\n"
-                "3) Se não tiver certeza, informe que não há informação suficiente.\n"
-            )),
-        ])
+        return get_prompt("rag/organizacional")
 
     def _extract_title_and_content(self, ctx) -> Tuple[Optional[str], str]:
         """
@@ -133,12 +108,15 @@ class RAGAgent:
                 return content
         return None
 
-    def _get_context(self, query: str) -> str:
+    def _get_context(self, query: str, retrieval: Optional[RetrievalResult] = None) -> str:
         """
         Recupera e formata contextos quando não forem fornecidos externamente.
         """
         try:
-            ctx = retrieve_similar_context(query, top_k=5)
+            if retrieval is not None:
+                ctx = retrieval.similar_context(5)
+            else:
+                ctx = retrieve_similar_context(query, top_k=5)
             if not ctx:
                 logger.debug("retrieve_similar_context retornou vazio")
                 return ""
@@ -154,13 +132,24 @@ class RAGAgent:
             logger.exception("Erro ao recuperar contexto")
             return ""
 
-    def generate_response(self, query: str, session_id: str, provided_contexts: list | None = None) -> Tuple[str, str]:
+    def generate_response(
+        self,
+        query: str,
+        session_id: str,
+        provided_contexts: list | None = None,
+        retrieval: Optional[RetrievalResult] = None,
+    ) -> Tuple[str, str]:
         """
         Primeiro verifica se algum contexto (fornecido ou recuperado) responde diretamente;
         se sim, retorna o texto do contexto. Caso contrário, chama o modelo.
         """
         # Preferir contextos fornecidos (do manipulador HTTP) se presentes
-        contexts_to_check = provided_contexts if provided_contexts is not None else retrieve_similar_context(query, top_k=5)
+        if provided_contexts is not None:
+            contexts_to_check = provided_contexts
+        elif retrieval is not None:
+            contexts_to_check = retrieval.similar_context(5)
+        else:
+            contexts_to_check = retrieve_similar_context(query, top_k=5)
 
         # Tentar correspondência direta de contexto
         try:
@@ -176,7 +165,7 @@ class RAGAgent:
         # Se não houver correspondência direta de contexto, continuar com o fluxo padrão
         context_str = "\n\n".join(
             (self._extract_title_and_content(c)[1] for c in contexts_to_check)
-        ) if contexts_to_check else self._get_context(query)
+        ) if contexts_to_check else self._get_context(query, retrieval)
 
         memory = get_memory(session_id)
         memory_messages = getattr(memory, "messages", []) if memory else []
@@ -191,18 +180,21 @@ class RAGAgent:
             logger.debug("Prompt inputs keys: %s", list(prompt_inputs.keys()))
 
             chain = self.prompt | self.model
-            output = chain.invoke(prompt_inputs)
-
-            content = getattr(output, "content", None) or str(output)
+            content = invoke_chain(chain, prompt_inputs)
             logger.info("Modelo retornou resposta (primeiros 300 chars): %s", content[:300].replace("\n", " "))
             return content, context_str
         except Exception:
             logger.exception("Erro ao gerar resposta com o modelo")
-            return self._fallback_response(query, context_str)
+            return self._fallback_response(query, context_str, retrieval)
 
-    def _fallback_response(self, query: str, context: str) -> Tuple[str, str]:
+    def _fallback_response(
+        self, query: str, context: str, retrieval: Optional[RetrievalResult] = None
+    ) -> Tuple[str, str]:
         try:
-            pairs = retrieve_similar_context_with_scores(query, top_k=3)
+            if retrieval is not None:
+                pairs = retrieval.with_scores(3)
+            else:
+                pairs = retrieve_similar_context_with_scores(query, top_k=3)
             if pairs:
                 first = pairs[0]
                 text = first[1] if isinstance(first, (list, tuple)) and len(first) >= 2 else (first if isinstance(first, str) else "")
@@ -214,24 +206,35 @@ class RAGAgent:
         return ("Desculpe, não encontrei informações suficientes para responder com confiança.", context)
 
 
-def run_rag_agent_organizacional(query: str, session_id: str, contexts: list | None = None) -> Tuple[str, str]:
+def run_rag_agent_organizacional(
+    query: str,
+    session_id: str,
+    contexts: list | None = None,
+    *,
+    retrieval: Optional[RetrievalResult] = None,
+) -> Tuple[str, str]:
     """
     Wrapper resiliente: se a inicialização do modelo falhar (ex: chave API ausente),
     retorna um trecho determinístico do contexto como alternativa.
     """
+    retrieval = retrieval_for_agent(query, "organizacional", retrieval)
     try:
         agent = RAGAgent()
         logger.info("Iniciando agente: query=%s session_id=%s", query, session_id)
         if contexts:
             logger.debug("Usando contextos fornecidos: %s", contexts)
-        return agent.generate_response(query, session_id, contexts)
+        return agent.generate_response(query, session_id, contexts, retrieval)
     except Exception as e:
         logger.error("Falha ao inicializar agente organizacional: %s", e)
         # fallback determinístico
         try:
-            ctx_list = retrieve_similar_context(query, top_k=5)
+            if retrieval is not None:
+                ctx_list = retrieval.similar_context(5)
+                pairs = retrieval.with_scores(3)
+            else:
+                ctx_list = retrieve_similar_context(query, top_k=5)
+                pairs = retrieve_similar_context_with_scores(query, top_k=3)
             context_joined = "\n\n".join(ctx_list) if isinstance(ctx_list, list) else str(ctx_list or "")
-            pairs = retrieve_similar_context_with_scores(query, top_k=3)
             if pairs:
                 top = pairs[0]
                 text = top[1] if isinstance(top, (list, tuple)) and len(top) > 1 else (top if isinstance(top, str) else "")
@@ -4,14 +4,15 @@ from typing import Optional, Tuple, List
 
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
     AIMessagePromptTemplate,
 )
 from langchain.prompts.few_shot import FewShotChatMessagePromptTemplate
-from ..services.rag_service import retrieve_similar_context_with_scores
+from ..services.llm_factory import get_chat_model
+from ..services.rag_service import RetrievalResult, retrieve
+from ..utils.deadline import retry_with_jitter
 
 
 load_dotenv(override=True)
@@ -26,6 +27,20 @@ SYSTEM_KEYWORDS = {
 }
 
 
+# Similaridade de cosseno mínima entre a query e o melhor contexto para rotear direto ao FAQ.
+# Comparada ao cosseno do melhor item também no modo híbrido (o score fundido, RRF ou
+# ponderado, tem outra escala); sem embeddings (BM25), vale o score do item
+FAQ_ROUTE_THRESHOLD = float(os.getenv("SINARA_FAQ_ROUTE_THRESHOLD", "0.65"))
+
+
+def faq_route_score(retrieval: RetrievalResult) -> float:
+    """Score do melhor contexto na escala de FAQ_ROUTE_THRESHOLD (cosseno; BM25 sem embeddings)"""
+    score = retrieval.top_dense_score()
+    if score is None:
+        score = retrieval.hits[0].score if retrieval.hits else 0.0
+    return score
+
+
 class RouterDecision(BaseModel):
     route: str = Field(description="'assistente' | 'tecnico' | 'organizacional'")
     reason: Optional[str] = Field(default=None, description="Motivo resumido da escolha")
@@ -33,10 +48,7 @@ class RouterDecision(BaseModel):
 
 def _get_model(model_name: Optional[str] = None):
     m = model_name or os.getenv("GEMINI_MODEL_ROUTER") or os.getenv("GEMINI_CHAT_MODEL", "gemini-1.5-flash-latest")
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("API key ausente")
-    return ChatGoogleGenerativeAI(model=m, google_api_key=api_key).with_structured_output(RouterDecision)
+    return get_chat_model(m, schema=RouterDecision)
 
 
 _SYSTEM = (
@@ -84,13 +96,20 @@ def _is_system_query(query: str) -> bool:
     return bool(query_words & SYSTEM_KEYWORDS)
 
 
-def run_router_agent(query: str, session_id: Optional[str] = None) -> Tuple[str, Optional[str]]:
+def run_router_agent(
+    query: str,
+    session_id: Optional[str] = None,
+    retrieval: Optional[RetrievalResult] = None,
+) -> Tuple[str, Optional[str]]:
     """Decide qual agente deve responder a 'query'.
 
     Estratégia:
       1) Se similaridade no contexto.json for alta, roteia para 'assistente'.
       2) Classificação LLM estruturada entre assistente/tecnico/organizacional.
       3) Heurística simples como fallback.
+
+    Se 'retrieval' for informado (recuperação já feita na requisição), ele é
+    reutilizado em vez de uma nova busca no rag_service.
     """
     qtext = (query or "").strip()
     if not qtext:
@@ -114,9 +133,8 @@ def run_router_agent(query: str, session_id: Optional[str] = None) -> Tuple[str,
 
     # 1) Sinal de FAQ pelo contexto.json
     try:
-        pairs = retrieve_similar_context_with_scores(qtext, top_k=3)
-        top_score = pairs[0][0] if pairs else 0.0
-        if top_score >= 0.65:
+        top_score = faq_route_score(retrieval if retrieval is not None else retrieve(qtext, 3))
+        if top_score >= FAQ_ROUTE_THRESHOLD:
             return "faq", f"FAQ match score={top_score:.2f}"
     except Exception:
         pass
@@ -125,7 +143,7 @@ def run_router_agent(query: str, session_id: Optional[str] = None) -> Tuple[str,
     try:
         model = _get_model()
         chain = _ROUTER_PROMPT | model
-        out: RouterDecision = chain.invoke({"query": qtext})
+        out: RouterDecision = retry_with_jitter(chain.invoke, {"query": qtext})
         route = getattr(out, "route", None) or "assistente"
         route = route.strip().lower()
         if route not in ("assistente", "tecnico", "organizacional"):
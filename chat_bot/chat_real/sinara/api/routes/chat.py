@@ -1,11 +1,20 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
+import json
 import logging
 
-from ...core.pipeline import run_pipeline
-from ...services.rag_service import retrieve_similar_context
-from ...agents.router_agent import run_router_agent
+from ...core.pipeline import run_pipeline_detailed
+from ...core.stages import PipelineTrace
+from ...utils.deadline import Deadline
+from ...services.answer_cache import answer_cache_stats
+from ...services.judge_policy import judge_policy_stats
+from ...services.model_health import model_health_stats
+from ...services.rag_service import query_cache_stats
+from ...services.rate_limiter import rate_limiter_stats
+from ...agents.guardrail_agent import guardrail_cache_stats
 from ...api.models.requests import ChatRequest
 
 logger = logging.getLogger(__name__)
@@ -19,17 +28,44 @@ class ChatResponse(BaseModel):
     session_id: Optional[str] = None
     contexts: List[str] = []
     answer: str
+    timings: Optional[dict] = None  # Tempos dos estágios e caminho crítico (ms)
+    timeouts: List[str] = []  # Estágios que estouraram o prazo (resposta degradada)
 
 @router.get("/health", tags=["health"])
 async def health_check():
     """Verifica status da API"""
     return {"status": "healthy"}
 
+@router.get("/cache/stats", tags=["health"])
+async def cache_stats():
+    """Métricas dos caches (respostas, veredictos do guardrail e embeddings de query)"""
+    return {
+        "answers": answer_cache_stats(),
+        "guardrail": guardrail_cache_stats(),
+        "query_embeddings": query_cache_stats(),
+    }
+
+@router.get("/judge/stats", tags=["health"])
+async def judge_stats():
+    """Chamadas ao LLM juiz feitas e evitadas pela política local (total e por motivo)"""
+    return judge_policy_stats()
+
+@router.get("/models/health", tags=["health"])
+async def models_health():
+    """Circuit breakers dos modelos Gemini com fallback e o modelo em uso por grupo"""
+    return model_health_stats()
+
+@router.get("/ratelimit/stats", tags=["health"])
+async def ratelimit_stats():
+    """Fila e tempos de espera do limitador de taxa das chamadas ao Gemini, por bucket"""
+    return rate_limiter_stats()
+
 @router.get("/chat", response_model=ChatResponse, tags=["chat"])
 async def chat_get(
     query: str,
     session_id: Optional[str] = None,
-    agent: str = "auto"
+    agent: str = "auto",
+    x_deadline_ms: Optional[str] = Header(None),
 ):
     """
     Endpoint GET para consultas via URL
@@ -38,37 +74,35 @@ async def chat_get(
         query: Pergunta do usuário
         session_id: ID da sessão (opcional)
         agent: Tipo de agente (padrão: auto)
+        X-Deadline-Ms: Prazo da requisição em ms (cabeçalho opcional, limitado a SINARA_REQUEST_DEADLINE)
     """
     request = ChatRequest(
         query=query,
         session_id=session_id,
         agent=agent
     )
-    return await chat_endpoint(request)
+    return await chat_endpoint(request, x_deadline_ms)
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
-    """Endpoint principal para processar consultas"""
+async def chat_endpoint(request: ChatRequest, x_deadline_ms: Optional[str] = Header(None)):
+    """Endpoint principal para processar consultas (prazo opcional no cabeçalho X-Deadline-Ms)"""
     try:
         logger.info(f"Consulta recebida: {request.query}")
         
-        # Recupera contextos
-        contexts = retrieve_similar_context(request.query)
-        logger.debug(f"Contextos encontrados: {len(contexts) if contexts else 0}")
-        
-        # Define agente
-        resolved_agent = request.agent
-        if request.agent == "auto":
-            resolved_agent, reason = run_router_agent(request.query, request.session_id)
-            logger.info(f"Agente escolhido: {resolved_agent} ({reason})")
-
-        # Processa resposta
-        answer = run_pipeline(
+        # Guardrail, recuperação (uma vez, reutilizada por roteador e agentes) e roteador
+        # rodam em paralelo; o pipeline roda fora do event loop
+        result = await asyncio.to_thread(
+            run_pipeline_detailed,
             query=request.query,
             session_id=request.session_id,
-            agent=resolved_agent,
-            contexts=contexts
+            agent=request.agent,
+            derive_contexts=True,
+            deadline=Deadline.for_request(x_deadline_ms),
         )
+        answer, resolved_agent = result.answer, result.agent
+        contexts = result.retrieval.similar_context() if result.retrieval is not None else []
+        logger.debug(f"Contextos encontrados: {len(contexts) if contexts else 0}")
+        logger.info(f"Agente escolhido: {resolved_agent}")
         
         logger.debug(f"Resposta bruta do pipeline: tipo={type(answer)}, valor={str(answer)[:200]}")
         
@@ -90,7 +124,9 @@ async def chat_endpoint(request: ChatRequest):
             agent=resolved_agent,
             session_id=request.session_id,
             contexts=contexts if isinstance(contexts, list) else [],
-            answer=answer
+            answer=answer,
+            timings=result.trace.summary(),
+            timeouts=result.timeouts,
         )
         
         logger.info(f"Resposta final gerada: {answer[:200]}")
@@ -105,3 +141,88 @@ async def chat_endpoint(request: ChatRequest):
             contexts=[],
             answer=f"Erro ao processar sua pergunta: {str(e)}"
         )
+
+def _sse(event: str, data: dict) -> str:
+    """Formata um evento server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/chat/stream", tags=["chat"])
+async def chat_stream(
+    request: ChatRequest, http_request: Request, x_deadline_ms: Optional[str] = Header(None)
+):
+    """
+    Endpoint de chat em streaming (text/event-stream)
+
+    Eventos, na ordem em que acontecem:
+        retrieved: modo, namespace e número de trechos recuperados
+        cached: resposta veio do cache semântico (sem geração)
+        blocked: entrada bloqueada pelo guardrail (data.answer é a mensagem)
+        routed: agente escolhido pelo roteador e motivo
+        token: trecho da resposta do agente (data.text), à medida que é gerado
+        reset: o rascunho enviado até aqui foi descartado (ex.: fallback de modelo)
+        judged: veredicto do Judge sobre o rascunho (data.valid; data.policy diz se o LLM juiz foi chamado)
+        correction: o Judge reprovou o rascunho; data.answer substitui o texto recebido
+        done: resposta final, agente, tempos dos estágios e estágios que estouraram o prazo
+        error: falha no processamento
+
+    O prazo da requisição pode ser informado no cabeçalho X-Deadline-Ms
+    """
+    logger.info(f"Consulta recebida (stream): {request.query}")
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    trace = PipelineTrace()
+    deadline = Deadline.for_request(x_deadline_ms)
+
+    def emit(event: str, data: dict):
+        # Chamado das threads do pipeline
+        loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+
+    async def run():
+        try:
+            result = await asyncio.to_thread(
+                run_pipeline_detailed,
+                query=request.query,
+                session_id=request.session_id,
+                agent=request.agent,
+                derive_contexts=True,
+                trace=trace,
+                events=emit,
+                deadline=deadline,
+            )
+            await queue.put((
+                "done",
+                {
+                    "answer": str(result.answer or "").strip(),
+                    "agent": result.agent,
+                    "session_id": request.session_id,
+                    "cached": result.cached,
+                    "timings": trace.summary(),
+                    "timeouts": result.timeouts,
+                },
+            ))
+        except Exception as e:
+            logger.exception("Erro no processamento (stream)")
+            await queue.put(("error", {"answer": f"Erro ao processar sua pergunta: {str(e)}"}))
+
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield _sse(event, data)
+                if event in ("done", "error"):
+                    break
+                if await http_request.is_disconnected():
+                    logger.info("Cliente desconectou; nenhum estágio novo será disparado")
+                    break
+        finally:
+            # Cliente saiu antes do fim: estágios que ainda não começaram não rodam e o pipeline
+            # não agenda novos (agente, hedging, Judge); chamadas já em andamento não são interrompidas
+            if not task.done():
+                trace.cancel.set()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,5 +1,8 @@
 import uuid
-from typing import Iterable, List, Optional
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as StageTimeout
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
 import logging
 import os
 import traceback
@@ -13,11 +16,37 @@ from ..agents.rag_agent_tecnico import run_rag_agent_tecnico
 from ..agents.rag_agent_organizacional import run_rag_agent_organizacional
 from ..agents.router_agent import run_router_agent
 from ..agents.faq_agent import run_faq_agent
+from ..services.answer_cache import CachedAnswer, lookup_answer, store_answer
+from ..services.judge_policy import decide_judge
+from .stages import PipelineTrace, StageCancelled, stage_latency, submit
+from ..utils.deadline import Deadline, current_deadline, deadline_scope, run_within
+from ..services.streaming import TokenStream, current_stream, reset_stream, streaming_to
+from ..services.rate_limiter import PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, call_priority
+from ..services.rag_service import (
+    RetrievalResult,
+    context_is_current,
+    namespace_for,
+    query_vector,
+    retrieval_for_agent,
+    retrieve,
+)
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Geração especulativa: o agente começa a gerar assim que a rota é conhecida, sem esperar o
+# guardrail (o rascunho é descartado se ele bloquear); custa uma geração a mais por bloqueio
+SPECULATIVE_GENERATION = os.getenv("SINARA_SPECULATIVE", "0").strip().lower() in ("1", "true", "on")
+
+# Hedging da geração: se o agente passar do percentil p de latência, uma chamada duplicada é
+# disparada e vale a que terminar primeiro (custa uma geração a mais nas requisições lentas)
+HEDGE_GENERATION = os.getenv("SINARA_HEDGE", "0").strip().lower() in ("1", "true", "on")
+HEDGE_PERCENTILE = float(os.getenv("SINARA_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("SINARA_HEDGE_MIN_SAMPLES", "20"))
+
+_TIMEOUT_ANSWER = "Desculpe, não consegui responder a tempo. Tente novamente em instantes."
+
 # Palavras‑chave relacionadas ao sistema
 SYSTEM_KEYWORDS = {
     'login', 'acesso', 'usuario', 'usuario', 'perfil', 'pagina', 'pagina',
@@ -96,107 +125,679 @@ def _contexts_match_query(contexts: Optional[Iterable[str]], query: str) -> bool
 #         return f"Erro ao processar: {str(e)}"
 
 
-def run_pipeline(query: str, session_id: str | None = None, agent: str = "auto", contexts: list | None = None) -> str:
+def _retrieve_once(query: str, retrieval: RetrievalResult | None) -> RetrievalResult | None:
+    """Recupera o contexto uma única vez por requisição (None se a busca falhar)"""
+    if retrieval is not None:
+        return retrieval
+    try:
+        return retrieve(query)
+    except Exception:
+        logger.exception("Falha na recuperação de contexto; agentes buscarão individualmente")
+        return None
+
+
+def _agent_contexts(agent: str, contexts: list | None) -> list | None:
+    """Contextos globais só valem para agentes sem namespace próprio de recuperação"""
+    return None if namespace_for(agent) else contexts
+
+
+# Agentes que leem a memória da sessão (no prompt e no Judge): a resposta em cache fica restrita à sessão
+_SESSION_SCOPED_AGENTS = frozenset({"assistente", "tecnico"})
+
+
+def lookup_cached_answer(
+    query: str,
+    agent: str = "auto",
+    retrieval: RetrievalResult | None = None,
+    session_id: str | None = None,
+) -> CachedAnswer | None:
+    """
+    Consulta o cache semântico de respostas finais (antes de guardrail e roteador)
+    Um acerto dispensa o guardrail: o cache só guarda respostas de entradas que ele aprovou
+
+    Args:
+        query: Texto da consulta
+        agent: Agente pedido ("auto" aceita a resposta de qualquer agente)
+        retrieval: Recuperação da requisição (sem ela, o cache não é consultado)
+        session_id: Sessão da requisição (respostas restritas a outras sessões não servem)
+    Returns:
+        CachedAnswer (resposta e agente que a gerou) ou None
+    """
+    if retrieval is None:
+        return None
+    try:
+        hit = lookup_answer(agent, query, query_vector(query), context_is_current, session_id)
+    except Exception:
+        logger.warning("Falha ao consultar o cache de respostas", exc_info=True)
+        return None
+    if hit is not None:
+        logger.info("Resposta do cache (agente=%s, similaridade=%.3f)", hit.agent, hit.similarity)
+    return hit
+
+
+def _store_cached_answer(
+    query: str, agent: str, retrieval: RetrievalResult | None, answer: str, session_id: str | None
+):
+    if retrieval is None:
+        return
+    try:
+        # Fingerprint do contexto que o agente usou (namespace próprio, se houver)
+        used = retrieval_for_agent(query, agent, retrieval) or retrieval
+        # Sem session_id a memória lida é a de uma sessão nova (vazia): a resposta vale para todos
+        session = (session_id or None) if agent in _SESSION_SCOPED_AGENTS else None
+        store_answer(agent, query, query_vector(query), used.fingerprint, answer, session)
+    except Exception:
+        logger.warning("Falha ao gravar no cache de respostas", exc_info=True)
+
+
+@dataclass
+class PipelineResult:
+    """Resultado de uma execução do pipeline, com os tempos dos estágios"""
+    answer: str
+    agent: str  # Agente que respondeu (o pedido, se a resposta veio antes do roteamento)
+    retrieval: RetrievalResult | None
+    trace: PipelineTrace
+    cached: bool = False  # Resposta do cache semântico
+    blocked: bool = False  # Entrada bloqueada pelo guardrail
+    timeouts: list[str] = field(default_factory=list)  # Estágios que estouraram o prazo (resposta degradada)
+
+
+def run_pipeline(
+    query: str,
+    session_id: str | None = None,
+    agent: str = "auto",
+    contexts: list | None = None,
+    retrieval: RetrievalResult | None = None,
+    cache_checked: bool = False,
+    deadline: Deadline | None = None,
+) -> str:
     """
     Pipeline principal com Guardrail global, roteamento por agente,
     geração via agente especializado e validação final (Judge).
+
+    A recuperação de contexto é feita uma vez ('retrieval', ou aqui mesmo se
+    não for informada) e compartilhada com roteador e agentes. Antes de tudo,
+    consulta o cache semântico de respostas; respostas que passaram por todas
+    as etapas são gravadas nele. Ver run_pipeline_detailed.
+
+    Args:
+        cache_checked: O chamador já consultou o cache para esta query (não consulta de novo)
+        deadline: Prazo da requisição (padrão: SINARA_REQUEST_DEADLINE)
+    """
+    return run_pipeline_detailed(
+        query, session_id, agent, contexts, retrieval, cache_checked, deadline=deadline
+    ).answer
+
+
+def _retrieve_and_lookup(
+    query: str,
+    session_id: str | None,
+    agent: str,
+    retrieval: RetrievalResult | None,
+    lookup: bool,
+    trace: PipelineTrace,
+) -> tuple[RetrievalResult | None, CachedAnswer | None]:
+    """Recuperação seguida da consulta ao cache de respostas (um acerto dispensa o roteador)"""
+    if retrieval is None:
+        retrieval = trace.run("retrieval", _retrieve_once, query, None)
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        # A requisição já seguiu sem esta recuperação: não consulta o cache nem cancela estágios
+        return retrieval, None
+    cached = lookup_cached_answer(query, agent, retrieval, session_id) if lookup else None
+    if cached is not None:
+        trace.cancel.set()
+    return retrieval, cached
+
+
+def _route_after_retrieval(
+    query: str, session_id: str | None, retrieval_f: Future, trace: PipelineTrace
+) -> tuple[str, str | None]:
+    # O roteador usa o score da recuperação (atalho para o FAQ): começa quando ela termina
+    retrieval, _ = retrieval_f.result()
+    deadline = current_deadline() or Deadline()
+    return _staged(
+        deadline.for_stage("router"), "router", trace.run, "router", run_router_agent, query, session_id,
+        retrieval=retrieval,
+    )
+
+
+def _start_front_stages(
+    query: str,
+    session_id: str | None,
+    agent: str,
+    retrieval: RetrievalResult | None,
+    lookup: bool,
+    trace: PipelineTrace,
+    guard_deadline: Deadline,
+    retrieval_deadline: Deadline,
+) -> tuple[Future, Future, Future | None]:
+    """
+    Dispara guardrail, recuperação (mais consulta ao cache) e roteador em paralelo,
+    cada um com o prazo do seu estágio
+
+    Returns:
+        Futures de (guardrail, (recuperação, resposta do cache), roteador);
+        roteador é None se o agente já foi escolhido
+    """
+    guard_f = _submit_stage(trace, guard_deadline, "guardrail", run_guardrail_agent, query, session_id or "")
+    retrieval_f = submit(
+        _staged, retrieval_deadline, "retrieval",
+        _retrieve_and_lookup, query, session_id, agent, retrieval, lookup, trace,
+    )
+    router_f = None
+    if agent == "auto":
+        router_f = submit(_route_after_retrieval, query, session_id, retrieval_f, trace)
+    return guard_f, retrieval_f, router_f
+
+
+# Prioridade de cada estágio na fila do limitador de taxa do Gemini: o que bloqueia a
+# resposta (guardrail, roteador, embedding da query) passa na frente; a chamada duplicada do hedging, por último
+_STAGE_PRIORITY = {
+    "guardrail": PRIORITY_HIGH,
+    "retrieval": PRIORITY_HIGH,
+    "router": PRIORITY_HIGH,
+    "agent": PRIORITY_NORMAL,
+    "judge": PRIORITY_NORMAL,
+    "agent_hedge": PRIORITY_LOW,
+}
+
+
+def _staged(deadline: Deadline, stage: str, fn: Callable, *args, **kwargs):
+    """Executa fn com o prazo e a prioridade de chamadas ao Gemini do estágio"""
+    with call_priority(_STAGE_PRIORITY.get(stage, PRIORITY_NORMAL)):
+        return run_within(deadline, fn, *args, **kwargs)
+
+
+def _submit_stage(trace: PipelineTrace, deadline: Deadline, name: str, fn: Callable, *args, **kwargs) -> Future:
+    """
+    Agenda fn como o estágio 'name', com 'deadline' ativo na thread (retentativas e timeouts de I/O)
+
+    Raises:
+        StageCancelled: a requisição já foi encerrada (ex.: o cliente do stream desconectou);
+            nada é agendado (agente, hedging e Judge passam por aqui)
+    """
+    if trace.cancel.is_set():
+        raise StageCancelled(name)
+    return submit(_staged, deadline, name, trace.run, name, fn, *args, **kwargs)
+
+
+def _guard_block(guard_f: Future, deadline: Deadline, timeouts: list[str]) -> str | None:
+    """
+    Mensagem de bloqueio do guardrail, ou None se a entrada passou (ou o guardrail
+    falhou ou estourou o prazo: mesma regra de pass-through do guardrail)
     """
     try:
-        # 1) Guardrail global 
-        try:
-            guard_is_valid, guard_output = run_guardrail_agent(query, session_id or "")
-            if not guard_is_valid:
-                return guard_output or "Desculpe, não posso atender a essa solicitação."
-        except Exception:
-            logger.exception("Guardrail falhou; seguindo com cautela")
+        guard_is_valid, guard_output = guard_f.result(timeout=deadline.remaining())
+    except StageTimeout:
+        logger.warning("Guardrail excedeu o prazo; seguindo com cautela")
+        timeouts.append("guardrail")
+        return None
+    except Exception:
+        logger.exception("Guardrail falhou; seguindo com cautela")
+        return None
+    if guard_is_valid:
+        return None
+    return guard_output or "Desculpe, não posso atender a essa solicitação."
 
-        # 2) Router (assistente | tecnico | organizacional | faq)
-        resolved_agent = agent or "auto"
-        reason = None
-        if resolved_agent == "auto":
-            try:
-                resolved_agent, reason = run_router_agent(query, session_id)
-            except Exception:
-                logger.exception("Router falhou; fallback para 'assistente'")
-                resolved_agent = "assistente"
 
-        # CLARIFY opcional (ativar com SINARA_CLARIFY=1): pergunta curta se rota parecer ambígua
-        try:
-            if os.getenv("SINARA_CLARIFY", "0").lower() in ("1", "true", "on"):
-                txt = (reason or "").lower()
-                parece_ambiguo = (not txt) or ("heur" in txt) or ("ambig" in txt)
-                if parece_ambiguo and resolved_agent in ("assistente", "tecnico", "organizacional"):
-                    return (
-                        "Para te ajudar melhor: sua dúvida é técnica (ETA), organizacional "
-                        "(gestão/processos) ou de uso do sistema (FAQ)? Responda com: "
-                        "'técnica', 'organizacional' ou 'sistema'."
-                    )
-        except Exception:
-            pass
+def _guard_passed(guard_f: Future) -> bool:
+    """O guardrail respondeu e aprovou a entrada (pass-through por falha ou prazo não conta)"""
+    if not guard_f.done() or guard_f.cancelled() or guard_f.exception() is not None:
+        return False
+    return bool(guard_f.result()[0])
+
+
+def _emit(events: Callable[[str, dict], None] | None, name: str, **data):
+    """Entrega um evento de etapa ao chamador (falhas do destino não afetam o pipeline)"""
+    if events is None:
+        return
+    try:
+        events(name, data)
+    except Exception:
+        logger.warning("Falha ao emitir o evento '%s'", name, exc_info=True)
+
 
-        # 3) Execução do agente especializado
-        rag_output = ""
-        rag_context = ""
+def _abandon(trace: PipelineTrace, *futures: Future | None):
+    """
+    Encerra estágios que não serão usados: os que não começaram são cancelados;
+    uma chamada de rede já em andamento termina na thread, sem ser aguardada
+    """
+    trace.cancel.set()
+    for future in futures:
+        if future is not None:
+            future.cancel()
+
+
+def run_pipeline_detailed(
+    query: str,
+    session_id: str | None = None,
+    agent: str = "auto",
+    contexts: list | None = None,
+    retrieval: RetrievalResult | None = None,
+    cache_checked: bool = False,
+    derive_contexts: bool = False,
+    trace: PipelineTrace | None = None,
+    events: Callable[[str, dict], None] | None = None,
+    deadline: Deadline | None = None,
+) -> PipelineResult:
+    """
+    Executa o pipeline com guardrail, recuperação e roteador em paralelo
+    (o roteador espera só a recuperação). Se o guardrail bloquear ou a resposta
+    vier do cache, os estágios pendentes são abandonados. O caminho crítico da
+    requisição é registrado no log (ver PipelineTrace).
+
+    Cada estágio tem um orçamento de tempo dentro do prazo da requisição (ver
+    utils.deadline); um estágio que estoura é abandonado e substituído pelo
+    fallback dele (guardrail: pass-through; recuperação: sem contexto; roteador:
+    assistente; agente: melhor trecho recuperado; Judge: rascunho sem validação).
+    Respostas degradadas assim não vão para o cache.
+
+    Args:
+        query: Pergunta do usuário
+        session_id: ID da sessão
+        agent: Agente pedido ("auto" usa o roteador)
+        contexts: Contextos globais para agentes sem namespace próprio
+        retrieval: Recuperação já feita (senão, é feita aqui, em paralelo)
+        cache_checked: O chamador já consultou o cache para esta query
+        derive_contexts: Sem 'contexts', usa os contextos da recuperação (como o endpoint /chat)
+        trace: Registro de tempos a preencher (padrão: um novo)
+        events: Recebe (evento, dados) de cada etapa: retrieved, cached, blocked, routed,
+            token/reset (tokens do agente), judged e correction (ver /chat/stream)
+        deadline: Prazo da requisição (padrão: SINARA_REQUEST_DEADLINE)
+    Returns:
+        PipelineResult com resposta, agente, recuperação e tempos
+    """
+    trace = trace or PipelineTrace()
+    agent = agent or "auto"
+    result = PipelineResult("", agent, retrieval, trace)
+    deadline = deadline or Deadline.for_request()
+    tokens = TokenStream(lambda name, data: _emit(events, name, **data)) if events is not None else None
+    with streaming_to(tokens), deadline_scope(deadline):
         try:
-            if resolved_agent == "tecnico":
-                rag_output, rag_context = run_rag_agent_tecnico(query, session_id or str(uuid.uuid4()))
-            elif resolved_agent == "organizacional":
-                rag_output, rag_context = run_rag_agent_organizacional(query, session_id or str(uuid.uuid4()), contexts)
-            elif resolved_agent == "assistente":
-                try:
-                    rag_output, rag_context = run_rag_agent_assistente(query, session_id or str(uuid.uuid4()), contexts)  # type: ignore
-                except TypeError:
-                    rag_output, rag_context = run_rag_agent_assistente(query, session_id or str(uuid.uuid4()))
-            elif resolved_agent == "faq":
-                rag_output, rag_context = run_faq_agent(query, contexts)
-            else:
-                rag_output, rag_context = run_faq_agent(query, contexts)
-        except Exception:
-            logger.exception("Falha ao executar agente '%s'", resolved_agent)
+            guard_deadline = deadline.for_stage("guardrail")
+            retrieval_deadline = deadline.for_stage("retrieval")
+            guard_f, retrieval_f, router_f = _start_front_stages(
+                query, session_id, agent, retrieval, not cache_checked, trace, guard_deadline, retrieval_deadline
+            )
+            # 1) Guardrail global: um bloqueio encerra a requisição assim que chega,
+            # sem esperar recuperação e roteador
+            wait([guard_f, retrieval_f], timeout=retrieval_deadline.remaining(), return_when=FIRST_COMPLETED)
+            if guard_f.done():
+                blocked = _guard_block(guard_f, guard_deadline, result.timeouts)
+                if blocked is not None:
+                    _abandon(trace, retrieval_f, router_f)
+                    _emit(events, "blocked", answer=blocked)
+                    result.answer, result.blocked = blocked, True
+                    return result
+
             try:
-                rag_output, rag_context = run_faq_agent(query, contexts)
-            except Exception:
-                return "Desculpe, não consegui processar sua pergunta agora."
+                retrieval, cached = retrieval_f.result(timeout=retrieval_deadline.remaining())
+            except StageTimeout:
+                # Sem contexto (e não None: os agentes não devem tentar buscar de novo)
+                logger.warning("Recuperação excedeu o prazo; seguindo sem contexto")
+                result.timeouts.append("retrieval")
+                retrieval, cached = RetrievalResult(query), None
+            result.retrieval = retrieval
+            _emit(
+                events,
+                "retrieved",
+                mode=getattr(retrieval, "mode", None),
+                namespace=getattr(retrieval, "namespace", None),
+                hits=len(retrieval.hits) if retrieval is not None else 0,
+            )
+            if cached is not None:
+                _abandon(trace, guard_f, router_f)
+                _emit(events, "cached", agent=cached.agent, similarity=round(cached.similarity, 4))
+                result.answer, result.agent, result.cached = cached.answer, cached.agent, True
+                return result
+            if derive_contexts and contexts is None and retrieval is not None:
+                contexts = retrieval.similar_context()
+
+            # Sem especulação, o veredicto do guardrail vem antes do roteamento e da geração
+            guard_checked = not SPECULATIVE_GENERATION or guard_f.done()
+            if guard_checked:
+                blocked = _guard_block(guard_f, guard_deadline, result.timeouts)
+                if blocked is not None:
+                    _abandon(trace, router_f)
+                    _emit(events, "blocked", answer=blocked)
+                    result.answer, result.blocked = blocked, True
+                    return result
+
+            # 2) Router (assistente | tecnico | organizacional | faq)
+            resolved_agent, reason = agent, None
+            if router_f is not None:
+                try:
+                    resolved_agent, reason = router_f.result(timeout=deadline.for_stage("router").remaining())
+                except StageTimeout:
+                    logger.warning("Router excedeu o prazo; fallback para 'assistente'")
+                    result.timeouts.append("router")
+                    router_f.cancel()
+                    resolved_agent = "assistente"
+                except Exception:
+                    logger.exception("Router falhou; fallback para 'assistente'")
+                    resolved_agent = "assistente"
+            result.agent = resolved_agent
+            _emit(events, "routed", agent=resolved_agent, reason=reason)
+            clarify = _clarify_prompt(resolved_agent, reason)
+
+            # Geração especulativa: o agente começa já com a rota definida, em paralelo ao
+            # guardrail; se ele bloquear, o rascunho é descartado (nada vai para memória ou cache,
+            # e os tokens ficam retidos até o veredicto)
+            generation = None
+            if not guard_checked:
+                if clarify is None:
+                    if tokens is not None:
+                        tokens.hold()
+                    generation = _submit_stage(
+                        trace, deadline.for_stage("agent"), "agent",
+                        _run_agent, query, session_id, resolved_agent, contexts, retrieval,
+                    )
+                blocked = _guard_block(guard_f, guard_deadline, result.timeouts)
+                if blocked is not None:
+                    _abandon(trace, generation)
+                    if generation is not None:
+                        logger.info("Guardrail bloqueou; rascunho especulativo descartado")
+                    if tokens is not None:
+                        tokens.discard()
+                    _emit(events, "blocked", answer=blocked)
+                    result.answer, result.blocked = blocked, True
+                    return result
+                if tokens is not None:
+                    tokens.release()
+
+            if clarify is not None:
+                result.answer = clarify
+                return result
+
+            final, answered_by = _execute_pipeline(
+                query, session_id, resolved_agent, contexts, retrieval, trace, generation, events, result.timeouts
+            )
+            # Só entra no cache o que o guardrail aprovou: um acerto dispensa o guardrail
+            if answered_by and not result.timeouts and _guard_passed(guard_f):
+                _store_cached_answer(query, answered_by, retrieval, final, session_id)
+            result.answer = final
+            return result
+
+        except StageCancelled as e:
+            # Encerrada por quem a pediu: nada novo foi disparado e a resposta não é entregue
+            logger.info("Requisição encerrada antes do estágio '%s'; pipeline interrompido", e)
+            return result
+        except Exception as e:
+            logger.exception("Erro no pipeline")
+            result.answer = f"Erro ao processar: {str(e)}"
+            return result
+        finally:
+            trace.log()
+
+
+def _clarify_prompt(resolved_agent: str, reason: str | None) -> str | None:
+    """CLARIFY opcional (ativar com SINARA_CLARIFY=1): pergunta curta se a rota parecer ambígua"""
+    try:
+        if os.getenv("SINARA_CLARIFY", "0").lower() in ("1", "true", "on"):
+            txt = (reason or "").lower()
+            parece_ambiguo = (not txt) or ("heur" in txt) or ("ambig" in txt)
+            if parece_ambiguo and resolved_agent in ("assistente", "tecnico", "organizacional"):
+                return (
+                    "Para te ajudar melhor: sua dúvida é técnica (ETA), organizacional "
+                    "(gestão/processos) ou de uso do sistema (FAQ)? Responda com: "
+                    "'técnica', 'organizacional' ou 'sistema'."
+                )
+    except Exception:
+        pass
+    return None
 
-        # 4) Validação final com Judge
-        try:
-            judge_is_valid, judge_output = run_judge_agent(
-                query, str(rag_output), str(rag_context or ""), session_id or "", resolved_agent
+
+def _run_agent(
+    query: str,
+    session_id: str | None,
+    resolved_agent: str,
+    contexts: list | None,
+    retrieval: RetrievalResult | None,
+) -> tuple[str, str, bool] | None:
+    """
+    Execução do agente especializado, com fallback para o FAQ
+    Só lê a memória da sessão (não grava), então pode rodar antes do veredicto do guardrail
+
+    Returns:
+        (saída, contexto, True se foi o próprio agente), ou None se o fallback também falhou
+    """
+    try:
+        if resolved_agent == "tecnico":
+            rag_output, rag_context = run_rag_agent_tecnico(
+                query, session_id or str(uuid.uuid4()), retrieval=retrieval
+            )
+        elif resolved_agent == "organizacional":
+            rag_output, rag_context = run_rag_agent_organizacional(
+                query,
+                session_id or str(uuid.uuid4()),
+                _agent_contexts(resolved_agent, contexts),
+                retrieval=retrieval,
             )
+        elif resolved_agent == "assistente":
+            rag_output, rag_context = run_rag_agent_assistente(
+                query, session_id or str(uuid.uuid4()), retrieval=retrieval
+            )
+        elif resolved_agent == "faq":
+            rag_output, rag_context = run_faq_agent(query, _agent_contexts("faq", contexts), retrieval=retrieval)
+        else:
+            rag_output, rag_context = run_faq_agent(query, _agent_contexts("faq", contexts), retrieval=retrieval)
+    except Exception:
+        logger.exception("Falha ao executar agente '%s'", resolved_agent)
+        reset_stream()  # Tokens parciais do agente que falhou
+        try:
+            rag_output, rag_context = run_faq_agent(query, _agent_contexts("faq", contexts), retrieval=retrieval)
         except Exception:
-            logger.exception("Judge falhou; retornando saída do RAG")
-            judge_is_valid, judge_output = True, None
+            return None
+        return rag_output, rag_context, False
+    return rag_output, rag_context, True
+
+
+def _judge(
+    query: str,
+    rag_output: str,
+    rag_context: str,
+    session_id: str,
+    agent: str,
+    retrieval: RetrievalResult | None,
+) -> tuple[bool, str | None, str]:
+    """
+    Judge com a política de dispensa (ver services.judge_policy)
 
-        final = str(rag_output) if judge_is_valid or not judge_output else str(judge_output)
-        return final
+    Returns:
+        (válida, resposta corrigida, motivo da política)
+    """
+    decision = decide_judge(rag_output, rag_context, agent, retrieval)
+    if not decision.run_llm:
+        return True, None, decision.reason
+    judge_is_valid, judge_output = run_judge_agent(query, rag_output, rag_context, session_id, agent)
+    return judge_is_valid, judge_output, decision.reason
+
+
+# Marca de geração abandonada por prazo (None já significa "agente e fallback falharam")
+_TIMED_OUT = object()
+
+
+def _deadline_answer(retrieval: RetrievalResult | None) -> str:
+    """Melhor resposta disponível sem o agente: o trecho mais relevante recuperado (como o fallback dos agentes)"""
+    if retrieval is not None and retrieval.hits:
+        return str(retrieval.hits[0].text).strip()[:1200]
+    return _TIMEOUT_ANSWER
+
+
+def _unstreamed(fn: Callable, *args):
+    # Chamada duplicada do hedging: não emite tokens (só a vencedora é repassada ao cliente)
+    with streaming_to(None):
+        return fn(*args)
 
-    except Exception as e:
-        logger.exception("Erro no pipeline")
-        return f"Erro ao processar: {str(e)}"
+
+def _hedge_delay() -> float | None:
+    """Segundos até disparar a chamada duplicada (percentil da latência do agente), ou None"""
+    if not HEDGE_GENERATION:
+        return None
+    ms = stage_latency("agent").percentile(HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+    return ms / 1000 if ms is not None else None
+
+
+def _await_generation(
+    generation: Future,
+    deadline: Deadline,
+    trace: PipelineTrace,
+    query: str,
+    session_id: str | None,
+    resolved_agent: str,
+    contexts: list | None,
+    retrieval: RetrievalResult | None,
+):
+    """
+    Espera a geração dentro do prazo do estágio, com hedging opcional: passado o
+    percentil de latência, dispara uma geração duplicada e usa a primeira que terminar
+
+    Returns:
+        Resultado de _run_agent, ou _TIMED_OUT se o prazo acabou
+    """
+    delay = _hedge_delay()
+    remaining = deadline.remaining()
+    if delay is not None and (remaining is None or delay < remaining):
+        done, _ = wait([generation], timeout=delay)
+        if not done:
+            logger.info("Geração passou do p%.0f (%.0f ms); disparando chamada duplicada", HEDGE_PERCENTILE, delay * 1000)
+            backup = _submit_stage(
+                trace, deadline, "agent_hedge",
+                _unstreamed, _run_agent, query, session_id, resolved_agent, contexts, retrieval,
+            )
+            done, _ = wait([generation, backup], timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                generation.cancel()
+                backup.cancel()
+                return _TIMED_OUT
+            winner = generation if generation in done else backup
+            (backup if winner is generation else generation).cancel()
+            generated = winner.result()
+            if winner is backup:
+                logger.info("Chamada duplicada terminou primeiro")
+                stream = current_stream()
+                if stream is not None and generated is not None and generated[0]:
+                    stream.replace(str(generated[0]))
+            return generated
+    try:
+        return generation.result(timeout=deadline.remaining())
+    except StageTimeout:
+        generation.cancel()
+        return _TIMED_OUT
+
+
+def _execute_pipeline(
+    query: str,
+    session_id: str | None,
+    resolved_agent: str,
+    contexts: list | None,
+    retrieval: RetrievalResult | None,
+    trace: PipelineTrace,
+    generation: Future | None = None,
+    events: Callable[[str, dict], None] | None = None,
+    timeouts: list[str] | None = None,
+) -> tuple[str, str | None]:
+    """
+    Etapas do pipeline depois do guardrail e do roteador (agente e Judge)
+
+    Args:
+        generation: Geração já disparada em paralelo ao guardrail (modo especulativo)
+        events: Destino dos eventos judged/correction (ver run_pipeline_detailed)
+        timeouts: Recebe os estágios que estouraram o prazo
+    Returns:
+        (resposta, agente que a gerou); o agente é None quando a resposta não
+        deve ir para o cache (fallback após falha do agente)
+    """
+    deadline = current_deadline() or Deadline()
+    timeouts = timeouts if timeouts is not None else []
+    stream = current_stream()
+
+    # 3) Execução do agente especializado (no pool: a espera respeita o prazo do estágio)
+    agent_deadline = deadline.for_stage("agent")
+    if generation is None and deadline.expired():
+        generated = None
+    else:
+        if generation is None:
+            generation = _submit_stage(
+                trace, agent_deadline, "agent", _run_agent, query, session_id, resolved_agent, contexts, retrieval
+            )
+        generated = _await_generation(
+            generation, agent_deadline, trace, query, session_id, resolved_agent, contexts, retrieval
+        )
+    if generated is _TIMED_OUT or (generated is None and deadline.expired()):
+        timeouts.append("agent")
+        logger.warning("Agente '%s' excedeu o prazo; respondendo com o melhor trecho recuperado", resolved_agent)
+        answer = _deadline_answer(retrieval)
+        if stream is not None:
+            stream.replace(answer)
+        return answer, None
+    if generated is None:
+        return "Desculpe, não consegui processar sua pergunta agora.", None
+    rag_output, rag_context, agent_ok = generated
+    answered_by = resolved_agent if agent_ok else None
+    if stream is not None and not stream.streamed and rag_output:
+        # Resposta sem geração token a token (resposta direta do contexto, fallback): um único trecho
+        stream.token(str(rag_output))
+
+    # 4) Validação final: política local decide se o LLM juiz é necessário
+    policy = None
+    judge_deadline = deadline.for_stage("judge")
+    judge_f = _submit_stage(
+        trace, judge_deadline, "judge",
+        _judge, query, str(rag_output), str(rag_context or ""), session_id or "", resolved_agent, retrieval,
+    )
+    try:
+        judge_is_valid, judge_output, policy = judge_f.result(timeout=judge_deadline.remaining())
+    except StageTimeout:
+        logger.warning("Judge excedeu o prazo; resposta entregue sem validação")
+        judge_f.cancel()
+        timeouts.append("judge")
+        judge_is_valid, judge_output, policy = True, None, "timeout"
+        answered_by = None
+    except Exception:
+        logger.exception("Judge falhou; retornando saída do RAG")
+        judge_is_valid, judge_output = True, None
+        answered_by = None  # Resposta não validada: fora do cache
+
+    final = str(rag_output) if judge_is_valid or not judge_output else str(judge_output)
+    _emit(events, "judged", valid=bool(judge_is_valid), policy=policy)
+    if final != str(rag_output):
+        _emit(events, "correction", answer=final)
+    return final, answered_by
 
 
  
 
-def run_assistente_agent(query: str, session_id: str | None = None, agent: str = "assistente", contexts: list | None = None) -> str:
+def run_assistente_agent(
+    query: str,
+    session_id: str | None = None,
+    agent: str = "assistente",
+    contexts: list | None = None,
+    retrieval: RetrievalResult | None = None,
+) -> str:
     """
     Executa o agente "assistente".
     Aceita contextos opcionais para permitir o roteamento ao RAG organizacional quando apropriado.
     """
     if session_id is None:
         session_id = str(uuid.uuid4())
+    retrieval = _retrieve_once(query, retrieval)
 
     # Roteamento automático se solicitado (mantém compatibilidade)
     resolved_agent = agent
     if agent == "auto":
         try:
-            resolved_agent, _ = run_router_agent(query, session_id)
+            resolved_agent, _ = run_router_agent(query, session_id, retrieval=retrieval)
         except Exception:
             resolved_agent = "assistente"
 
     # Se o roteador retornar "assistente" mas os contextos indicarem conteúdo organizacional, roteia para "organizacional"
     if resolved_agent == "assistente" and _contexts_match_query(contexts, query):
         logger.info("Assistente flow: CONTEXT indica que deve ser ORGANIZACIONAL")
-        rag_output, rag_context = run_rag_agent_organizacional(query, session_id, contexts)
+        rag_output, rag_context = run_rag_agent_organizacional(
+            query, session_id, _agent_contexts("organizacional", contexts), retrieval=retrieval
+        )
     else:
         # Inicializa memória conforme o agente resolvido
         if resolved_agent == "assistente":
@@ -218,23 +819,19 @@ def run_assistente_agent(query: str, session_id: str | None = None, agent: str =
 
         # Etapa 2 - Geração de resposta com RAG específico do agente
         if resolved_agent == "assistente":
-            # Passa contextos se o RAG do assistente suportar
-            try:
-                rag_output, rag_context = run_rag_agent_assistente(query, session_id, contexts)  # prefer contextual call
-            except TypeError:
-                rag_output, rag_context = run_rag_agent_assistente(query, session_id)
+            rag_output, rag_context = run_rag_agent_assistente(query, session_id, retrieval=retrieval)
         elif resolved_agent == "tecnico":
-            rag_output, rag_context = run_rag_agent_tecnico(query, session_id)
+            rag_output, rag_context = run_rag_agent_tecnico(query, session_id, retrieval=retrieval)
         elif resolved_agent == "faq":
-            rag_output, rag_context = run_faq_agent(query)
+            rag_output, rag_context = run_faq_agent(query, retrieval=retrieval)
         else:
             # Agente inesperado: fallback para FAQ
-            rag_output, rag_context = run_faq_agent(query)
+            rag_output, rag_context = run_faq_agent(query, retrieval=retrieval)
 
-    # Etapa 3 - Validação da resposta com o juiz
+    # Etapa 3 - Validação da resposta com o juiz (dispensado quando a política local permite)
     try:
-        judge_is_valid, judge_output = run_judge_agent(
-            query, rag_output, rag_context, session_id, resolved_agent
+        judge_is_valid, judge_output, _ = _judge(
+            query, rag_output, rag_context, session_id, resolved_agent, retrieval
         )
     except Exception:
         logger.exception("Judge agent failed; returning RAG output")
@@ -0,0 +1,190 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable
+
+"""
+Execução concorrente dos estágios do pipeline
+Guardrail, recuperação e roteador rodam em um pool de threads compartilhado
+(as chamadas são de rede e liberam o GIL). PipelineTrace registra início e
+duração de cada estágio e calcula o caminho crítico da requisição.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Threads do pool de estágios (cada requisição ocupa até 3 ao mesmo tempo)
+STAGE_WORKERS = max(2, int(os.getenv("SINARA_STAGE_WORKERS", "16")))
+# Durações recentes guardadas por estágio (percentis para o hedging da geração)
+LATENCY_WINDOW = max(10, int(os.getenv("SINARA_LATENCY_WINDOW", "200")))
+
+_executor_lock = threading.Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="sinara-stage")
+    return _executor
+
+
+def submit(fn: Callable, *args, **kwargs) -> Future:
+    """Agenda fn(*args, **kwargs) no pool de estágios, no contexto (contextvars) de quem agendou"""
+    ctx = contextvars.copy_context()
+    return _get_executor().submit(ctx.run, fn, *args, **kwargs)
+
+
+def shutdown_stage_executor():
+    """Encerra o pool (shutdown da aplicação); estágios pendentes são cancelados"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class LatencyWindow:
+    """Últimas durações (ms) de um estágio concluído com sucesso"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, ms: float):
+        with self._lock:
+            self._samples.append(ms)
+
+    def percentile(self, p: float, min_samples: int = 1) -> float | None:
+        """Percentil p (0-100) das durações, ou None com menos de min_samples amostras"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        idx = min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))
+        return samples[idx]
+
+
+_latencies: dict[str, LatencyWindow] = {}
+
+
+def stage_latency(name: str) -> LatencyWindow:
+    """Janela de durações do estágio 'name' (compartilhada pelo processo)"""
+    window = _latencies.get(name)
+    if window is None:
+        with _executor_lock:
+            window = _latencies.setdefault(name, LatencyWindow())
+    return window
+
+
+class StageCancelled(Exception):
+    """O estágio foi dispensado antes de começar (ex.: guardrail bloqueou a entrada)"""
+
+
+@dataclass
+class StageTiming:
+    start_ms: float  # Início, relativo ao início da requisição
+    ms: float = 0.0
+    status: str = "running"  # running | ok | error | cancelled
+
+    @property
+    def end_ms(self) -> float:
+        return self.start_ms + self.ms
+
+
+class PipelineTrace:
+    """
+    Tempos dos estágios de uma requisição
+    O caminho crítico é a cadeia de estágios, do último a terminar para trás,
+    em que cada um começou depois do término do anterior: é o que define a
+    latência quando os demais estágios rodam em paralelo
+    """
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: dict[str, StageTiming] = {}
+        self.cancel = threading.Event()  # Sinaliza aos estágios pendentes que não devem começar
+
+    def _now_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    @contextmanager
+    def stage(self, name: str):
+        """Mede o bloco como o estágio 'name'"""
+        timing = StageTiming(self._now_ms())
+        with self._lock:
+            self.stages[name] = timing
+        try:
+            yield timing
+        except StageCancelled:
+            timing.status = "cancelled"
+            raise
+        except BaseException:
+            timing.status = "error"
+            raise
+        else:
+            timing.status = "ok"
+        finally:
+            timing.ms = self._now_ms() - timing.start_ms
+            if timing.status == "ok":
+                stage_latency(name).add(timing.ms)
+
+    def run(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        """Executa fn como o estágio 'name' (StageCancelled se a requisição já foi encerrada)"""
+        if self.cancel.is_set():
+            with self._lock:
+                self.stages[name] = StageTiming(self._now_ms(), 0.0, "cancelled")
+            raise StageCancelled(name)
+        with self.stage(name):
+            return fn(*args, **kwargs)
+
+    def critical_path(self) -> tuple[list[str], float]:
+        """Estágios do caminho crítico (em ordem) e a soma de suas durações em ms"""
+        with self._lock:
+            done = {n: t for n, t in self.stages.items() if t.status in ("ok", "error")}
+        if not done:
+            return [], 0.0
+        path = []
+        name = max(done, key=lambda n: done[n].end_ms)
+        while name is not None:
+            path.append(name)
+            start = done[name].start_ms
+            before = [n for n in done if n not in path and done[n].end_ms <= start + 0.5]
+            name = max(before, key=lambda n: done[n].end_ms) if before else None
+        path.reverse()
+        return path, sum(done[n].ms for n in path)
+
+    def summary(self) -> dict:
+        """Tempo total, caminho crítico e tempos por estágio (ms)"""
+        path, path_ms = self.critical_path()
+        with self._lock:
+            stages = {
+                n: {"start_ms": round(t.start_ms, 1), "ms": round(t.ms, 1), "status": t.status}
+                for n, t in self.stages.items()
+            }
+        return {
+            "total_ms": round(self._now_ms(), 1),
+            "critical_path": path,
+            "critical_path_ms": round(path_ms, 1),
+            "stages": stages,
+        }
+
+    def log(self, label: str = "Pipeline"):
+        s = self.summary()
+        logger.info(
+            "%s: total %.1f ms; caminho crítico %.1f ms (%s); estágios: %s",
+            label,
+            s["total_ms"],
+            s["critical_path_ms"],
+            " -> ".join(s["critical_path"]) or "-",
+            ", ".join(f"{n}={v['ms']:.0f}ms/{v['status']}" for n, v in s["stages"].items()),
+        )
+        return s
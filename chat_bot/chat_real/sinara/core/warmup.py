@@ -0,0 +1,169 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+"""
+Warm-up da aplicação
+Executa no startup (lifespan) o trabalho que antes ficava para a primeira
+requisição: índices do RAG, embeddings do corpus, prompts, clientes de modelo
+e conexão com o MongoDB. Enquanto não termina, /ready responde 503.
+"""
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEPS = "indexes,embeddings,prompts,models,mongo"
+
+# Módulos com prompts compilados na importação
+_AGENT_MODULES = [
+    "guardrail_agent",
+    "router_agent",
+    "rag_agent_tecnico",
+    "rag_agent_assistente",
+    "rag_agent_organizacional",
+    "faq_agent",
+    "judge_agent",
+]
+
+# Cliente de cada agente: (módulo, variável do modelo, modelo padrão, temperatura, schema de saída).
+# Mesma resolução de modelo dos agentes (variável, GEMINI_CHAT_MODEL, padrão do agente) e mesma
+# chave do cache do llm_factory: com schema, o runnable estruturado é o que o agente usa
+_AGENT_MODELS = [
+    ("guardrail_agent", "GEMINI_MODEL_GUARDRAIL", "gemini-1.5-flash-latest", None, "GuardrailOutput"),
+    ("router_agent", "GEMINI_MODEL_ROUTER", "gemini-1.5-flash-latest", None, "RouterDecision"),
+    ("judge_agent", "GEMINI_MODEL_JUDGE", "gemini-1.0-pro", None, "JudgeOutput"),
+    ("rag_agent_assistente", "GEMINI_MODEL_ASSISTENTE", "gemini-pro", 0.3, None),
+    ("rag_agent_tecnico", "GEMINI_MODEL_TECNICO", "gemini-pro", 0.3, None),
+    ("rag_agent_organizacional", "GEMINI_MODEL_ORG", "gemini-pro", 0.2, None),
+    ("faq_agent", "GEMINI_MODEL_FAQ", "gemini-1.5-flash-latest", 0.1, None),
+]
+
+_state_lock = threading.Lock()
+_state: dict = {"ready": False, "running": False, "started_at": None, "finished_at": None, "steps": {}}
+
+
+def _step_indexes():
+    from ..services.rag_service import warm_up_indexes
+    return warm_up_indexes()
+
+
+def _step_embeddings():
+    from ..services.rag_service import warm_up_embeddings
+    return warm_up_embeddings()
+
+
+def _step_prompts():
+    package = __name__.rsplit(".", 2)[0]
+    for name in _AGENT_MODULES:
+        importlib.import_module(f"{package}.agents.{name}")
+    from ..services.prompt_registry import registered_prompts
+    return registered_prompts()
+
+
+def _step_models():
+    from ..services.llm_factory import get_chat_model
+
+    if not (os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")):
+        raise RuntimeError("API key ausente")
+    package = __name__.rsplit(".", 2)[0]
+    warmed = []
+    for module, var, default, temperature, schema_name in _AGENT_MODELS:
+        name = os.getenv(var) or os.getenv("GEMINI_CHAT_MODEL") or default
+        schema = None
+        if schema_name:
+            schema = getattr(importlib.import_module(f"{package}.agents.{module}"), schema_name)
+        label = f"{name}@{temperature}" + (f"/{schema_name}" if schema_name else "")
+        try:
+            get_chat_model(name, temperature=temperature, schema=schema)
+        except Exception:
+            # Um cliente que falha não impede o aquecimento dos demais
+            logger.warning("Warm-up do cliente %s falhou", label, exc_info=True)
+            continue
+        warmed.append(label)
+    return sorted(set(warmed))
+
+
+def _step_mongo():
+    from ..services.mongo_client import ensure_session_index, ping_mongo
+
+    ping_mongo()
+    db = os.getenv("MONGO_DB", "DB_Sinara")
+    for collection in ("chat_history", "conversation_assistente"):
+        ensure_session_index(db, collection)
+
+
+STEPS: Dict[str, Callable] = {
+    "indexes": _step_indexes,
+    "embeddings": _step_embeddings,
+    "prompts": _step_prompts,
+    "models": _step_models,
+    "mongo": _step_mongo,
+}
+
+
+def configured_steps() -> List[str]:
+    """Passos de SINARA_WARMUP_STEPS (lista separada por vírgula; "none" desativa)"""
+    raw = os.getenv("SINARA_WARMUP_STEPS", DEFAULT_STEPS).strip().lower()
+    if raw in ("", "none", "0", "off"):
+        return []
+    steps = []
+    for name in (s.strip() for s in raw.split(",")):
+        if name in STEPS and name not in steps:
+            steps.append(name)
+        elif name:
+            logger.warning("Passo de warm-up desconhecido ignorado: %s", name)
+    return steps
+
+
+def run_warmup(steps: List[str] | None = None) -> dict:
+    """
+    Executa os passos de warm-up em ordem, registrando o tempo de cada um
+    Falhas são registradas e não interrompem os passos seguintes: o caminho
+    preguiçoso das requisições continua cobrindo o que não foi aquecido
+
+    Args:
+        steps: Passos a executar (padrão: SINARA_WARMUP_STEPS)
+    Returns:
+        Estado final (ver warmup_status)
+    """
+    steps = configured_steps() if steps is None else steps
+    with _state_lock:
+        _state.update(ready=False, running=True, started_at=time.time(), finished_at=None, steps={})
+    total = time.perf_counter()
+    for name in steps:
+        t0 = time.perf_counter()
+        try:
+            detail = STEPS[name]()
+            ok, error = True, None
+        except Exception as e:
+            detail, ok, error = None, False, f"{type(e).__name__}: {e}"[:300]
+            logger.warning("Warm-up '%s' falhou: %s", name, error)
+        ms = (time.perf_counter() - t0) * 1000
+        logger.info("Warm-up '%s': %.1f ms%s", name, ms, "" if ok else " (falhou)")
+        with _state_lock:
+            _state["steps"][name] = {"ok": ok, "ms": round(ms, 1), "detail": detail, "error": error}
+    logger.info("Warm-up concluído em %.1f ms (%d passos)", (time.perf_counter() - total) * 1000, len(steps))
+    with _state_lock:
+        _state.update(ready=True, running=False, finished_at=time.time())
+    return warmup_status()
+
+
+def start_warmup_thread(steps: List[str] | None = None) -> threading.Thread:
+    """Executa o warm-up em uma thread de fundo (o servidor já aceita /health)"""
+    with _state_lock:
+        _state.update(ready=False, running=True)
+    thread = threading.Thread(target=run_warmup, args=(steps,), name="sinara-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready() -> bool:
+    return bool(_state["ready"])
+
+
+def warmup_status() -> dict:
+    """Cópia do estado do warm-up (pronto, tempos e erros por passo)"""
+    with _state_lock:
+        return {**_state, "steps": {k: dict(v) for k, v in _state["steps"].items()}}
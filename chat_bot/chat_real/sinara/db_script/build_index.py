@@ -0,0 +1,44 @@
+import argparse
+import logging
+
+from dotenv import load_dotenv
+
+from ..services import rag_service
+
+"""
+Gera os snapshots pré-compilados dos índices de recuperação
+(chunks, mapeamento de documentos, postings BM25, IDF e matriz de vetores).
+Os workers carregam esses snapshots via mmap na carga a frio, em vez de
+processar o contexto.json e reconstruir os índices.
+
+Uso (a partir de chat_bot/):
+    python -m chat_real.sinara.db_script.build_index
+    python -m chat_real.sinara.db_script.build_index --namespace tecnico --no-vectors
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera snapshots dos índices de recuperação")
+    parser.add_argument(
+        "--namespace",
+        action="append",
+        help="Namespace a gerar (repetível; 'global' = corpus completo). Padrão: global e todos os configurados",
+    )
+    parser.add_argument("--no-vectors", action="store_true", help="Não incluir a matriz de vetores")
+    parser.add_argument("--no-hybrid", action="store_true", help="Não incluir o BM25 por chunk")
+    args = parser.parse_args()
+
+    load_dotenv(override=True)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    namespaces = args.namespace or ["global", *rag_service.RAG_NAMESPACES]
+    for name in namespaces:
+        namespace = "" if name == "global" else name
+        out = rag_service.build_index_snapshot(
+            namespace, embed=not args.no_vectors, hybrid=not args.no_hybrid
+        )
+        print(f"Snapshot '{name}' gravado em {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,32 @@
-﻿import os
+﻿"""
+Sincroniza o contexto.json com a coleção 'contexto' do MongoDB
+Cada documento é gravado com os embeddings dos seus chunks (mesmo chunking do
+índice de recuperação), content_hash e updated_at; documentos inalterados não
+são regravados, então o serviço (SINARA_CORPUS_SOURCE=mongo) só relê o que mudou.
+
+Uso (a partir de chat_bot/):
+    python -m chat_real.sinara.db_script.dataload
+ou, como antes, a partir desta pasta:
+    python dataload.py
+
+Documentos duplicados no JSON (mesmo content_hash) são gravados uma vez só,
+na posição da primeira ocorrência, com um aviso.
+"""
+
+import os
+import sys
 import json
-from pymongo import MongoClient
+from datetime import datetime, timezone
+from pathlib import Path
+from pymongo import MongoClient, ReplaceOne, UpdateOne
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+if __package__ in (None, ""):
+    # Execução direta (python dataload.py): importa o pacote a partir de chat_bot/
+    sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+    from chat_real.sinara.services.rag_service import EMBEDDING_MODEL, corpus_document_chunks, embed_corpus_texts
+else:
+    from ..services.rag_service import EMBEDDING_MODEL, corpus_document_chunks, embed_corpus_texts
 
 
 def main():
@@ -29,35 +53,69 @@ def main():
     if not isinstance(contexto_docs, list):
         raise ValueError("contexto.json deve conter uma lista de documentos")
 
-    # Gera embeddings para registros que não possuem 'embedding'
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise RuntimeError("Defina GEMINI_API_KEY (ou GOOGLE_API_KEY) no .env/ambiente.")
+    # Estado atual da coleção (sem os vetores)
+    existing = {
+        d["content_hash"]: d
+        for d in collection.find(
+            {"content_hash": {"$exists": True}},
+            {"content_hash": 1, "position": 1, "embedding_model": 1, "chunk_hashes": 1},
+        )
+    }
 
-    emb = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004",
-        google_api_key=api_key,
-        transport="rest",
-    )
+    prepared = []
+    pending = []  # Documentos novos/alterados (precisam dos embeddings)
+    first_pos: dict[str, int] = {}  # content_hash -> posição da primeira ocorrência
+    for pos, doc in enumerate(contexto_docs):
+        if not isinstance(doc, dict):
+            continue
+        content_hash, chunks, chunk_hashes = corpus_document_chunks(doc)
+        if content_hash in first_pos:
+            # A coleção é indexada por content_hash: a cópia sobrescreveria o original (e a posição dele)
+            print(f"Aviso: documento {pos} duplica o documento {first_pos[content_hash]} do contexto.json; ignorado.")
+            continue
+        first_pos[content_hash] = pos
+        old = existing.get(content_hash)
+        fresh = old is None or old.get("embedding_model") != EMBEDDING_MODEL or old.get("chunk_hashes") != chunk_hashes
+        prepared.append((pos, doc, content_hash, chunk_hashes, fresh))
+        if fresh:
+            pending.append(chunks)
+
+    # Embeddings apenas dos chunks novos (cache em disco + API em lotes)
+    texts = [c for chunks in pending for c in chunks]
+    vecs = embed_corpus_texts(texts) if texts else None
 
-    enriched = []
-    for doc in contexto_docs:
-        content = doc.get("content") or doc.get("conteudo")
-        if content and not doc.get("embedding"):
-            try:
-                vec = emb.embed_query(content)
-                doc["embedding"] = vec
-            except Exception as e:
-                print(f"Falha ao gerar embedding para título '{doc.get('title') or ''}': {e}")
-        enriched.append(doc)
-
-    # Substitui a coleção
-    collection.delete_many({})
-    if enriched:
-        collection.insert_many(enriched)
+    now = datetime.now(timezone.utc)
+    ops = []
+    row = 0
+    for pos, doc, content_hash, chunk_hashes, fresh in prepared:
+        if not fresh:
+            if existing[content_hash].get("position") != pos:
+                ops.append(UpdateOne({"content_hash": content_hash}, {"$set": {"position": pos, "updated_at": now}}))
+            continue
+        record = {k: v for k, v in doc.items() if k not in ("_id", "embedding")}
+        record.update(
+            position=pos,
+            content_hash=content_hash,
+            chunk_hashes=chunk_hashes,
+            chunk_embeddings=[vecs[row + i].tolist() for i in range(len(chunk_hashes))],
+            embedding_model=EMBEDDING_MODEL,
+            updated_at=now,
+        )
+        row += len(chunk_hashes)
+        ops.append(ReplaceOne({"content_hash": content_hash}, record, upsert=True))
+
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    # Remove documentos que saíram do JSON (e os gravados sem content_hash pela versão anterior)
+    removed = collection.delete_many({"content_hash": {"$nin": [p[2] for p in prepared]}}).deleted_count
+    collection.create_index("content_hash")
+    collection.create_index("updated_at")
     client.close()
 
-    print(f"{len(enriched)} documentos inseridos na coleção 'contexto'.")
+    print(
+        f"{len(pending)} documentos novos/alterados, {len(prepared) - len(pending)} inalterados "
+        f"e {removed} removidos na coleção 'contexto'."
+    )
 
 
 if __name__ == "__main__":
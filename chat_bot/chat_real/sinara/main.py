@@ -1,19 +1,47 @@
+import asyncio
 import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from .config.settings import Settings
 from .utils.logging_config import setup_logging
 from .api.routes.chat import router as chat_router
+from .core.stages import shutdown_stage_executor
+from .core.warmup import run_warmup, start_warmup_thread, warmup_status
+from .services.rag_service import start_index_watcher, stop_index_watcher
+from .services.prompt_registry import stop_prompt_watcher
 
 # Configuração inicial
 settings = Settings()  # cria instância de configurações
 setup_logging()
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Warm-up no startup (SINARA_WARMUP_STEPS); por padrão em segundo plano,
+    com /ready em 503 até terminar. SINARA_WARMUP_BLOCKING=1 só libera o
+    servidor depois do warm-up.
+    """
+    if os.getenv("SINARA_WARMUP_BLOCKING", "0").lower() in ("1", "true", "on"):
+        await asyncio.to_thread(run_warmup)
+    else:
+        start_warmup_thread()
+    start_index_watcher()
+    yield
+    stop_index_watcher()
+    stop_prompt_watcher()
+    shutdown_stage_executor()
+
+
 app = FastAPI(
     title=settings.API_TITLE,
     description=settings.API_DESCRIPTION,
-    version=settings.API_VERSION
+    version=settings.API_VERSION,
+    lifespan=lifespan,
 )
 
 # Configuração CORS
@@ -33,3 +61,13 @@ app.include_router(chat_router, prefix="/api")
 async def health_check():
     """Verifica status da API"""
     return {"status": "healthy"}
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Prontidão para tráfego: 503 até o warm-up terminar"""
+    status = warmup_status()
+    return JSONResponse(
+        {"status": "ready" if status["ready"] else "warming_up", **status},
+        status_code=200 if status["ready"] else 503,
+    )
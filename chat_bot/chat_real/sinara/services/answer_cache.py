@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+
+"""
+Cache semântico de respostas finais do pipeline
+Perguntas repetidas com outras palavras ("como bater ponto" / "como registro o
+ponto?") reaproveitam a resposta já validada pelo Judge, sem as chamadas de
+guardrail, roteador, RAG e Judge. Uma entrada só serve se a similaridade de
+cosseno entre os embeddings das queries passar do limiar e se o contexto
+recuperado quando ela foi gerada (fingerprint: hashes dos trechos) ainda
+existir no corpus: mudanças no contexto.json invalidam as respostas que
+dependiam dos trechos alterados. Respostas de agentes que leem a memória da
+sessão ficam restritas a ela (campo session): não servem a outros usuários.
+Um acerto dispensa o guardrail, então só entram no cache respostas de
+entradas que o guardrail aprovou (o pipeline grava depois do veredicto).
+"""
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("SINARA_ANSWER_CACHE", "1").strip().lower() in ("1", "true", "on")
+# Similaridade mínima (cosseno) entre a query nova e a query em cache
+ANSWER_CACHE_THRESHOLD = float(os.getenv("SINARA_ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = max(1, int(os.getenv("SINARA_ANSWER_CACHE_SIZE", "512")))
+ANSWER_CACHE_TTL = float(os.getenv("SINARA_ANSWER_CACHE_TTL", "86400"))
+# Queries mais curtas (ex.: "sim", "e depois?") dependem do histórico da sessão: não entram no cache
+ANSWER_CACHE_MIN_TOKENS = int(os.getenv("SINARA_ANSWER_CACHE_MIN_TOKENS", "3"))
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    """Resposta encontrada no cache"""
+    answer: str
+    agent: str  # Agente que gerou a resposta (resolvido pelo roteador)
+    query: str  # Query que originou a entrada
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    agent: str
+    session: str | None  # Sessão dona da resposta (None: vale para qualquer sessão)
+    query: str
+    vector: np.ndarray | None  # Embedding normalizado (None: só casa com a mesma query)
+    context: Any  # Fingerprint do contexto usado na resposta
+    answer: str
+    expires: float | None
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(str(query or "").split()).lower()
+
+
+def _unit(vec) -> np.ndarray | None:
+    if vec is None:
+        return None
+    v = np.asarray(vec, dtype="float32").ravel()
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm > 0 else None
+
+
+class SemanticAnswerCache:
+    """
+    Cache LRU/TTL de respostas indexado por (agente, sessão, query), com busca por similaridade
+    Seguro para uso entre threads; a busca compara o embedding da query com os
+    das entradas (no máximo maxsize produtos escalares)
+    """
+
+    def __init__(
+        self,
+        maxsize: int = ANSWER_CACHE_SIZE,
+        ttl: float | None = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+    ):
+        """
+        Args:
+            maxsize: Número máximo de respostas (as menos usadas são descartadas)
+            ttl: Tempo de vida de cada resposta, em segundos (None = sem expiração)
+            threshold: Similaridade mínima para considerar a query equivalente
+        """
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self.threshold = threshold
+        self._data: "OrderedDict[tuple[str, str | None, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def lookup(
+        self,
+        agent: str,
+        query: str,
+        vector,
+        is_current: Callable[[Any], bool] | None = None,
+        session: str | None = None,
+    ) -> CachedAnswer | None:
+        """
+        Procura uma resposta para uma query equivalente
+
+        Args:
+            agent: Agente pedido ("auto" aceita respostas de qualquer agente)
+            query: Texto da consulta
+            vector: Embedding da query (None: só a mesma query normalizada serve)
+            is_current: Diz se o contexto de uma entrada ainda vale; entradas obsoletas são descartadas
+            session: Sessão da requisição (entradas de outras sessões são ignoradas)
+        Returns:
+            CachedAnswer da entrada mais similar acima do limiar, ou None
+        """
+        text = _normalize_query(query)
+        vec = _unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            candidates = []
+            # Do mais recente para o mais antigo: empates favorecem a entrada usada por último
+            for key, entry in reversed(list(self._data.items())):
+                if entry.expires is not None and entry.expires <= now:
+                    del self._data[key]
+                    self.expirations += 1
+                    continue
+                if agent != "auto" and entry.agent != agent:
+                    continue
+                if entry.session is not None and entry.session != session:
+                    continue
+                if entry.query == text:
+                    sim = 1.0
+                elif vec is not None and entry.vector is not None:
+                    sim = float(np.dot(vec, entry.vector))
+                else:
+                    continue
+                if sim >= self.threshold:
+                    candidates.append((sim, key))
+            for sim, key in sorted(candidates, key=lambda c: -c[0]):
+                entry = self._data[key]
+                if is_current is not None and not is_current(entry.context):
+                    del self._data[key]
+                    self.invalidations += 1
+                    continue
+                self._data.move_to_end(key)
+                self.hits += 1
+                return CachedAnswer(entry.answer, entry.agent, entry.query, sim)
+            self.misses += 1
+            return None
+
+    def store(self, agent: str, query: str, vector, context: Any, answer: str, session: str | None = None):
+        """
+        Armazena a resposta final de uma query
+
+        Args:
+            agent: Agente que gerou a resposta
+            query: Texto da consulta
+            vector: Embedding da query (None: entrada só casa com a mesma query)
+            context: Fingerprint do contexto usado na resposta (validado por is_current no lookup)
+            answer: Resposta final (já validada pelo Judge)
+            session: Restringe a entrada a uma sessão (resposta que dependeu da memória dela)
+        """
+        expires = (time.monotonic() + self.ttl) if self.ttl is not None else None
+        key = (agent, session, _normalize_query(query))
+        entry = _Entry(agent, session, key[2], _unit(vector), context, answer, expires)
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            self.stores += 1
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Métricas do cache (tamanho, acertos, falhas, taxa de acerto, descartes)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+_answer_cache = SemanticAnswerCache()
+
+
+def cacheable_query(query: str) -> bool:
+    """Queries curtas demais para serem respondidas sem o histórico da sessão ficam fora do cache"""
+    return ANSWER_CACHE_ENABLED and len(str(query or "").split()) >= ANSWER_CACHE_MIN_TOKENS
+
+
+def lookup_answer(agent: str, query: str, vector, is_current=None, session: str | None = None) -> CachedAnswer | None:
+    """Consulta o cache de respostas do processo (ver SemanticAnswerCache.lookup)"""
+    if not cacheable_query(query):
+        return None
+    return _answer_cache.lookup(agent or "auto", query, vector, is_current, session)
+
+
+def store_answer(agent: str, query: str, vector, context: Any, answer: str, session: str | None = None):
+    """Armazena no cache de respostas do processo (ver SemanticAnswerCache.store)"""
+    if cacheable_query(query) and answer:
+        _answer_cache.store(agent, query, vector, context, answer, session)
+
+
+def clear_answer_cache():
+    _answer_cache.clear()
+
+
+def answer_cache_stats() -> dict:
+    """Métricas do cache de respostas (hits, misses, hit_rate...)"""
+    return _answer_cache.stats()
@@ -1,6 +1,8 @@
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from .rag_service import (
+    RetrievalResult,
+    retrieval_for_agent,
     retrieve_similar_context,
     retrieve_similar_context_with_scores,
 )
@@ -11,15 +13,22 @@ def get_faq_context(
     k: int = 6,
     chunk_size: int | None = None,
     chunk_overlap: int | None = None,
+    retrieval: Optional[RetrievalResult] = None,
 ) -> Dict[str, Any]:
     """
     Recupera contexto do FAQ (arquivo JSON local) para uma pergunta.
     Retorna dict com a pergunta, matches (score, trecho) e o contexto concatenado.
+    Se 'retrieval' for informado, reutiliza a recuperação já feita na requisição
+    (ou busca no namespace "faq", se configurado em SINARA_RAG_NAMESPACES).
     """
     if not question or not str(question).strip():
         raise ValueError("question deve ser uma string não-vazia")
 
-    pairs: List[Tuple[float, str]] = retrieve_similar_context_with_scores(question, top_k=k)
+    retrieval = retrieval_for_agent(question, "faq", retrieval)
+    if retrieval is not None:
+        pairs: List[Tuple[float, str]] = retrieval.with_scores(k)
+    else:
+        pairs = retrieve_similar_context_with_scores(question, top_k=k)
     context_texts = [t for _s, t in pairs]
     context_joined = "\n\n---\n\n".join(context_texts)
 
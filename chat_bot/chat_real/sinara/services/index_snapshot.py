@@ -0,0 +1,162 @@
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+
+"""
+Snapshot binário e versionado de um índice de recuperação
+Cada snapshot é um diretório com manifest.json, arrays .npy (carregados com
+mmap), um blob UTF-8 com os textos e strings.json (termos e hashes). O arquivo
+CURRENT aponta para a versão ativa; a troca é atômica (os.replace), então
+workers que estejam lendo a versão anterior não são afetados.
+"""
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Versões antigas mantidas por namespace (workers ainda podem estar usando-as)
+_KEEP_VERSIONS = 2
+
+
+def file_sha256(path: Path) -> str:
+    """Hash do conteúdo de um arquivo (identifica a fonte do snapshot)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "_global"
+
+
+class TextBlob:
+    """
+    Sequência de textos sobre um blob UTF-8 (mmap) + offsets em bytes
+    Cada acesso decodifica só o texto pedido; nada é copiado na carga
+    """
+
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.blob[a:b]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+@dataclass
+class Snapshot:
+    """Snapshot carregado: arrays e textos são mmaps somente leitura"""
+    path: Path
+    manifest: dict
+    arrays: dict
+    strings: dict
+    texts: TextBlob
+
+
+def write_snapshot(
+    root: Path,
+    name: str,
+    arrays: dict[str, np.ndarray],
+    strings: dict[str, list],
+    texts: list[str],
+    meta: dict | None = None,
+) -> Path:
+    """
+    Grava um novo snapshot e o torna o ativo do namespace
+
+    Args:
+        root: Diretório raiz dos snapshots
+        name: Nome do namespace ("" = global)
+        arrays: Arrays NumPy a gravar (um .npy por chave)
+        strings: Listas de strings (termos, hashes) gravadas em JSON
+        texts: Textos dos documentos, gravados em um blob UTF-8
+        meta: Metadados extras do manifest (fonte, modelo, parâmetros)
+    Returns:
+        Diretório do snapshot gravado
+    """
+    base = Path(root) / _slug(name)
+    base.mkdir(parents=True, exist_ok=True)
+    snap_id = f"v{SNAPSHOT_FORMAT_VERSION}-{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}"
+    tmp = base / f".{snap_id}.tmp"
+    tmp.mkdir()
+    try:
+        for key, arr in arrays.items():
+            np.save(tmp / f"{key}.npy", np.ascontiguousarray(arr))
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        np.save(tmp / "text_offsets.npy", offsets)
+        with open(tmp / "texts.bin", "wb") as f:
+            for e in encoded:
+                f.write(e)
+        with open(tmp / "strings.json", "w", encoding="utf-8") as f:
+            json.dump(strings, f, ensure_ascii=False)
+        manifest = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "name": name,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "arrays": sorted(arrays),
+        }
+        manifest.update(meta or {})
+        with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        final = base / snap_id
+        os.replace(tmp, final)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    pointer = base / f"CURRENT.{os.getpid()}.tmp"
+    pointer.write_text(snap_id, encoding="utf-8")
+    os.replace(pointer, base / "CURRENT")
+
+    versions = sorted(p for p in base.iterdir() if p.is_dir() and p.name.startswith("v"))
+    for old in versions[:-_KEEP_VERSIONS]:
+        shutil.rmtree(old, ignore_errors=True)
+    return final
+
+
+def load_snapshot(root: Path, name: str) -> Snapshot | None:
+    """
+    Carrega o snapshot ativo do namespace via mmap
+
+    Returns:
+        Snapshot, ou None se não existir ou for de outra versão de formato
+    """
+    base = Path(root) / _slug(name)
+    try:
+        snap_id = (base / "CURRENT").read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    path = base / snap_id
+    with open(path / "manifest.json", "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != SNAPSHOT_FORMAT_VERSION:
+        logger.info("Snapshot %s tem formato %s; ignorando", path, manifest.get("version"))
+        return None
+    arrays = {key: np.load(path / f"{key}.npy", mmap_mode="r") for key in manifest.get("arrays", [])}
+    with open(path / "strings.json", "r", encoding="utf-8") as f:
+        strings = json.load(f)
+    offsets = np.load(path / "text_offsets.npy", mmap_mode="r")
+    blob = np.memmap(path / "texts.bin", dtype="uint8", mode="r") if offsets[-1] > 0 else b""
+    return Snapshot(path, manifest, arrays, strings, TextBlob(blob, offsets))
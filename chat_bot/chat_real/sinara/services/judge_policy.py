@@ -0,0 +1,179 @@
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+
+from .rag_service import RetrievalResult, context_similarity
+
+"""
+Política do Judge: decide, localmente, se a resposta de um agente precisa da
+validação do LLM juiz
+- Resposta copiada do contexto (match direto do RAG organizacional/FAQ,
+  trecho de fallback) não tem como alucinar: o juiz é dispensado
+- Demais respostas recebem um score de grounding lexical (fração dos termos
+  da resposta presentes no contexto; números precisam estar todos lá) e,
+  se passar, a similaridade de embedding com os chunks recuperados
+- Abaixo dos limiares, ou para agentes de alto risco, o LLM juiz é chamado
+"""
+
+logger = logging.getLogger(__name__)
+
+JUDGE_POLICY_ENABLED = os.getenv("SINARA_JUDGE_POLICY", "1").strip().lower() in ("1", "true", "on")
+# Fração mínima dos termos da resposta encontrados no contexto
+JUDGE_MIN_GROUNDING = float(os.getenv("SINARA_JUDGE_MIN_GROUNDING", "0.8"))
+# Similaridade mínima (cosseno) entre a resposta e algum chunk recuperado (0 desliga a verificação)
+JUDGE_MIN_SIMILARITY = float(os.getenv("SINARA_JUDGE_MIN_SIMILARITY", "0.8"))
+# Agentes cujas respostas geradas sempre passam pelo LLM juiz (separados por vírgula)
+JUDGE_ALWAYS_AGENTS = {
+    a.strip().lower()
+    for a in os.getenv("SINARA_JUDGE_ALWAYS_AGENTS", "tecnico").split(",")
+    if a.strip()
+}
+# Respostas mais curtas não contam como cópia do contexto ("Sim." aparece em qualquer texto)
+_MIN_DIRECT_CHARS = 40
+
+_STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "uns", "umas", "para", "por", "com", "sem", "que", "se", "ao", "aos", "sua",
+    "seu", "suas", "seus", "mais", "como", "ou", "voce", "isso", "esta", "este", "essa", "esse",
+    "pelo", "pela", "sao", "ser", "ter", "foi", "mas", "tambem", "pode", "deve",
+}
+
+
+@dataclass(frozen=True)
+class JudgeDecision:
+    """Resultado da política: chamar ou não o LLM juiz, e por quê"""
+    run_llm: bool
+    reason: str  # direct_context | grounded | low_grounding | unsupported_number | low_similarity | high_risk_agent | no_context | disabled
+    grounding: float | None = None  # Score lexical (fração de termos da resposta no contexto)
+    similarity: float | None = None  # Similaridade de embedding resposta x chunks
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def _terms(normalized: str) -> list[str]:
+    return [t for t in normalized.split() if t not in _STOPWORDS and (len(t) > 2 or t.isdigit())]
+
+
+def _is_direct_context(answer: str, sources: list[str]) -> bool:
+    """Se a resposta (normalizada) aparece literalmente em algum dos textos de contexto"""
+    if len(answer) < _MIN_DIRECT_CHARS:
+        return False
+    return any(answer in src for src in sources)
+
+
+def lexical_grounding(answer: str, context: str) -> tuple[float, bool]:
+    """
+    Grounding lexical da resposta no contexto
+
+    Args:
+        answer: Resposta do agente
+        context: Texto do contexto usado na geração
+    Returns:
+        (fração dos termos da resposta presentes no contexto, True se todo número da resposta está no contexto)
+    """
+    terms = _terms(_normalize(answer))
+    if not terms:
+        return 0.0, True
+    known = set(_terms(_normalize(context)))
+    found = sum(1 for t in terms if t in known)
+    numbers_ok = all(t in known for t in terms if t.isdigit())
+    return found / len(terms), numbers_ok
+
+
+class _PolicyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reasons: Counter = Counter()
+        self.llm_calls = 0
+        self.skipped = 0
+
+    def record(self, decision: JudgeDecision):
+        with self._lock:
+            self.reasons[decision.reason] += 1
+            if decision.run_llm:
+                self.llm_calls += 1
+            else:
+                self.skipped += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = self.llm_calls + self.skipped
+            return {
+                "evaluated": total,
+                "llm_calls": self.llm_calls,
+                "skipped": self.skipped,
+                "skip_rate": (self.skipped / total) if total else 0.0,
+                "by_reason": dict(self.reasons),
+            }
+
+
+_stats = _PolicyStats()
+
+
+def judge_policy_stats() -> dict:
+    """Chamadas ao LLM juiz feitas e evitadas (total e por motivo)"""
+    return _stats.snapshot()
+
+
+def decide_judge(
+    answer: str,
+    context: str,
+    agent: str | None,
+    retrieval: RetrievalResult | None = None,
+) -> JudgeDecision:
+    """
+    Decide se a resposta precisa do LLM juiz
+
+    Args:
+        answer: Resposta do agente
+        context: Contexto que o agente usou
+        agent: Agente que respondeu
+        retrieval: Recuperação da requisição (trechos para match direto e similaridade)
+    Returns:
+        JudgeDecision (contabilizada em judge_policy_stats)
+    """
+    decision = _decide(answer, context, agent, retrieval)
+    _stats.record(decision)
+    logger.info(
+        "Política do Judge: %s (%s; grounding=%s, similaridade=%s)",
+        "LLM" if decision.run_llm else "dispensado",
+        decision.reason,
+        f"{decision.grounding:.2f}" if decision.grounding is not None else "-",
+        f"{decision.similarity:.2f}" if decision.similarity is not None else "-",
+    )
+    return decision
+
+
+def _decide(answer: str, context: str, agent: str | None, retrieval: RetrievalResult | None) -> JudgeDecision:
+    if not JUDGE_POLICY_ENABLED:
+        return JudgeDecision(True, "disabled")
+    hits = [h.text for h in retrieval.hits] if retrieval is not None else []
+    if not str(context or "").strip() and not hits:
+        return JudgeDecision(True, "no_context")
+
+    norm_answer = _normalize(answer)
+    if _is_direct_context(norm_answer, [_normalize(context)] + [_normalize(t) for t in hits]):
+        return JudgeDecision(False, "direct_context")
+    if str(agent or "").lower() in JUDGE_ALWAYS_AGENTS:
+        return JudgeDecision(True, "high_risk_agent")
+
+    grounding, numbers_ok = lexical_grounding(answer, "\n".join([str(context or "")] + hits))
+    if not numbers_ok:
+        return JudgeDecision(True, "unsupported_number", grounding)
+    if grounding < JUDGE_MIN_GROUNDING:
+        return JudgeDecision(True, "low_grounding", grounding)
+
+    similarity = None
+    if JUDGE_MIN_SIMILARITY > 0 and retrieval is not None:
+        similarity = context_similarity(answer, retrieval)
+        if similarity is not None and similarity < JUDGE_MIN_SIMILARITY:
+            return JudgeDecision(True, "low_similarity", grounding, similarity)
+    return JudgeDecision(False, "grounded", grounding, similarity)
@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+
+import google.api_core.exceptions
+import google.generativeai as genai
+from google.generativeai.client import get_default_generative_client
+from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_google_genai._common import GoogleGenerativeAIError
+from langchain_google_genai.chat_models import ChatGoogleGenerativeAIError, _response_to_result
+
+from .rate_limiter import rate_limited
+from ..utils.deadline import remaining_time
+
+"""
+Fábrica compartilhada dos clientes Gemini (chat e embeddings)
+Construir um ChatGoogleGenerativeAI chama genai.configure, que é global no
+processo e descarta os clientes de transporte já abertos; construir um por
+requisição (e por agente) refazia essa configuração a cada chamada. Aqui cada
+cliente é criado uma vez por (modelo, temperatura, schema) e reutilizado, e
+todos usam o mesmo transporte, então a configuração global não alterna.
+Toda chamada dos clientes passa pelo limitador de taxa (rate_limiter) e é
+uma única RPC, com timeout igual ao tempo restante do prazo: as retentativas
+do langchain (tenacity, até 10 com espera de até 60 s) e do GAPIC ficam
+desligadas, e a única camada de nova tentativa é a de retry_with_jitter.
+Assim uma chamada abandonada pelo estágio termina junto com o prazo, em vez
+de ocupar um worker de STAGE_WORKERS por minutos.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Transporte do google-generativeai para todos os clientes: rest | grpc
+GENAI_TRANSPORT = (os.getenv("SINARA_GENAI_TRANSPORT") or "rest").strip().lower()
+# Timeout de cada chamada ao Gemini fora de uma requisição com prazo (indexação, warmup), em segundos
+GENAI_CALL_TIMEOUT = float(os.getenv("SINARA_GENAI_CALL_TIMEOUT", "30"))
+
+
+def _call_timeout() -> float:
+    """Timeout da próxima RPC: o tempo restante do prazo, limitado por SINARA_GENAI_CALL_TIMEOUT"""
+    remaining = remaining_time()
+    if remaining is None:
+        return GENAI_CALL_TIMEOUT
+    if remaining <= 0:
+        raise google.api_core.exceptions.DeadlineExceeded("prazo da requisição esgotado antes da chamada ao Gemini")
+    return min(remaining, GENAI_CALL_TIMEOUT)
+
+
+class _BudgetedClient:
+    """
+    GenerativeServiceClient do google-generativeai com timeout por chamada e sem a
+    retentativa padrão do GAPIC (esta versão não aceita request_options em send_message
+    nem em embed_content, então o timeout é passado direto na RPC)
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def generate_content(self, request, **kwargs):
+        return self._client.generate_content(request, timeout=_call_timeout(), retry=None, **kwargs)
+
+    def stream_generate_content(self, request, **kwargs):
+        return self._client.stream_generate_content(request, timeout=_call_timeout(), retry=None, **kwargs)
+
+    def embed_content(self, request, **kwargs):
+        return self._client.embed_content(request, timeout=_call_timeout(), retry=None, **kwargs)
+
+    def batch_embed_contents(self, request, **kwargs):
+        return self._client.batch_embed_contents(request, timeout=_call_timeout(), retry=None, **kwargs)
+
+
+def _budgeted_client() -> _BudgetedClient:
+    # O cliente padrão é buscado a cada chamada: genai.configure pode tê-lo substituído
+    return _BudgetedClient(get_default_generative_client())
+
+
+class RateLimitedChat(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI que espera a cota do modelo antes de cada chamada (inclusive
+    em streaming) e faz uma única RPC limitada pelo prazo, sem _chat_with_retry
+    """
+
+    def _send(self, messages, stop, stream: bool, **kwargs):
+        params, chat, message = self._prepare_chat(messages, stop=stop, **kwargs)
+        chat.model._client = _budgeted_client()
+        try:
+            return chat.send_message(content=message, stream=stream, **params)
+        except google.api_core.exceptions.InvalidArgument as e:
+            # Mesma conversão do _chat_with_retry do langchain
+            raise ChatGoogleGenerativeAIError(f"Invalid argument provided to Gemini: {e}") from e
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with rate_limited("chat", self.model):
+            return _response_to_result(self._send(messages, stop, stream=False, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with rate_limited("chat", self.model):
+            for chunk in self._send(messages, stop, stream=True, **kwargs):
+                gen = _response_to_result(chunk, stream=True).generations[0]
+                if run_manager:
+                    run_manager.on_llm_new_token(gen.text)
+                yield gen
+
+
+class RateLimitedEmbeddings(GoogleGenerativeAIEmbeddings):
+    """GoogleGenerativeAIEmbeddings que espera a cota do modelo antes de cada lote, com timeout pelo prazo"""
+
+    def _embed(self, texts, task_type, title=None):
+        # Como no GoogleGenerativeAIEmbeddings._embed: o task_type do cliente prevalece
+        task_type = self.task_type or "retrieval_document"
+        with rate_limited("embed", self.model):
+            try:
+                result = genai.embed_content(
+                    model=self.model,
+                    content=texts,
+                    task_type=task_type,
+                    title=title,
+                    client=_budgeted_client(),
+                )
+            except Exception as e:
+                raise GoogleGenerativeAIError(f"Error embedding content: {e}") from e
+        return result["embedding"]
+
+
+_lock = threading.Lock()
+_chat_models: dict[tuple, ChatGoogleGenerativeAI] = {}  # (modelo, temperatura, chave) -> cliente base
+_structured: dict[tuple, object] = {}  # (modelo, temperatura, schema, chave) -> runnable com saída estruturada
+_embeddings: dict[tuple, GoogleGenerativeAIEmbeddings] = {}  # (modelo, chave) -> cliente
+
+
+def _api_key(api_key: str | None = None) -> str | None:
+    return api_key or os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+
+def get_chat_model(
+    model: str,
+    temperature: float | None = None,
+    schema: type | None = None,
+    api_key: str | None = None,
+):
+    """
+    Cliente de chat compartilhado pelo processo
+
+    Args:
+        model: Nome do modelo Gemini
+        temperature: Temperatura (None = padrão do ChatGoogleGenerativeAI)
+        schema: Modelo Pydantic para saída estruturada (with_structured_output)
+        api_key: Chave de API (padrão: GEMINI_API_KEY / GOOGLE_API_KEY)
+    Returns:
+        ChatGoogleGenerativeAI, ou o runnable estruturado se 'schema' for informado
+    """
+    api_key = _api_key(api_key)
+    if not api_key:
+        raise RuntimeError("API key ausente")
+    base_key = (model, temperature, api_key)
+    key = (model, temperature, schema, api_key)
+    cached = _structured.get(key) if schema is not None else _chat_models.get(base_key)
+    if cached is not None:
+        return cached
+    with _lock:
+        base = _chat_models.get(base_key)
+        if base is None:
+            params = {"temperature": temperature} if temperature is not None else {}
+            base = RateLimitedChat(
+                model=model,
+                google_api_key=api_key,
+                transport=GENAI_TRANSPORT,
+                **params,
+            )
+            _chat_models[base_key] = base
+            logger.info("Cliente Gemini criado: %s (temperature=%s)", model, temperature)
+        if schema is None:
+            return base
+        structured = _structured.get(key)
+        if structured is None:
+            structured = _structured[key] = base.with_structured_output(schema)
+        return structured
+
+
+def get_embeddings(model: str, api_key: str | None = None) -> GoogleGenerativeAIEmbeddings | None:
+    """
+    Cliente de embeddings compartilhado pelo processo
+
+    Returns:
+        GoogleGenerativeAIEmbeddings, ou None sem chave de API
+    """
+    api_key = _api_key(api_key)
+    if not api_key:
+        return None
+    key = (model, api_key)
+    client = _embeddings.get(key)
+    if client is None:
+        with _lock:
+            client = _embeddings.get(key)
+            if client is None:
+                client = _embeddings[key] = RateLimitedEmbeddings(
+                    model=model,
+                    google_api_key=api_key,
+                    transport=GENAI_TRANSPORT,
+                )
+    return client
+
+
+def cached_clients() -> dict[str, int]:
+    """Quantidade de clientes em cache (diagnóstico)"""
+    return {"chat": len(_chat_models), "structured": len(_structured), "embeddings": len(_embeddings)}
@@ -1,4 +1,4 @@
-from langchain_mongodb import MongoDBChatMessageHistory
+from .mongo_client import SharedMongoChatHistory
 import os
 from dotenv import load_dotenv
 
@@ -8,9 +8,8 @@ MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.getenv("MONGO_DB", "DB_Sinara")
 
 def get_memory(session_id: str):
-    return MongoDBChatMessageHistory(
+    return SharedMongoChatHistory(
         session_id=session_id,
-        connection_string=MONGO_URI,
         database_name=MONGO_DB,
         collection_name="conversation_assistente",
     )
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from langchain_mongodb import MongoDBChatMessageHistory
+from .mongo_client import SharedMongoChatHistory
 
 load_dotenv(override=True)
 
@@ -15,8 +15,7 @@ def get_memory(session_id: str):
     Retorna um MongoDBChatMessageHistory para a sessão informada.
     Cada sessão fica registrada em um documento com o id = session_id.
     """
-    return MongoDBChatMessageHistory(
-        connection_string=MONGO_URI,
+    return SharedMongoChatHistory(
         database_name=MONGO_DB,
         collection_name=COLLECTION,
         session_id=session_id,
@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, TypeVar
+
+from .rate_limiter import RateLimitWaitExceeded
+from ..utils.deadline import current_deadline, is_transient
+
+"""
+Saúde dos modelos Gemini usados com lista de fallback (guardrail, RAG assistente)
+Cada modelo tem um circuit breaker compartilhado pelo processo: depois de
+falhar ele fica aberto (pulado) durante um cooldown; terminado o cooldown,
+uma única requisição o testa (half-open) e, se der certo, ele volta a ser
+usado. Cada lista de candidatos (grupo) lembra o último modelo que
+respondeu, então em regime as requisições fazem uma única chamada, sem
+pagar de novo pelas tentativas que já se sabe que falham.
+Só contam como falha do modelo: modelo inexistente (abre na hora) e falhas
+transitórias (429, 5xx, rede), que abrem depois de SINARA_MODEL_FAILURE_THRESHOLD
+seguidas. Erros do próprio cliente (fila do limitador, prazo esgotado) e erros
+permanentes que não dependem do modelo (prompt, formatação) não mexem no circuito.
+"""
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Falhas transitórias consecutivas para abrir o circuito de um modelo
+MODEL_FAILURE_THRESHOLD = max(1, int(os.getenv("SINARA_MODEL_FAILURE_THRESHOLD", "3")))
+# Cooldown inicial (s); dobra a cada teste half-open que falha, até o máximo
+MODEL_COOLDOWN = float(os.getenv("SINARA_MODEL_COOLDOWN", "30"))
+MODEL_MAX_COOLDOWN = float(os.getenv("SINARA_MODEL_MAX_COOLDOWN", "600"))
+# Um teste half-open sem resultado depois desse tempo libera outro teste
+_PROBE_TIMEOUT = 60.0
+
+
+def is_not_found(exc: BaseException) -> bool:
+    """Modelo inexistente/indisponível para a chave (não volta sozinho em segundos)"""
+    msg = f"{type(exc).__name__}: {exc}"
+    return ("NotFound" in msg) or ("is not found" in msg)
+
+
+def is_local_failure(exc: BaseException) -> bool:
+    """Falha do próprio cliente (sem cota no limitador, prazo esgotado), não do modelo"""
+    if isinstance(exc, RateLimitWaitExceeded) or "DeadlineExceeded" in f"{type(exc).__name__}: {exc}":
+        return True
+    deadline = current_deadline()
+    return deadline is not None and deadline.expired()
+
+
+@dataclass
+class _Breaker:
+    failures: int = 0  # Falhas transitórias consecutivas
+    failed_at: float | None = None  # Última falha contada
+    opened_at: float | None = None  # None = fechado
+    cooldown: float = MODEL_COOLDOWN
+    probe_at: float | None = None  # Início do teste half-open em andamento
+    calls: int = 0
+    skipped: int = 0
+    last_error: str | None = None
+
+    def state(self, now: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if now >= self.opened_at + self.cooldown else "open"
+
+    def retry_due(self, now: float) -> bool:
+        """Cooldown desde a abertura (ou, fechado com falhas, desde a última falha) terminado"""
+        since = self.opened_at if self.opened_at is not None else self.failed_at
+        return since is None or now >= since + self.cooldown
+
+
+class ModelHealthRegistry:
+    """Circuit breakers por modelo e último modelo bom por grupo de candidatos (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: dict[str, _Breaker] = {}
+        self._last_good: dict[str, str] = {}
+
+    def _breaker(self, model: str) -> _Breaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers[model] = _Breaker()
+        return breaker
+
+    def _acquire(self, model: str, skip_degraded: bool) -> bool:
+        """Reserva uma chamada ao modelo (falso se o circuito estiver aberto ou com teste em andamento)"""
+        now = time.monotonic()
+        with self._lock:
+            b = self._breaker(model)
+            state = b.state(now)
+            if state == "closed" and not (skip_degraded and b.failures):
+                b.calls += 1
+                return True
+            # Circuito em half-open, ou modelo com falhas recentes à frente do último bom:
+            # passado o cooldown, uma requisição por vez o testa
+            if state != "open" and b.retry_due(now) and (b.probe_at is None or now - b.probe_at > _PROBE_TIMEOUT):
+                b.probe_at = now
+                b.calls += 1
+                logger.info("Modelo %s: testando após cooldown de %.0f s", model, b.cooldown)
+                return True
+            b.skipped += 1
+            return False
+
+    def attempts(self, group: str, models: list[str]) -> Iterator[str]:
+        """
+        Modelos a tentar, em ordem, pulando os que estão com o circuito aberto
+        Cada modelo é reservado só quando o anterior falhou (avaliação preguiçosa);
+        o chamador informa o resultado com record_success/record_failure
+
+        Args:
+            group: Nome da lista de candidatos (ex.: "guardrail")
+            models: Candidatos em ordem de preferência
+        """
+        with self._lock:
+            good = self._last_good.get(group)
+        rank = models.index(good) if good in models else -1
+        for i, model in enumerate(models):
+            # Antes do último modelo bom, só entram modelos sem falhas ou em teste half-open
+            if self._acquire(model, skip_degraded=i < rank):
+                yield model
+
+    def record_success(self, group: str, model: str):
+        with self._lock:
+            b = self._breaker(model)
+            if b.opened_at is not None:
+                logger.info("Modelo %s voltou a responder; circuito fechado", model)
+            b.failures, b.failed_at, b.opened_at, b.probe_at, b.cooldown = 0, None, None, None, MODEL_COOLDOWN
+            if self._last_good.get(group) != model:
+                logger.info("Grupo '%s': modelo em uso agora é %s", group, model)
+                self._last_good[group] = model
+
+    def release(self, model: str):
+        """Libera o teste half-open reservado para o modelo sem registrar resultado"""
+        with self._lock:
+            self._breaker(model).probe_at = None
+
+    def record_failure(self, model: str, exc: BaseException):
+        now = time.monotonic()
+        with self._lock:
+            b = self._breaker(model)
+            b.last_error = f"{type(exc).__name__}: {str(exc)[:200]}"
+            if is_local_failure(exc) or not (is_not_found(exc) or is_transient(exc)):
+                # Não diz nada sobre a saúde do modelo: só libera um teste em andamento
+                b.probe_at = None
+                return
+            b.failures += 1
+            b.failed_at = now
+            if b.probe_at is not None:
+                # Teste half-open falhou: reabre com cooldown maior
+                b.cooldown = min(MODEL_MAX_COOLDOWN, b.cooldown * 2)
+            elif is_not_found(exc):
+                b.cooldown = MODEL_MAX_COOLDOWN
+            elif b.failures < MODEL_FAILURE_THRESHOLD:
+                return
+            b.opened_at, b.probe_at = now, None
+            logger.warning("Modelo %s: circuito aberto por %.0f s (%s)", model, b.cooldown, b.last_error)
+
+    def reset(self):
+        with self._lock:
+            self._breakers.clear()
+            self._last_good.clear()
+
+    def stats(self) -> dict:
+        """Estado de cada modelo e o modelo em uso por grupo"""
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for name, b in self._breakers.items():
+                state = b.state(now)
+                models[name] = {
+                    "state": state,
+                    "failures": b.failures,
+                    "calls": b.calls,
+                    "skipped": b.skipped,
+                    "retry_in_s": round(b.opened_at + b.cooldown - now, 1) if state == "open" else 0.0,
+                    "last_error": b.last_error,
+                }
+            return {"models": models, "groups": dict(self._last_good)}
+
+
+_registry = ModelHealthRegistry()
+
+
+def model_attempts(group: str, models: list[str]) -> Iterator[str]:
+    """Candidatos saudáveis de um grupo, em ordem (ver ModelHealthRegistry.attempts)"""
+    return _registry.attempts(group, models)
+
+
+def record_model_success(group: str, model: str):
+    _registry.record_success(group, model)
+
+
+def record_model_failure(model: str, exc: BaseException):
+    _registry.record_failure(model, exc)
+
+
+def release_model_attempt(model: str):
+    _registry.release(model)
+
+
+class NoModelAvailable(RuntimeError):
+    """Nenhum candidato do grupo respondeu (circuitos abertos ou todos falharam)"""
+
+
+def call_with_fallback(
+    group: str,
+    models: list[str],
+    call: Callable[[str], T],
+    fall_through: Callable[[BaseException], bool] = is_not_found,
+) -> T:
+    """
+    Chama call(modelo) com os candidatos do grupo, em ordem, até um responder
+    Modelos com o circuito aberto são pulados; em regime, só o último que
+    respondeu é chamado. Uma falha local (sem cota no limitador, prazo
+    esgotado) libera a reserva do modelo sem contar contra ele e é repassada:
+    os demais candidatos disputariam a mesma cota e o mesmo prazo. As outras
+    falhas são registradas no circuito do modelo; passam ao próximo candidato
+    se fall_through(exc), senão são repassadas.
+
+    Args:
+        group: Nome da lista de candidatos (ex.: "guardrail")
+        models: Candidatos em ordem de preferência
+        call: Recebe o nome do modelo e faz a chamada
+        fall_through: Diz se a falha de um modelo leva ao próximo (padrão: modelo inexistente)
+    Returns:
+        Retorno de call para o primeiro modelo que respondeu
+    Raises:
+        NoModelAvailable: nenhum candidato respondeu
+    """
+    for model in model_attempts(group, models):
+        try:
+            result = call(model)
+        except Exception as exc:
+            if is_local_failure(exc):
+                release_model_attempt(model)
+                raise
+            record_model_failure(model, exc)
+            if fall_through(exc):
+                logger.warning("Grupo '%s': modelo %s falhou (%s); tentando o próximo", group, model, exc)
+                continue
+            raise
+        record_model_success(group, model)
+        return result
+    raise NoModelAvailable(f"nenhum modelo de '{group}' disponível")
+
+
+def reset_model_health():
+    _registry.reset()
+
+
+def model_health_stats() -> dict:
+    return _registry.stats()
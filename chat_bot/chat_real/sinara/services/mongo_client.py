@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+from typing import List
+
+import pymongo
+from langchain_core.messages import BaseMessage
+from langchain_mongodb import MongoDBChatMessageHistory
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from ..utils.deadline import remaining_time
+
+"""
+Cliente MongoDB compartilhado pelo processo
+O MongoDBChatMessageHistory original abre um MongoClient (DNS, TLS, pool) e
+executa create_index a cada sessão; aqui o cliente é criado uma vez e o
+índice de cada coleção é garantido uma única vez. A leitura do histórico
+respeita o prazo da requisição (pymongo.timeout) e, sem resposta a tempo,
+segue sem histórico; as gravações não têm esse limite e propagam as falhas
+ao chamador, para que mensagens não se percam em silêncio.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Tempo máximo para escolher um servidor (evita travar a requisição se o Mongo cair)
+MONGO_TIMEOUT_MS = int(os.getenv("SINARA_MONGO_TIMEOUT_MS", "5000"))
+
+_client: MongoClient | None = None
+_client_lock = threading.Lock()
+_indexed: set[tuple[str, str]] = set()  # (banco, coleção) com índice SessionId garantido
+
+
+def get_mongo_client() -> MongoClient:
+    """Retorna o MongoClient do processo, criando-o na primeira chamada"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+                _client = MongoClient(uri, serverSelectionTimeoutMS=MONGO_TIMEOUT_MS)
+    return _client
+
+
+def _op_timeout() -> float | None:
+    """Tempo restante do prazo ativo para operações no Mongo (0 desligaria o limite no pymongo)"""
+    remaining = remaining_time()
+    return None if remaining is None else max(0.001, remaining)
+
+
+class SharedMongoChatHistory(MongoDBChatMessageHistory):
+    """MongoDBChatMessageHistory sobre o cliente compartilhado"""
+
+    def __init__(self, session_id: str, database_name: str, collection_name: str):
+        self.connection_string = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+        self.session_id = session_id
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.client = get_mongo_client()
+        self.db = self.client[database_name]
+        self.collection = self.db[collection_name]
+        ensure_session_index(database_name, collection_name)
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        """Histórico da sessão; sem resposta dentro do prazo, segue sem histórico"""
+        try:
+            with pymongo.timeout(_op_timeout()):
+                return super().messages
+        except PyMongoError:
+            logger.warning("Histórico da sessão %s indisponível no prazo", self.session_id, exc_info=True)
+            return []
+
+
+def ensure_session_index(database_name: str, collection_name: str):
+    """Cria (uma vez por processo) o índice SessionId da coleção"""
+    key = (database_name, collection_name)
+    if key in _indexed:
+        return
+    get_mongo_client()[database_name][collection_name].create_index("SessionId")
+    _indexed.add(key)
+
+
+def ping_mongo():
+    """Abre a conexão com o servidor (usado no warm-up); levanta exceção se indisponível"""
+    reply = get_mongo_client().admin.command("ping")
+    if not reply.get("ok"):
+        raise RuntimeError(f"ping do MongoDB falhou: {reply}")
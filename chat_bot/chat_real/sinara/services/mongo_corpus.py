@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+
+from .mongo_client import get_mongo_client
+
+"""
+Corpus de recuperação lido de uma coleção do MongoDB (padrão: 'contexto')
+Mantém um espelho leve dos documentos (título, seção, conteúdo e hashes), lido
+com projeção e cursor em lotes. Depois da primeira carga, cada sincronização
+busca apenas os documentos com updated_at posterior ao último visto. Os
+embeddings gravados pelo db_script/dataload.py não entram no espelho: são
+lidos sob demanda, só para os chunks que ainda faltam no cache local.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Documentos por lote do cursor
+CORPUS_BATCH_SIZE = max(1, int(os.getenv("SINARA_CORPUS_BATCH_SIZE", "500")))
+
+_TEXT_FIELDS = ("title", "titulo", "section", "secao", "content", "conteudo")
+_PROJECTION = {f: 1 for f in (*_TEXT_FIELDS, "position", "content_hash", "updated_at")}
+
+
+class MongoCorpus:
+    """
+    Espelho em memória de uma coleção de documentos do corpus
+
+    Documentos sem updated_at (gravados pela versão antiga do dataload) não
+    entram no filtro incremental: são lidos na carga a frio e quando aparecem
+    na conferência de _id. Se nenhum documento tem updated_at, toda
+    sincronização relê a coleção inteira (ainda com projeção, sem os embeddings)
+    """
+
+    def __init__(self, database_name: str, collection_name: str, batch_size: int = CORPUS_BATCH_SIZE, collection=None):
+        """
+        Args:
+            database_name: Banco do MongoDB
+            collection_name: Coleção com os documentos do corpus
+            batch_size: Documentos por lote do cursor
+            collection: Coleção já aberta (ex.: mongomock); padrão: cliente compartilhado
+        """
+        self.database_name = database_name
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self._collection = collection
+        self._docs: dict = {}  # _id -> campos projetados
+        self._watermark = None  # Maior updated_at já visto
+        self._lock = threading.Lock()
+        self.synced = False
+        self.version = 0  # Incrementado a cada mudança observada
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = get_mongo_client()[self.database_name][self.collection_name]
+        return self._collection
+
+    @property
+    def label(self) -> str:
+        return f"mongo:{self.database_name}.{self.collection_name}"
+
+    def sync(self) -> bool:
+        """
+        Aplica ao espelho as mudanças da coleção desde a última sincronização
+
+        Returns:
+            True se algum documento foi incluído, alterado ou removido
+        """
+        with self._lock:
+            query = {} if self._watermark is None else {"updated_at": {"$gt": self._watermark}}
+            seen, changed = self._apply(self.collection.find(query, _PROJECTION))
+            if self.synced and (changed or self.collection.count_documents({}) != len(self._docs)):
+                # Remoções não aparecem no filtro por updated_at, e inserções com o mesmo
+                # updated_at do último visto (gravadas durante a leitura) também não: confere os _id
+                alive = {d["_id"] for d in self.collection.find({}, {"_id": 1}).batch_size(self.batch_size)}
+                removed = [k for k in self._docs if k not in alive]
+                for k in removed:
+                    del self._docs[k]
+                added = [k for k in alive if k not in self._docs]
+                if added:
+                    n, _ = self._apply(self.collection.find({"_id": {"$in": added}}, _PROJECTION))
+                    seen += n
+                changed = changed or bool(removed) or bool(added)
+            if not self.synced:
+                changed = True
+            self.synced = True
+            if changed:
+                self.version += 1
+                logger.info("Corpus %s sincronizado: %d documentos lidos, %d no total", self.label, seen, len(self._docs))
+            return changed
+
+    def _apply(self, cursor) -> tuple[int, bool]:
+        """Aplica ao espelho os documentos do cursor; retorna (lidos, houve mudança)"""
+        seen, changed = 0, False
+        for doc in cursor.batch_size(self.batch_size):
+            seen += 1
+            _id = doc.pop("_id")
+            if self._docs.get(_id) != doc:
+                self._docs[_id] = doc
+                changed = True
+            ts = doc.get("updated_at")
+            if ts is not None and (self._watermark is None or ts > self._watermark):
+                self._watermark = ts
+        return seen, changed
+
+    def ensure_synced(self):
+        """Sincroniza uma vez (carga a frio); depois disso só o watcher sincroniza"""
+        if not self.synced:
+            self.sync()
+
+    def documents(self) -> list[dict]:
+        """Documentos do espelho, na ordem de 'position' (ordem do contexto.json no dataload)"""
+        with self._lock:
+            items = list(self._docs.items())
+        items.sort(key=lambda kv: (kv[1].get("position", float("inf")), str(kv[0])))
+        return [doc for _, doc in items]
+
+    def stored_vectors(self, hashes, model: str) -> dict[str, list]:
+        """
+        Embeddings gravados na coleção para os chunks pedidos
+
+        Args:
+            hashes: Hashes dos chunks que faltam no cache local
+            model: Modelo de embeddings esperado (vetores de outro modelo são ignorados)
+        Returns:
+            Mapa hash do chunk -> vetor
+        """
+        wanted = set(hashes)
+        if not wanted:
+            return {}
+        out: dict[str, list] = {}
+        cursor = self.collection.find(
+            {"chunk_hashes": {"$in": sorted(wanted)}, "embedding_model": model},
+            {"chunk_hashes": 1, "chunk_embeddings": 1},
+        ).batch_size(self.batch_size)
+        for doc in cursor:
+            for h, vec in zip(doc.get("chunk_hashes") or [], doc.get("chunk_embeddings") or []):
+                if h in wanted and vec:
+                    out[h] = vec
+        return out
@@ -0,0 +1,181 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from langchain.prompts.few_shot import FewShotChatMessagePromptTemplate
+from langchain_core.prompts import (
+    ChatPromptTemplate,
+    MessagesPlaceholder,
+    HumanMessagePromptTemplate,
+    AIMessagePromptTemplate,
+)
+
+"""
+Registro dos prompts dos agentes
+Cada prompt corresponde a uma pasta de prompts/ (system_prompt*.txt e
+fewshot.json opcional). Os arquivos são lidos e o ChatPromptTemplate é montado
+uma única vez, quando o agente registra o prompt; as requisições só consultam
+o dicionário. Com SINARA_PROMPT_WATCH_INTERVAL > 0, uma thread recompila os
+prompts cujos arquivos mudaram e troca a referência (sem reiniciar o serviço).
+"""
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = Path(__file__).resolve().parents[1] / "prompts"
+
+# Segundos entre verificações dos arquivos de prompt (0 desativa a recarga)
+PROMPT_WATCH_INTERVAL = float(os.getenv("SINARA_PROMPT_WATCH_INTERVAL", "0"))
+
+_EXAMPLE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        HumanMessagePromptTemplate.from_template("{human}"),
+        AIMessagePromptTemplate.from_template("{ai}"),
+    ]
+)
+
+_lock = threading.Lock()
+_layouts: dict[str, dict] = {}  # Nome -> mensagem humana e uso de memória
+_prompts: dict[str, ChatPromptTemplate] = {}  # Nome -> template compilado
+_mtimes: dict[str, tuple] = {}  # Nome -> mtimes dos arquivos usados na compilação
+_versions: dict[str, int] = {}  # Nome -> número de compilações (muda a cada recarga)
+_watcher_lock = threading.Lock()
+_watcher_stop = threading.Event()
+_watcher: threading.Thread | None = None
+
+
+def _prompt_files(name: str) -> tuple[Path, Path | None]:
+    """(prompt de sistema, few-shots ou None) da pasta prompts/<name>"""
+    folder = PROMPTS_DIR / name
+    systems = sorted(folder.glob("system_prompt*.txt"))
+    if not systems:
+        raise FileNotFoundError(f"Prompt de sistema não encontrado em {folder}")
+    fewshot = folder / "fewshot.json"
+    return systems[0], fewshot if fewshot.exists() else None
+
+
+def _file_mtimes(name: str) -> tuple:
+    return tuple(os.path.getmtime(p) for p in _prompt_files(name) if p is not None)
+
+
+def _compile(name: str, layout: dict) -> ChatPromptTemplate:
+    """Lê os arquivos do prompt e monta o template: sistema, few-shots, memória e mensagem humana"""
+    system_path, fewshot_path = _prompt_files(name)
+    with open(system_path, "r", encoding="utf-8") as f:
+        messages = [("system", f.read())]
+    if fewshot_path is not None:
+        with open(fewshot_path, "r", encoding="utf-8-sig") as f:
+            raw_shots = json.load(f)
+        examples = [{"human": ex.get("human", ""), "ai": ex.get("ai", "")} for ex in raw_shots]
+        messages.append(FewShotChatMessagePromptTemplate(examples=examples, example_prompt=_EXAMPLE_PROMPT))
+    if layout["memory"]:
+        messages.append(MessagesPlaceholder("memory"))
+    messages.append(("human", layout["human"]))
+    return ChatPromptTemplate.from_messages(messages)
+
+
+def register_prompt(name: str, human: str, memory: bool = True) -> ChatPromptTemplate:
+    """
+    Registra e compila o prompt de um agente (chamado na importação do agente)
+
+    Args:
+        name: Pasta em prompts/ (ex.: "judge", "rag/tecnico")
+        human: Template da mensagem humana
+        memory: Incluir o histórico da sessão (variável "memory")
+    Returns:
+        Template compilado
+    """
+    layout = {"human": human, "memory": memory}
+    with _lock:
+        if _layouts.get(name) == layout and name in _prompts:
+            return _prompts[name]
+        mtimes = _file_mtimes(name)
+        prompt = _compile(name, layout)
+        _layouts[name] = layout
+        _mtimes[name] = mtimes
+        _prompts[name] = prompt
+        _versions[name] = _versions.get(name, 0) + 1
+    start_prompt_watcher()
+    return prompt
+
+
+def get_prompt(name: str) -> ChatPromptTemplate:
+    """Template compilado do prompt (sem I/O); KeyError se não foi registrado"""
+    prompt = _prompts.get(name)
+    if prompt is None:
+        raise KeyError(f"prompt não registrado: {name}")
+    return prompt
+
+
+def prompt_version(name: str) -> int:
+    """Versão do prompt compilado (incrementada a cada recarga; 0 se não registrado)"""
+    return _versions.get(name, 0)
+
+
+def registered_prompts() -> list[str]:
+    return sorted(_prompts)
+
+
+def reload_prompts(force: bool = False) -> list[str]:
+    """
+    Recompila os prompts cujos arquivos mudaram (ou todos, com force)
+    Um prompt com erro (ex.: JSON inválido durante a edição) mantém a versão atual
+
+    Returns:
+        Nomes dos prompts recarregados
+    """
+    reloaded = []
+    for name, layout in list(_layouts.items()):
+        try:
+            mtimes = _file_mtimes(name)
+            if not force and mtimes == _mtimes.get(name):
+                continue
+            prompt = _compile(name, layout)
+            with _lock:
+                _prompts[name] = prompt
+                _mtimes[name] = mtimes
+                _versions[name] = _versions.get(name, 0) + 1
+            reloaded.append(name)
+            logger.info("Prompt '%s' recarregado", name)
+        except Exception:
+            logger.warning("Falha ao recarregar o prompt '%s'; mantendo o atual", name, exc_info=True)
+    return reloaded
+
+
+def _watch_loop(interval: float):
+    while not _watcher_stop.wait(interval):
+        reload_prompts()
+
+
+def start_prompt_watcher(interval: float | None = None) -> bool:
+    """
+    Inicia (uma vez) a thread que observa os arquivos de prompt
+
+    Args:
+        interval: Segundos entre verificações (padrão: SINARA_PROMPT_WATCH_INTERVAL; 0 desativa)
+    Returns:
+        True se o watcher está rodando
+    """
+    global _watcher
+    interval = PROMPT_WATCH_INTERVAL if interval is None else float(interval)
+    if interval <= 0:
+        return False
+    with _watcher_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher_stop.clear()
+            _watcher = threading.Thread(
+                target=_watch_loop, args=(interval,), name="sinara-prompt-watcher", daemon=True
+            )
+            _watcher.start()
+    return True
+
+
+def stop_prompt_watcher(timeout: float | None = 5.0):
+    """Encerra a thread do watcher (se estiver rodando)"""
+    global _watcher
+    with _watcher_lock:
+        watcher, _watcher = _watcher, None
+        _watcher_stop.set()
+    if watcher is not None:
+        watcher.join(timeout)
@@ -1,9 +1,21 @@
 from dotenv import load_dotenv
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from pathlib import Path
+from ..utils.ttl_cache import TTLCache
+from .ann_index import IVFIndex, recall_at_k
+from .llm_factory import get_embeddings
+from .index_snapshot import Snapshot, file_sha256, load_snapshot, write_snapshot
+from .mongo_corpus import MongoCorpus
+from .rate_limiter import PRIORITY_LOW, call_priority
+from .vector_store import VECTOR_DTYPES, DenseVectors, ExactRows, QuantizedVectors
+from dataclasses import dataclass, field
+import hashlib
+import heapq
 import json
+import logging
 import numpy as np
 import os
+import threading
 import time
 import unicodedata
 import re
@@ -14,18 +26,75 @@ Este módulo implementa a recuperação de contextos similares para consultas,
 usando embeddings do Google AI quando disponível ou BM25 como fallback offline.
 """
 
+logger = logging.getLogger(__name__)
+
+# Modelo de embeddings usado para query e corpus
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+# Cache em disco dos vetores do corpus (chave: hash do chunk + modelo)
+_EMB_CACHE_DIR = Path(
+    os.getenv("SINARA_EMB_CACHE_DIR")
+    or Path(__file__).resolve().parents[1] / "db_script" / ".cache"
+)
+_EMB_BATCH_SIZE = max(1, int(os.getenv("SINARA_EMB_BATCH_SIZE", "100")))
+
+# Modo de recuperação:
+#   auto   -> embeddings sobre chunks quando há chave de API; BM25 por documento como fallback
+#   hybrid -> BM25 e embeddings sobre os mesmos chunks, rankings fundidos (RRF ou ponderado)
+#   bm25   -> apenas BM25 por documento (offline)
+RAG_MODE = (os.getenv("SINARA_RAG_MODE") or "auto").strip().lower()
+RAG_FUSION = (os.getenv("SINARA_RAG_FUSION") or "weighted").strip().lower()  # rrf | weighted
+RAG_HYBRID_ALPHA = float(os.getenv("SINARA_RAG_HYBRID_ALPHA", "0.5"))  # peso do vetor na fusão ponderada
+RAG_RRF_K = float(os.getenv("SINARA_RAG_RRF_K", "60"))
+
+# Índice aproximado (ANN) para bases grandes: "" (busca exata) | "ivf"
+ANN_BACKEND = (os.getenv("SINARA_ANN") or "").strip().lower()
+ANN_MIN_CHUNKS = int(os.getenv("SINARA_ANN_MIN_CHUNKS", "20000"))  # abaixo disso, busca exata
+ANN_NLIST = int(os.getenv("SINARA_ANN_NLIST", "0")) or None  # None = 4 * sqrt(n)
+ANN_NPROBE = int(os.getenv("SINARA_ANN_NPROBE", "8"))
+
+# Armazenamento dos vetores do corpus: float32 | float16 | int8
+# (quantizados: busca aproximada + re-pontuação exata dos RESCORE * k melhores)
+VECTOR_DTYPE = (os.getenv("SINARA_VECTOR_DTYPE") or "float32").strip().lower()
+if VECTOR_DTYPE not in VECTOR_DTYPES:
+    logger.warning("SINARA_VECTOR_DTYPE inválido (%s); usando float32", VECTOR_DTYPE)
+    VECTOR_DTYPE = "float32"
+VECTOR_RESCORE = max(1, int(os.getenv("SINARA_VECTOR_RESCORE", "4")))
+
+# Snapshot pré-compilado do índice (db_script/build_index.py), carregado via mmap na carga a frio
+INDEX_SNAPSHOT_DIR = Path(os.getenv("SINARA_INDEX_SNAPSHOT_DIR") or _EMB_CACHE_DIR / "snapshots")
+USE_INDEX_SNAPSHOT = os.getenv("SINARA_INDEX_SNAPSHOT", "1").strip().lower() in ("1", "true", "on")
+
+# Fonte do corpus: json (db_script/contexto.json) | mongo (coleção gravada pelo db_script/dataload.py,
+# com os embeddings dos chunks; sincronizada pelo watcher via updated_at)
+CORPUS_SOURCE = (os.getenv("SINARA_CORPUS_SOURCE") or "json").strip().lower()
+CORPUS_COLLECTION = os.getenv("SINARA_CORPUS_COLLECTION", "contexto")
+
+# K usado na recuperação única por requisição (maior K entre os consumidores)
+RETRIEVAL_TOP_K = max(1, int(os.getenv("SINARA_RETRIEVAL_TOP_K", "8")))
+
+# Cache LRU/TTL dos vetores de query (chave: modelo + query normalizada)
+_query_vec_cache = TTLCache(
+    maxsize=int(os.getenv("SINARA_QUERY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SINARA_QUERY_CACHE_TTL", "3600")),
+)
+
+# Corpus padrão (namespace global "")
+_BASE_DIR = Path(__file__).resolve().parents[1]
+_DEFAULT_SOURCE = _BASE_DIR / "db_script" / "contexto.json"
+
 # Cache para otimização de performance
-_json_texts: list[str] = []  # Chunks de texto processados
-_json_vecs: list[np.ndarray] | None = None  # Vetores de embedding correspondentes
-_json_mtime: float | None = None  # Timestamp do arquivo para verificar mudanças
+_indexes: dict[str, "_CorpusIndex"] = {}  # Namespace -> índice carregado ("" = corpus global)
+_doc_entries: dict[str, "_DocEntry"] = {}  # Hash do documento -> estado processado (compartilhado)
+_mongo_corpora: dict[str, MongoCorpus] = {}  # Coleção -> espelho do corpus (SINARA_CORPUS_SOURCE=mongo)
 
-# Cache para busca offline (BM25)
-_raw_docs: list[dict] | None = None  # Documentos originais do JSON
-_doc_texts: list[str] | None = None  # Textos completos por documento
-_doc_tokens: list[list[str]] | None = None  # Tokens por documento
-_doc_lengths: list[int] | None = None  # Comprimento (em tokens) por documento
-_avgdl: float | None = None  # Comprimento médio dos documentos
-_df_map: dict[str, int] | None = None  # Mapa de frequência dos termos
+# Recarga em segundo plano: segundos entre verificações das fontes, JSON ou Mongo (0 desativa;
+# sem watcher o índice é carregado uma vez e não acompanha mudanças na fonte)
+INDEX_WATCH_INTERVAL = float(os.getenv("SINARA_INDEX_WATCH_INTERVAL", "5"))
+_load_lock = threading.Lock()  # Serializa construções de índice (carga a frio e watcher)
+_watcher_lock = threading.Lock()
+_watcher_stop = threading.Event()
+_watcher: threading.Thread | None = None
 
 
 def _normalize(s: str) -> str:
@@ -46,10 +115,17 @@ def _tokenize(s: str) -> list[str]:
     return re.findall(r"[a-z0-9]+", _normalize(s))
 
 
-def _chunk_text(text: str, chunk_size: int = 700, chunk_overlap: int = 150) -> list[str]:
+# Parâmetros de chunking do corpus (fazem parte da identidade de um snapshot)
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 150
+
+
+def _chunk_spans(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> list[tuple[int, int]]:
     """
     Divide texto em chunks menores com sobreposição
     Permite processamento de textos longos mantendo contexto
+    Retorna intervalos (início, fim) já sem espaços nas bordas, para que o
+    índice guarde só o texto do documento e fatie os chunks sob demanda
     
     Args:
         text: Texto a ser dividido
@@ -61,58 +137,180 @@ def _chunk_text(text: str, chunk_size: int = 700, chunk_overlap: int = 150) -> l
     text = str(text)
     chunk_size = max(200, int(chunk_size))
     chunk_overlap = max(0, min(int(chunk_overlap), chunk_size - 1))
-    chunks = []
+    spans = []
     start = 0
     n = len(text)
     while start < n:
         end = min(n, start + chunk_size)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
+        piece = text[start:end]
+        lead = len(piece) - len(piece.lstrip())
+        trail = len(piece) - len(piece.rstrip())
+        if lead < len(piece):
+            spans.append((start + lead, end - trail))
         if end == n:
             break
         start = end - chunk_overlap
-    return chunks
+    return spans
+
 
+def _chunk_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """Chunks de texto (ver _chunk_spans)"""
+    text = str(text or "")
+    return [text[a:b] for a, b in _chunk_spans(text, chunk_size, chunk_overlap)]
 
-def _build_offline_index(raw_list: list[dict]):
+
+class _BM25Index:
     """
-    Constrói índice offline para busca BM25
-    Usado quando embeddings não estão disponíveis
-    
-    Processa documentos calculando:
-    - Textos completos
-    - Tokens por documento
-    - Estatísticas para BM25 (comprimentos, frequências)
-    """
-    global _raw_docs, _doc_texts, _doc_tokens, _doc_lengths, _avgdl, _df_map
-    _raw_docs = raw_list
-    _doc_texts = []
-    _doc_tokens = []
-    _doc_lengths = []
-    df: dict[str, int] = {}
-    for d in raw_list:
-        if not isinstance(d, dict):
-            continue
-        # Concatena título, seção e conteúdo
-        title = d.get("title") or d.get("titulo") or ""
-        section = d.get("section") or d.get("secao") or ""
-        content = d.get("content") or d.get("conteudo") or ""
-        full = "\n".join(x for x in [title, section, content] if x)
-        _doc_texts.append(full)
-        # Tokeniza e calcula estatísticas
-        toks = _tokenize(full)
-        _doc_tokens.append(toks)
-        _doc_lengths.append(len(toks))
-        for t in set(toks):
-            df[t] = df.get(t, 0) + 1
-    _df_map = df
-    _avgdl = (sum(_doc_lengths) / len(_doc_lengths)) if _doc_lengths else 0.0
-
-
-def _bm25_scores(qtoks: list[str]) -> list[tuple[float, int]]:
-    """
-    Calcula scores BM25 para tokens da query
+    Índice invertido para BM25
+    Termos recebem ids inteiros; as postings ficam em formato CSR (offsets +
+    documentos + frequências em arrays NumPy contíguos, que podem vir de um
+    snapshot via mmap). IDF e normalização por comprimento são pré-calculados,
+    então a consulta só visita documentos que contêm algum termo da query.
+    """
+
+    def __init__(self, doc_counts: list[dict[str, int]], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            doc_counts: Frequência de cada termo, por documento (ver _term_counts)
+        """
+        self.k1 = k1  # Parâmetro de saturação de termo
+        self.b = b  # Parâmetro de normalização de comprimento
+        self.n_docs = len(doc_counts)
+        self.vocab: dict[str, int] = {}
+        doc_ids: list[list[int]] = []
+        tfs: list[list[int]] = []
+        lengths = np.zeros(self.n_docs, dtype="float32")
+        for i, counts in enumerate(doc_counts):
+            lengths[i] = sum(counts.values())
+            for t, tf in counts.items():
+                tid = self.vocab.get(t)
+                if tid is None:
+                    tid = self.vocab[t] = len(doc_ids)
+                    doc_ids.append([])
+                    tfs.append([])
+                doc_ids[tid].append(i)
+                tfs[tid].append(tf)
+        df = np.asarray([len(d) for d in doc_ids], dtype="int64")
+        self.post_offsets = np.concatenate(([0], np.cumsum(df))).astype("int64")
+        self.post_docs = np.fromiter((i for d in doc_ids for i in d), dtype="int32", count=int(df.sum()))
+        self.post_tfs = np.fromiter((f for fs in tfs for f in fs), dtype="float32", count=int(df.sum()))
+        self.idf = np.log((self.n_docs - df + 0.5) / (df + 0.5) + 1.0).astype("float32")
+        avgdl = float(lengths.mean()) if self.n_docs else 0.0
+        self.avgdl = avgdl
+        # Denominador sem o tf: k1 * (1 - b + b * dl / avgdl)
+        self.norm = (k1 * (1 - b + b * lengths / (avgdl or 1))).astype("float32")
+
+    @classmethod
+    def from_arrays(cls, terms: list[str], arrays: dict, params: dict) -> "_BM25Index":
+        """
+        Reconstrói o índice a partir de arrays já calculados (ver to_arrays)
+        Os arrays não são copiados: podem ser mmaps de um snapshot
+        """
+        self = cls.__new__(cls)
+        self.k1 = float(params["k1"])
+        self.b = float(params["b"])
+        self.avgdl = float(params["avgdl"])
+        self.n_docs = int(params["n_docs"])
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        for name in ("post_offsets", "post_docs", "post_tfs", "idf", "norm"):
+            setattr(self, name, arrays[name])
+        return self
+
+    def to_arrays(self) -> tuple[list[str], dict, dict]:
+        """(termos por id, arrays, parâmetros) para gravação em snapshot"""
+        terms = [""] * len(self.vocab)
+        for t, i in self.vocab.items():
+            terms[i] = t
+        arrays = {
+            "post_offsets": self.post_offsets,
+            "post_docs": self.post_docs,
+            "post_tfs": self.post_tfs,
+            "idf": self.idf,
+            "norm": self.norm,
+        }
+        params = {"k1": self.k1, "b": self.b, "avgdl": self.avgdl, "n_docs": self.n_docs}
+        return terms, arrays, params
+
+    def scores(self, qtoks: list[str]) -> dict[int, float]:
+        """
+        Scores BM25 apenas dos documentos que contêm algum termo da query
+
+        Args:
+            qtoks: Tokens da query (repetições contam múltiplas vezes)
+        Returns:
+            Mapa índice_documento -> score
+        """
+        qcounts: dict[int, int] = {}
+        for q in qtoks:
+            tid = self.vocab.get(q)
+            if tid is not None:
+                qcounts[tid] = qcounts.get(tid, 0) + 1
+        acc: dict[int, float] = {}
+        k1p = self.k1 + 1
+        for tid, qtf in qcounts.items():
+            a, b = int(self.post_offsets[tid]), int(self.post_offsets[tid + 1])
+            docs, tf = self.post_docs[a:b], self.post_tfs[a:b]
+            contrib = (qtf * self.idf[tid]) * (tf * k1p) / (tf + self.norm[docs])
+            for d, c in zip(docs.tolist(), contrib.tolist()):
+                acc[d] = acc.get(d, 0.0) + c
+        return acc
+
+    def top_k(self, qtoks: list[str], k: int) -> list[tuple[float, int]]:
+        """
+        Retorna os k documentos de maior score BM25 (heap, sem ordenar todos)
+
+        Args:
+            qtoks: Tokens da query (repetições contam múltiplas vezes)
+            k: Número de resultados
+        Returns:
+            Lista de (score, índice_documento) em ordem decrescente
+        """
+        return _heap_top_k(self.scores(qtoks), k)
+
+
+def _term_counts(tokens: list[str]) -> dict[str, int]:
+    """Frequência de cada termo em uma lista de tokens"""
+    counts: dict[str, int] = {}
+    for t in tokens:
+        counts[t] = counts.get(t, 0) + 1
+    return counts
+
+
+@dataclass
+class _DocEntry:
+    """
+    Estado derivado de um documento, reaproveitado entre recargas do corpus
+    Indexado pelo hash do texto completo: documentos inalterados não são
+    re-chunkados nem re-tokenizados
+    """
+    text: str
+    spans: list[tuple[int, int]]  # Chunks como intervalos de 'text'
+    chunk_hashes: list[str]
+    counts: dict[str, int]  # Termos do documento inteiro (BM25 por documento)
+    chunk_counts: list[dict[str, int]]  # Termos de cada chunk (BM25 híbrido)
+
+
+def _make_doc_entry(full: str) -> "_DocEntry":
+    spans = _chunk_spans(full)
+    chunks = [full[a:b] for a, b in spans]
+    return _DocEntry(
+        text=full,
+        spans=spans,
+        chunk_hashes=[_text_hash(c) for c in chunks],
+        counts=_term_counts(_tokenize(full)),
+        chunk_counts=[_term_counts(_tokenize(c)) for c in chunks],
+    )
+
+
+def _heap_top_k(scores: dict[int, float], k: int) -> list[tuple[float, int]]:
+    """Top-k de um mapa índice -> score via heap (empates: menor índice primeiro)"""
+    best = heapq.nlargest(k, scores.items(), key=lambda x: (x[1], -x[0]))
+    return [(float(sc), i) for i, sc in best]
+
+
+def _bm25_scores(qtoks: list[str], top_k: int, index: "_BM25Index | None") -> list[tuple[float, int]]:
+    """
+    Calcula os top_k scores BM25 para tokens da query
     BM25 é um algoritmo de ranking que considera:
     - Frequência do termo (TF)
     - Frequência inversa nos documentos (IDF)
@@ -120,137 +318,1188 @@ def _bm25_scores(qtoks: list[str]) -> list[tuple[float, int]]:
     
     Args:
         qtoks: Tokens da query
+        top_k: Número de documentos a retornar
+        index: Índice a consultar (documentos; no modo híbrido, chunks)
     Returns:
-        Lista de (score, índice_documento)
+        Lista de (score, índice_documento) ordenada por relevância;
+        completada com documentos de score 0 (na ordem original) se
+        menos de top_k documentos contiverem termos da query
     """
-    if not _doc_tokens or _avgdl is None or _df_map is None:
+    if index is None or not index.n_docs or top_k <= 0:
         return []
-    N = len(_doc_tokens)
-    k1 = 1.5  # Parâmetro de saturação de termo
-    b = 0.75  # Parâmetro de normalização de comprimento
-    scores = [0.0] * N
-    for i, toks in enumerate(_doc_tokens):
-        if not toks:
+    top_k = min(top_k, index.n_docs)
+    scores = index.top_k(qtoks, top_k)
+    if len(scores) < top_k:
+        seen = {i for _, i in scores}
+        for i in range(index.n_docs):
+            if len(scores) >= top_k:
+                break
+            if i not in seen:
+                scores.append((0.0, i))
+    return scores
+
+
+def _text_hash(text: str) -> str:
+    """Hash estável do conteúdo de um chunk (chave do cache de embeddings)"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _emb_cache_paths(model: str) -> tuple[Path, Path]:
+    """Caminhos (vetores .npy, chaves .json) do cache de um modelo"""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", model).strip("_") or "default"
+    return _EMB_CACHE_DIR / f"{slug}.npy", _EMB_CACHE_DIR / f"{slug}.keys.json"
+
+
+def _load_emb_cache(model: str) -> tuple[list[str], np.ndarray | None]:
+    """
+    Carrega o cache de embeddings do modelo via mmap (somente leitura)
+    Retorna (hashes, matriz) ou ([], None) se não existir ou estiver inconsistente
+    """
+    vec_path, keys_path = _emb_cache_paths(model)
+    if not vec_path.exists() or not keys_path.exists():
+        return [], None
+    try:
+        with open(keys_path, "r", encoding="utf-8") as f:
+            keys = json.load(f)
+        vecs = np.load(vec_path, mmap_mode="r")
+        # O cache só cresce por append: as chaves podem ser um prefixo das linhas
+        if not isinstance(keys, list) or vecs.ndim != 2 or len(keys) > vecs.shape[0]:
+            return [], None
+        return keys, vecs
+    except Exception:
+        logger.warning("Cache de embeddings ilegível em %s; ignorando", vec_path)
+        return [], None
+
+
+def _save_emb_cache(model: str, keys: list[str], vecs: np.ndarray):
+    """Grava o cache de forma atômica (arquivo temporário + os.replace)"""
+    vec_path, keys_path = _emb_cache_paths(model)
+    try:
+        _EMB_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_vec = vec_path.with_name(f"{vec_path.stem}.{os.getpid()}.tmp.npy")
+        tmp_keys = keys_path.with_name(f"{keys_path.name}.{os.getpid()}.tmp")
+        np.save(tmp_vec, np.ascontiguousarray(vecs, dtype="float32"))
+        with open(tmp_keys, "w", encoding="utf-8") as f:
+            json.dump(keys, f)
+        # Vetores antes das chaves: leitores nunca veem chaves sem linha correspondente
+        os.replace(tmp_vec, vec_path)
+        os.replace(tmp_keys, keys_path)
+    except Exception:
+        logger.warning("Falha ao gravar cache de embeddings em %s", vec_path, exc_info=True)
+
+
+def _extend_emb_cache(
+    model: str, keys: list[str], cached: np.ndarray | None, new_keys: list[str], fresh: np.ndarray
+) -> tuple[list[str], np.ndarray]:
+    """
+    Acrescenta vetores ao cache em disco (se a dimensão mudou, o cache é substituído)
+
+    Returns:
+        (chaves, matriz) gravadas
+    """
+    if cached is not None and cached.shape[1] == fresh.shape[1]:
+        store = np.vstack([np.asarray(cached[:len(keys)]), fresh])
+        keys = keys + new_keys
+    else:
+        store, keys = fresh, list(new_keys)
+    _save_emb_cache(model, keys, store)
+    return keys, store
+
+
+def _embed_corpus(emb, texts: list[str], model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Gera a matriz de embeddings dos chunks reaproveitando o cache em disco
+    Apenas chunks novos ou alterados são enviados à API, em lotes (embed_documents)
+
+    Args:
+        emb: Cliente de embeddings (GoogleGenerativeAIEmbeddings)
+        texts: Chunks de texto do corpus
+        model: Nome do modelo (parte da chave do cache)
+    Returns:
+        Matriz float32 (len(texts), dim), uma linha por chunk
+    """
+    hashes = [_text_hash(t) for t in texts]
+    keys, cached = _load_emb_cache(model)
+    row_of = {h: i for i, h in enumerate(keys)}
+
+    missing: list[str] = []
+    missing_texts: list[str] = []
+    seen: set[str] = set()
+    for h, t in zip(hashes, texts):
+        if h not in row_of and h not in seen:
+            seen.add(h)
+            missing.append(h)
+            missing_texts.append(t)
+
+    new_vecs: list[np.ndarray] = []
+    # Indexação do corpus cede a cota de embeddings às queries das requisições
+    with call_priority(PRIORITY_LOW):
+        for start in range(0, len(missing_texts), _EMB_BATCH_SIZE):
+            batch = missing_texts[start:start + _EMB_BATCH_SIZE]
+            out = emb.embed_documents(batch)
+            new_vecs.extend(np.asarray(v, dtype="float32").ravel() for v in out)
+
+    if new_vecs:
+        logger.info("Embeddings do corpus: %d novos, %d do cache", len(missing), len(texts) - len(missing))
+        keys, store = _extend_emb_cache(model, keys, cached, missing, np.vstack(new_vecs))
+        row_of = {h: i for i, h in enumerate(keys)}
+    else:
+        store = cached
+
+    if store is None or not texts:
+        return np.zeros((0, 0), dtype="float32")
+    return np.asarray(store[[row_of[h] for h in hashes]], dtype="float32")
+
+
+def _exact_rows(hashes: list[str], model: str = EMBEDDING_MODEL) -> ExactRows | None:
+    """
+    Vetores float32 exatos dos chunks, lidos por mmap do cache em disco
+    (usados na re-pontuação dos vetores quantizados); None se faltar algum
+    """
+    keys, cached = _load_emb_cache(model)
+    if cached is None:
+        return None
+    row_of = {h: i for i, h in enumerate(keys)}
+    try:
+        return ExactRows(cached, np.fromiter((row_of[h] for h in hashes), dtype="int64", count=len(hashes)))
+    except KeyError:
+        return None
+
+
+def _query_cache_key(query: str) -> str:
+    """Normaliza a query para o cache (espaços colapsados, minúsculas)"""
+    return " ".join(str(query or "").split()).lower()
+
+
+def _embed_query(emb, query: str, model: str = EMBEDDING_MODEL) -> np.ndarray:
+    """
+    Embedding da query com cache LRU/TTL
+    Consultas repetidas (ou concorrentes) da mesma pergunta custam uma chamada à API
+    A chave é normalizada, mas o texto enviado à API é o da query original
+    (siglas e códigos mantêm a caixa)
+    """
+    key = _query_cache_key(query)
+
+    def compute() -> np.ndarray:
+        vec = np.asarray(emb.embed_query(query), dtype="float32").ravel()
+        vec.setflags(write=False)
+        return vec
+
+    return _query_vec_cache.get_or_set((model, key), compute)
+
+
+def query_cache_stats() -> dict:
+    """Métricas do cache de embeddings de query (hits, misses, hit_rate...)"""
+    return _query_vec_cache.stats()
+
+
+def query_vector(query: str) -> np.ndarray | None:
+    """
+    Embedding da query (normalmente já no cache, calculado pelo retrieve)
+
+    Returns:
+        Vetor da query, ou None sem chave de API ou se o embedding falhar
+    """
+    emb = _embeddings_client()
+    if emb is None:
+        return None
+    try:
+        return _embed_query(emb, query)
+    except Exception:
+        logger.warning("Embedding da query indisponível", exc_info=True)
+        return None
+
+
+def _l2_normalize(mat: np.ndarray) -> np.ndarray:
+    """
+    Normaliza (L2) cada linha da matriz, retornando cópia float32 contígua
+    Linhas de norma zero permanecem zeradas (similaridade 0 com qualquer query)
+    """
+    mat = np.ascontiguousarray(mat, dtype="float32")
+    if mat.ndim == 1:
+        mat = mat.reshape(1, -1)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return mat / norms
+
+
+def _doc_full_text(d: dict) -> str:
+    """Concatena título, seção e conteúdo de um documento do corpus"""
+    title = d.get("title") or d.get("titulo") or ""
+    section = d.get("section") or d.get("secao") or ""
+    content = d.get("content") or d.get("conteudo") or ""
+    return "\n".join(x for x in [title, section, content] if x)
+
+
+def _doc_section(d: dict) -> str:
+    """Seção normalizada de um documento (chave de filtro dos namespaces)"""
+    return _normalize(d.get("section") or d.get("secao") or "").strip()
+
+
+def _parse_namespaces(raw: str | None) -> dict[str, dict]:
+    """
+    Interpreta SINARA_RAG_NAMESPACES (JSON): nome -> lista de seções, ou
+    {"sections": [...], "source": "caminho/relativo.json"} ou
+    {"sections": [...], "collection": "coleção do MongoDB"}
+
+    Com SINARA_CORPUS_SOURCE=mongo, namespaces sem "source" leem da coleção
+    SINARA_CORPUS_COLLECTION; um "source" explícito continua vindo do JSON.
+
+    Exemplo:
+        {"tecnico": ["Funcionalidades", "Cadastro"],
+         "faq": {"source": "db_script/faq.json"}}
+
+    Returns:
+        Mapa nome -> {"sections": frozenset | None, "source": Path, "collection": str | None}
+    """
+    if not raw or not raw.strip():
+        return {}
+    try:
+        data = json.loads(raw)
+    except json.JSONDecodeError:
+        logger.warning("SINARA_RAG_NAMESPACES inválido (JSON); namespaces desabilitados")
+        return {}
+    if not isinstance(data, dict):
+        logger.warning("SINARA_RAG_NAMESPACES deve ser um objeto JSON; namespaces desabilitados")
+        return {}
+    out: dict[str, dict] = {}
+    for name, spec in data.items():
+        name = str(name).strip().lower()
+        if not name:
             continue
-        dl = _doc_lengths[i] or 1
-        for q in qtoks:
-            df = _df_map.get(q, 0)
-            if df == 0:
-                continue
-            # Calcula IDF
-            idf = float(np.log((N - df + 0.5) / (df + 0.5) + 1.0))
-            # Calcula TF normalizado
-            tf = toks.count(q)
-            if tf == 0:
-                continue
-            denom = tf + k1 * (1 - b + b * dl / (_avgdl or 1))
-            scores[i] += idf * (tf * (k1 + 1)) / denom
-    return [(scores[i], i) for i in range(N)]
-
-
-def _ensure_loaded():
-    """
-    Garante que dados estão carregados e atualizados
-    Recarrega se arquivo fonte foi modificado
-    """
-    global _json_texts, _json_vecs, _json_mtime
-    base = Path(__file__).resolve().parents[1]
-    ctx_path = base / "db_script" / "contexto.json"
-    mtime = os.path.getmtime(ctx_path)
-    if (not _json_texts) or (_json_mtime is None) or (mtime != _json_mtime):
-        with open(ctx_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        raw_list = data if isinstance(data, list) else []
-        texts: list[str] = []
-        for d in raw_list:
-            if not isinstance(d, dict):
+        if isinstance(spec, (list, str)):
+            spec = {"sections": spec}
+        if not isinstance(spec, dict):
+            logger.warning("Namespace '%s' ignorado: especificação inválida", name)
+            continue
+        sections = spec.get("sections")
+        if isinstance(sections, str):
+            sections = [sections]
+        source = Path(spec.get("source") or _DEFAULT_SOURCE)
+        if not source.is_absolute():
+            source = _BASE_DIR / source
+        collection = spec.get("collection")
+        if not collection and CORPUS_SOURCE == "mongo" and not spec.get("source"):
+            collection = CORPUS_COLLECTION
+        out[name] = {
+            "sections": frozenset(_normalize(s).strip() for s in sections) if sections else None,
+            "source": source,
+            "collection": collection or None,
+        }
+    return out
+
+
+# Namespaces de recuperação por agente; agentes sem namespace usam o corpus global
+RAG_NAMESPACES = _parse_namespaces(os.getenv("SINARA_RAG_NAMESPACES"))
+
+
+def _prefixed(arrays: dict, prefix: str) -> dict:
+    """Subconjunto de arrays com o prefixo dado (prefixo removido das chaves)"""
+    return {k[len(prefix):]: v for k, v in arrays.items() if k.startswith(prefix)}
+
+
+class _CorpusIndex:
+    """
+    Índices de um corpus (namespace): textos, BM25 por documento e por chunk,
+    matriz de vetores e índice ANN opcional
+    Cada namespace tem o seu, então a consulta só pontua documentos do domínio
+
+    Depois de publicado em _indexes o índice não muda, exceto pela matriz de
+    vetores, montada uma única vez (sob self._lock) e publicada por atribuição
+    """
+
+    def __init__(
+        self,
+        name: str,
+        positions: list[int],
+        entries: list[_DocEntry],
+        doc_hashes: list[str],
+        version: float,
+        prev: "_CorpusIndex | None" = None,
+        hybrid: bool | None = None,
+    ):
+        """
+        Args:
+            name: Nome do namespace ("" = global)
+            positions: Posição de cada documento no arquivo fonte
+            entries: Documentos processados, na ordem do arquivo
+            doc_hashes: Hash de cada documento (chave em _doc_entries)
+            version: Versão da fonte (mtime do JSON ou versão do corpus Mongo)
+            prev: Índice anterior do mesmo namespace (vetores reaproveitados)
+            hybrid: Construir o BM25 por chunk (padrão: SINARA_RAG_MODE == "hybrid")
+        """
+        self.name = name
+        self.version = version
+        self.doc_hashes = set(doc_hashes)
+        self.doc_pos = positions
+        self.doc_texts = [e.text for e in entries]
+        self.bm25 = _BM25Index([e.counts for e in entries])
+
+        # Chunks como intervalos do texto do documento (sem cópia do texto)
+        self.chunk_hashes: list[str] = []  # Hash de cada chunk (chave dos vetores)
+        spans: list[tuple[int, int]] = []
+        chunk_doc: list[int] = []
+        for d, e in enumerate(entries):
+            spans.extend(e.spans)
+            self.chunk_hashes.extend(e.chunk_hashes)
+            chunk_doc.extend([d] * len(e.spans))
+        self.n_chunks = len(spans)
+        self._chunk_doc = np.asarray(chunk_doc, dtype="int32")  # Documento (índice em doc_texts) de cada chunk
+        self._chunk_span = np.asarray(spans, dtype="int32").reshape(-1, 2)
+        if hybrid is None:
+            hybrid = RAG_MODE == "hybrid"
+        self.chunk_bm25 = _BM25Index([c for e in entries for c in e.chunk_counts]) if hybrid else None
+
+        self._init_vectors(prev)
+        # Sem chunks novos, a matriz é remontada agora, sem chamar a API
+        self.assemble_vectors(None)
+
+    def _init_vectors(self, prev: "_CorpusIndex | None"):
+        self.vecs: DenseVectors | QuantizedVectors | None = None  # Vetores (n_chunks, dim) normalizados (L2)
+        self.ann: IVFIndex | None = None  # Índice ANN sobre vecs (quando habilitado)
+        self._lock = threading.Lock()  # Single-flight da montagem dos vetores
+        # Vetores já calculados continuam válidos para chunks de mesmo hash
+        self._prev_vecs: DenseVectors | QuantizedVectors | None = None
+        self._prev_rows: dict[str, int] = {}
+        if prev is not None and prev.vecs is not None:
+            self._prev_vecs = prev.vecs
+            self._prev_rows = {h: i for i, h in enumerate(prev.chunk_hashes)}
+        elif prev is not None:
+            self._prev_vecs, self._prev_rows = prev._prev_vecs, prev._prev_rows
+
+    @classmethod
+    def from_snapshot(cls, name: str, snap: Snapshot, version: float) -> "_CorpusIndex":
+        """
+        Monta o índice sobre um snapshot pré-compilado (db_script/build_index.py)
+        Textos, postings e vetores continuam nos mmaps do snapshot: nada é
+        re-chunkado, re-tokenizado nem copiado para a memória do processo
+        """
+        self = cls.__new__(cls)
+        a, st = snap.arrays, snap.strings
+        self.name = name
+        self.version = version
+        self.doc_hashes = set(st["doc_hashes"])
+        self.doc_pos = a["doc_pos"]
+        self.doc_texts = snap.texts
+        self.bm25 = _BM25Index.from_arrays(
+            st["doc_terms"], _prefixed(a, "bm25_doc_"), snap.manifest["doc_bm25"]
+        )
+        self.chunk_hashes = st["chunk_hashes"]
+        self.n_chunks = len(self.chunk_hashes)
+        self._chunk_doc = a["chunk_doc"]
+        self._chunk_span = a["chunk_span"]
+        self.chunk_bm25 = None
+        if RAG_MODE == "hybrid":
+            self.chunk_bm25 = _BM25Index.from_arrays(
+                st["chunk_terms"], _prefixed(a, "bm25_chunk_"), snap.manifest["chunk_bm25"]
+            )
+        self._init_vectors(None)
+        vectors = a.get("vectors")
+        if vectors is not None and vectors.shape[0] == self.n_chunks:
+            self._set_vectors(vectors, ExactRows(vectors, np.arange(self.n_chunks)))
+        return self
+
+    def snapshot_payload(self) -> tuple[dict, dict, dict]:
+        """(arrays, strings, metadados) para write_snapshot"""
+        doc_terms, doc_arrays, doc_params = self.bm25.to_arrays()
+        arrays = {f"bm25_doc_{k}": v for k, v in doc_arrays.items()}
+        arrays.update(
+            doc_pos=np.asarray(self.doc_pos, dtype="int64"),
+            chunk_doc=self._chunk_doc,
+            chunk_span=self._chunk_span,
+        )
+        strings = {
+            "doc_terms": doc_terms,
+            "doc_hashes": sorted(self.doc_hashes),
+            "chunk_hashes": list(self.chunk_hashes),
+        }
+        meta = {"doc_bm25": doc_params, "n_docs": len(self.doc_texts), "n_chunks": self.n_chunks}
+        if self.chunk_bm25 is not None:
+            chunk_terms, chunk_arrays, chunk_params = self.chunk_bm25.to_arrays()
+            arrays.update({f"bm25_chunk_{k}": v for k, v in chunk_arrays.items()})
+            strings["chunk_terms"] = chunk_terms
+            meta["chunk_bm25"] = chunk_params
+        if self.vecs is not None:
+            arrays["vectors"] = self.vecs.take(np.arange(self.n_chunks))
+            meta["dim"] = self.vecs.dim
+        return arrays, strings, meta
+
+    def assemble_vectors(self, emb) -> bool:
+        """
+        Monta a matriz de vetores dos chunks atuais
+        Reaproveita linhas da matriz anterior (por hash) e só gera embeddings
+        (via cache em disco / API) para os chunks que faltam
+
+        Args:
+            emb: Cliente de embeddings, ou None para montar apenas se nada faltar
+        Returns:
+            True se self.vecs está pronto
+        """
+        if self.vecs is not None:
+            return True
+        # Requisições concorrentes esperam a primeira montagem em vez de repetir o embedding
+        with self._lock:
+            if self.vecs is not None:
+                return True
+            return self._assemble_locked(emb)
+
+    def chunk_text(self, i: int) -> str:
+        d = int(self._chunk_doc[i])
+        a, b = self._chunk_span[i]
+        return self.doc_texts[d][a:b]
+
+    def contains_texts(self, hashes) -> bool:
+        """Se todos os hashes (de chunks ou de documentos inteiros) existem neste índice"""
+        known = getattr(self, "_text_hashes", None)
+        if known is None:
+            known = self._text_hashes = self.doc_hashes | set(self.chunk_hashes)
+        return all(h in known for h in hashes)
+
+    def _assemble_locked(self, emb) -> bool:
+        if not self.n_chunks:
+            return False
+        if self._prev_vecs is None:
+            if emb is None:
+                return False
+            texts = [self.chunk_text(j) for j in range(self.n_chunks)]
+            self._set_vectors(_l2_normalize(_embed_corpus(emb, texts)))
+            return True
+
+        rows = self._prev_rows
+        missing = [j for j, h in enumerate(self.chunk_hashes) if h not in rows]
+        if missing and emb is None:
+            return False
+        dim = self._prev_vecs.dim
+        mat = np.empty((len(self.chunk_hashes), dim), dtype="float32")
+        if missing:
+            fresh = _l2_normalize(_embed_corpus(emb, [self.chunk_text(j) for j in missing]))
+            if fresh.shape[1] != dim:
+                # Modelo/dimensão mudou: descarta os vetores antigos
+                self._prev_vecs, self._prev_rows = None, {}
+                return self._assemble_locked(emb)
+            mat[missing] = fresh
+        known = [j for j, h in enumerate(self.chunk_hashes) if h in rows]
+        if known:
+            mat[known] = self._prev_vecs.take([rows[self.chunk_hashes[j]] for j in known])
+        self._set_vectors(mat)
+        self._prev_vecs, self._prev_rows = None, {}
+        return True
+
+    def _set_vectors(self, mat: np.ndarray, exact: ExactRows | None = None):
+        """
+        Constrói o índice ANN, se habilitado, e publica os vetores no formato
+        de SINARA_VECTOR_DTYPE (a matriz float32 de entrada é descartada)
+
+        Args:
+            mat: Matriz float32 (n_chunks, dim) normalizada
+            exact: Fonte dos vetores exatos para a re-pontuação (padrão: cache em disco)
+        """
+        ann = None
+        if ANN_BACKEND == "ivf" and mat.shape[0] >= ANN_MIN_CHUNKS:
+            try:
+                # O IVF guarda só centróides e ids; as listas são pontuadas sobre 'store'
+                ann = self._load_or_build_ann(mat)
+            except Exception:
+                logger.warning("Falha ao construir índice ANN; usando busca exata", exc_info=True)
+        if VECTOR_DTYPE == "float32":
+            store = DenseVectors(mat)
+        else:
+            exact = exact or _exact_rows(self.chunk_hashes)
+            if exact is None:
+                logger.warning("Cache de embeddings indisponível; vetores %s sem re-pontuação exata", VECTOR_DTYPE)
+            store = QuantizedVectors.from_float(mat, VECTOR_DTYPE, exact, VECTOR_RESCORE)
+        logger.info(
+            "Vetores do corpus '%s': %d x %d %s (%.1f MB)",
+            self.name or "global", len(store), store.dim, store.dtype, store.nbytes / 1e6,
+        )
+        self.vecs = store
+        # Depois dos vetores: o ANN só é usado com um armazenamento do mesmo tamanho
+        self.ann = ann
+
+    def _load_or_build_ann(self, mat: np.ndarray) -> IVFIndex:
+        """
+        Carrega o índice IVF do cache em disco (mesmo corpus e parâmetros) ou
+        constrói um novo, reportando recall@10 contra a busca exata
+        """
+        fp = hashlib.sha256()
+        fp.update(f"{EMBEDDING_MODEL}|{ANN_NLIST}|{mat.shape}".encode("utf-8"))
+        for h in self.chunk_hashes:
+            fp.update(h.encode("ascii"))
+        path = _EMB_CACHE_DIR / "ivf" / fp.hexdigest()[:16]
+        if (path / "manifest.json").exists():
+            try:
+                index, manifest = IVFIndex.load(path, nprobe=ANN_NPROBE)
+                logger.info("Índice IVF carregado de %s (recall@10=%s)", path, manifest.get("recall_at_10"))
+                return index
+            except Exception:
+                logger.warning("Índice IVF em %s inválido; reconstruindo", path, exc_info=True)
+        index = IVFIndex.build(mat, nlist=ANN_NLIST, nprobe=ANN_NPROBE)
+        recall = recall_at_k(index, mat, k=10, n_queries=100)
+        logger.info("Índice IVF: recall@10=%.3f (nlist=%d, nprobe=%d)", recall, index.nlist, index.nprobe)
+        try:
+            index.save(path, meta={"recall_at_10": recall, "model": EMBEDDING_MODEL})
+        except Exception:
+            logger.warning("Falha ao gravar índice IVF em %s", path, exc_info=True)
+        return index
+
+    def top_k_cosine(self, query_vec: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """
+        Busca top-k por similaridade de cosseno sobre a matriz pré-normalizada
+        Um produto matriz-vetor seguido de argpartition (sem ordenar tudo)
+
+        Args:
+            query_vec: Embedding da query (não precisa estar normalizado)
+            k: Número de resultados
+        Returns:
+            Lista de (similaridade, índice_chunk) em ordem decrescente
+        """
+        vecs = self.vecs
+        if vecs is None or not len(vecs) or k <= 0:
+            return []
+        q = np.asarray(query_vec, dtype="float32").ravel()
+        qn = float(np.linalg.norm(q))
+        if qn == 0.0 or q.shape[0] != vecs.dim:
+            return []
+        ann = self.ann
+        if ann is not None and len(ann) == len(vecs):
+            return ann.search(q / qn, k, vecs)
+        return vecs.top_k(q / qn, k)
+
+    def hybrid_search(self, qtoks: list[str], query_vec: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """
+        Busca híbrida sobre os chunks: BM25 e cosseno fundidos em um único ranking
+
+        - rrf: soma de 1 / (RRF_K + posição) em cada ranking
+        - weighted: ALPHA * cosseno + (1 - ALPHA) * BM25 normalizado pelo maior score
+
+        Args:
+            qtoks: Tokens da query
+            query_vec: Embedding da query
+            k: Número de resultados
+        Returns:
+            Lista de (score_fundido, índice_chunk) em ordem decrescente
+        """
+        pool = max(k * 4, 20)
+        vec_hits = self.top_k_cosine(query_vec, pool)
+        bm_scores = self.chunk_bm25.scores(qtoks) if self.chunk_bm25 is not None else {}
+        bm_hits = _heap_top_k(bm_scores, pool)
+
+        fused: dict[int, float] = {}
+        if RAG_FUSION == "rrf":
+            for ranking in (vec_hits, bm_hits):
+                for rank, (_, i) in enumerate(ranking):
+                    fused[i] = fused.get(i, 0.0) + 1.0 / (RAG_RRF_K + rank + 1)
+        else:
+            cand = sorted({i for _, i in vec_hits} | {i for _, i in bm_hits})
+            if not cand:
+                return []
+            q = np.asarray(query_vec, dtype="float32").ravel()
+            q = q / (float(np.linalg.norm(q)) or 1.0)
+            cos = self.vecs.scores(cand, q)
+            max_bm = max(bm_scores.values(), default=0.0) or 1.0
+            for i, c in zip(cand, cos.tolist()):
+                fused[i] = RAG_HYBRID_ALPHA * c + (1 - RAG_HYBRID_ALPHA) * bm_scores.get(i, 0.0) / max_bm
+        return _heap_top_k(fused, k)
+
+    def dense_scores(self, scored: list[tuple[float, int]], query_vec: np.ndarray) -> list[float] | None:
+        """Cosseno da query com cada chunk de 'scored' (None sem vetores)"""
+        if self.vecs is None or not scored:
+            return None
+        q = np.asarray(query_vec, dtype="float32").ravel()
+        q = q / (float(np.linalg.norm(q)) or 1.0)
+        return self.vecs.scores([i for _, i in scored], q).tolist()
+
+    def chunk_hits(
+        self, scored: list[tuple[float, int]], dense: list[float] | None = None
+    ) -> list["RetrievalHit"]:
+        dense = dense or [None] * len(scored)
+        return [
+            RetrievalHit(s, self.chunk_text(i), int(self.doc_pos[int(self._chunk_doc[i])]), i, d)
+            for (s, i), d in zip(scored, dense)
+        ]
+
+    def doc_hits(self, scored: list[tuple[float, int]]) -> list["RetrievalHit"]:
+        return [RetrievalHit(s, self.doc_texts[i], int(self.doc_pos[i])) for s, i in scored]
+
+
+def _read_source(path: Path) -> list:
+    """Lê o arquivo JSON de um corpus (a lista não fica em memória depois da construção)"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data if isinstance(data, list) else []
+
+
+def _source_path(namespace: str) -> Path:
+    """Arquivo fonte do namespace (ValueError se não configurado)"""
+    if not namespace:
+        return _DEFAULT_SOURCE
+    spec = RAG_NAMESPACES.get(namespace)
+    if spec is None:
+        raise ValueError(f"namespace de recuperação desconhecido: {namespace}")
+    return spec["source"]
+
+
+def _source_corpus(namespace: str) -> MongoCorpus | None:
+    """Corpus Mongo do namespace (None se a fonte é um arquivo JSON)"""
+    if namespace:
+        _source_path(namespace)  # valida o namespace
+        collection = RAG_NAMESPACES[namespace]["collection"]
+    else:
+        collection = CORPUS_COLLECTION if CORPUS_SOURCE == "mongo" else None
+    if not collection:
+        return None
+    corpus = _mongo_corpora.get(collection)
+    if corpus is None:
+        corpus = _mongo_corpora.setdefault(
+            collection, MongoCorpus(os.getenv("MONGO_DB", "DB_Sinara"), collection)
+        )
+    return corpus
+
+
+def _source_version(namespace: str) -> float:
+    """Versão atual da fonte: mtime do JSON ou versão do corpus Mongo (sincronizado uma vez)"""
+    corpus = _source_corpus(namespace)
+    if corpus is None:
+        return os.path.getmtime(_source_path(namespace))
+    corpus.ensure_synced()
+    return corpus.version
+
+
+def _seed_stored_embeddings(corpus: MongoCorpus, hashes: list[str], model: str = EMBEDDING_MODEL):
+    """
+    Copia para o cache em disco os embeddings gravados no Mongo dos chunks
+    que ainda não estão nele (a montagem dos vetores não chama a API para eles)
+    """
+    keys, cached = _load_emb_cache(model)
+    known = set(keys)
+    missing = [h for h in dict.fromkeys(hashes) if h not in known]
+    if not missing:
+        return
+    stored = corpus.stored_vectors(missing, model)
+    if not stored:
+        return
+    new_keys = [h for h in missing if h in stored]
+    fresh = np.vstack([np.asarray(stored[h], dtype="float32").ravel() for h in new_keys])
+    _extend_emb_cache(model, keys, cached, new_keys, fresh)
+    logger.info("Embeddings do corpus %s: %d reaproveitados do Mongo, %d sem vetor gravado", corpus.label, len(new_keys), len(missing) - len(new_keys))
+
+
+def _build_index(
+    namespace: str,
+    prev: _CorpusIndex | None = None,
+    snapshot: bool = True,
+    hybrid: bool | None = None,
+) -> _CorpusIndex:
+    """
+    Constrói um índice completo e novo para o namespace (chamar com _load_lock)
+    Incremental em relação a 'prev': documentos inalterados (mesmo hash)
+    reaproveitam chunks, termos e vetores; apenas chunks novos ou alterados
+    precisam de embedding
+
+    Args:
+        namespace: Nome do namespace ("" = corpus global)
+        prev: Índice atualmente publicado (None na carga a frio)
+        snapshot: Na carga a frio, usar o snapshot pré-compilado se estiver atualizado
+        hybrid: Construir o BM25 por chunk (padrão: conforme SINARA_RAG_MODE)
+    Returns:
+        Índice ainda não publicado
+    """
+    path = _source_path(namespace)
+    spec = RAG_NAMESPACES.get(namespace) if namespace else None
+    corpus = _source_corpus(namespace)
+    # Versão lida antes dos documentos: uma escrita durante a leitura dispara nova recarga
+    version = _source_version(namespace)
+    if prev is None and snapshot and USE_INDEX_SNAPSHOT:
+        index = _load_index_snapshot(namespace, version)
+        if index is not None:
+            return index
+    raw_list = corpus.documents() if corpus is not None else _read_source(path)
+    sections = spec["sections"] if spec else None
+    positions: list[int] = []
+    entries: list[_DocEntry] = []
+    hashes: list[str] = []
+    for pos, d in enumerate(raw_list):
+        if not isinstance(d, dict):
+            continue
+        if sections is not None and _doc_section(d) not in sections:
+            continue
+        full = _doc_full_text(d)
+        h = _text_hash(full)
+        entry = _doc_entries.get(h)
+        if entry is None:
+            entry = _doc_entries[h] = _make_doc_entry(full)
+        positions.append(pos)
+        entries.append(entry)
+        hashes.append(h)
+
+    label = namespace or "global"
+    if prev is not None:
+        current = set(hashes)
+        added = len(current - prev.doc_hashes)
+        logger.info(
+            "Corpus '%s' recarregado: %d documentos novos/alterados, %d removidos, %d inalterados",
+            label, added, len(prev.doc_hashes - current), len(current) - added,
+        )
+    if namespace and not entries:
+        logger.warning("Namespace '%s' não tem documentos em %s", namespace, corpus.label if corpus else path)
+    if corpus is not None and RAG_MODE in ("auto", "hybrid"):
+        try:
+            _seed_stored_embeddings(corpus, [h for e in entries for h in e.chunk_hashes])
+        except Exception:
+            logger.warning("Falha ao ler embeddings gravados em %s", corpus.label, exc_info=True)
+    return _CorpusIndex(namespace, positions, entries, hashes, version, prev, hybrid)
+
+
+def _source_fingerprint(namespace: str) -> tuple[str, str]:
+    """(rótulo, hash do conteúdo) da fonte do namespace"""
+    corpus = _source_corpus(namespace)
+    if corpus is None:
+        path = _source_path(namespace)
+        return str(path), file_sha256(path)
+    corpus.ensure_synced()
+    h = hashlib.sha256()
+    for d in corpus.documents():
+        h.update((d.get("content_hash") or _text_hash(_doc_full_text(d))).encode("ascii"))
+    return corpus.label, h.hexdigest()
+
+
+def _snapshot_meta(namespace: str) -> dict:
+    """Parâmetros que determinam o conteúdo do índice (um snapshot só vale se todos coincidirem)"""
+    spec = RAG_NAMESPACES.get(namespace) if namespace else None
+    sections = sorted(spec["sections"]) if spec and spec["sections"] is not None else None
+    source, digest = _source_fingerprint(namespace)
+    return {
+        "source": source,
+        "source_sha256": digest,
+        "sections": sections,
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+    }
+
+
+def _load_index_snapshot(namespace: str, version: float) -> _CorpusIndex | None:
+    """Índice a partir do snapshot do namespace, se existir e corresponder à fonte atual"""
+    try:
+        snap = load_snapshot(INDEX_SNAPSHOT_DIR, namespace)
+        if snap is None:
+            return None
+        expected = _snapshot_meta(namespace)
+        stale = [k for k, v in expected.items() if k != "source" and snap.manifest.get(k) != v]
+        if RAG_MODE == "hybrid" and "chunk_bm25" not in snap.manifest:
+            stale.append("chunk_bm25")
+        if stale:
+            logger.info("Snapshot %s desatualizado (%s); construindo a partir da fonte", snap.path, ", ".join(stale))
+            return None
+        t0 = time.perf_counter()
+        index = _CorpusIndex.from_snapshot(namespace, snap, version)
+        logger.info(
+            "Corpus '%s' carregado do snapshot %s em %.1f ms (%d documentos, %d chunks, vetores: %s)",
+            namespace or "global", snap.path.name, (time.perf_counter() - t0) * 1000,
+            len(index.doc_texts), index.n_chunks, "sim" if index.vecs is not None else "não",
+        )
+        return index
+    except Exception:
+        logger.warning("Falha ao carregar snapshot do corpus '%s'; construindo a partir da fonte", namespace or "global", exc_info=True)
+        return None
+
+
+def build_index_snapshot(namespace: str = "", embed: bool = True, hybrid: bool = True) -> Path:
+    """
+    Constrói o índice do namespace a partir da fonte e grava um snapshot
+    (usado por db_script/build_index.py)
+
+    Args:
+        namespace: Nome do namespace ("" = corpus global)
+        embed: Incluir a matriz de vetores (requer chave de API ou cache em disco)
+        hybrid: Incluir o BM25 por chunk (necessário no modo híbrido)
+    Returns:
+        Diretório do snapshot gravado
+    """
+    meta = _snapshot_meta(namespace)
+    with _load_lock:
+        index = _build_index(namespace, _indexes.get(namespace), snapshot=False, hybrid=hybrid)
+    if embed:
+        emb = _embeddings_client()
+        if emb is None:
+            logger.warning("Sem chave de API: snapshot de '%s' gravado sem vetores", namespace or "global")
+        else:
+            index.assemble_vectors(emb)
+    arrays, strings, extra = index.snapshot_payload()
+    meta.update(extra)
+    out = write_snapshot(INDEX_SNAPSHOT_DIR, namespace, arrays, strings, index.doc_texts, meta)
+    logger.info("Snapshot do corpus '%s' gravado em %s", namespace or "global", out)
+    return out
+
+
+def corpus_document_chunks(d: dict) -> tuple[str, list[str], list[str]]:
+    """
+    Chunks de um documento do corpus, calculados como o índice os calcula
+    (usado pelo db_script/dataload.py para gravar os embeddings no Mongo)
+
+    Returns:
+        (hash do documento, chunks, hash de cada chunk)
+    """
+    full = _doc_full_text(d)
+    chunks = _chunk_text(full)
+    return _text_hash(full), chunks, [_text_hash(c) for c in chunks]
+
+
+def embed_corpus_texts(texts: list[str]) -> np.ndarray:
+    """
+    Embeddings de chunks do corpus (cache em disco + API em lotes), sem normalizar
+
+    Returns:
+        Matriz float32 (len(texts), dim)
+    """
+    emb = _embeddings_client()
+    if emb is None:
+        raise RuntimeError("Defina GEMINI_API_KEY (ou GOOGLE_API_KEY) no .env/ambiente.")
+    return _embed_corpus(emb, texts)
+
+
+def _publish(namespace: str, index: _CorpusIndex):
+    """Publica o índice com uma única troca de referência (chamar com _load_lock)"""
+    global _doc_entries
+    _indexes[namespace] = index
+    # Descarta documentos que nenhum namespace referencia mais
+    alive = set().union(*(ix.doc_hashes for ix in _indexes.values()))
+    _doc_entries = {h: e for h, e in _doc_entries.items() if h in alive}
+
+
+def _ensure_loaded(namespace: str = "") -> _CorpusIndex:
+    """
+    Retorna o índice publicado do namespace, construindo-o na primeira chamada
+    Requisições concorrentes na carga a frio esperam uma única construção;
+    depois disso a leitura é só um acesso ao dicionário (sem stat do arquivo).
+    Mudanças no arquivo fonte são aplicadas pelo watcher em segundo plano.
+
+    Args:
+        namespace: Nome do namespace ("" = corpus global)
+    Returns:
+        Índice do namespace
+    """
+    index = _indexes.get(namespace)
+    if index is not None:
+        return index
+    with _load_lock:
+        index = _indexes.get(namespace)
+        if index is None:
+            index = _build_index(namespace)
+            _publish(namespace, index)
+    start_index_watcher()
+    return index
+
+
+def context_is_current(fingerprint: tuple[str, tuple[str, ...]]) -> bool:
+    """
+    Se os trechos de um RetrievalResult.fingerprint ainda existem no corpus publicado
+    (False quando algum documento foi alterado ou removido desde a recuperação)
+    """
+    namespace, hashes = fingerprint
+    index = _indexes.get(namespace)
+    return index is not None and index.contains_texts(hashes)
+
+
+def context_similarity(text: str, retrieval: "RetrievalResult") -> float | None:
+    """
+    Maior similaridade de cosseno entre o embedding de 'text' (ex.: resposta de um
+    agente) e os vetores dos chunks recuperados; usa os vetores já indexados,
+    então custa uma única chamada de embedding
+
+    Returns:
+        Similaridade, ou None sem chunks/vetores, sem chave de API ou se o embedding falhar
+    """
+    rows = [h.chunk_id for h in retrieval.hits if h.chunk_id is not None]
+    index = _indexes.get(retrieval.namespace)
+    vecs = index.vecs if index is not None else None
+    if not rows or vecs is None:
+        return None
+    emb = _embeddings_client()
+    if emb is None:
+        return None
+    try:
+        vec = np.asarray(emb.embed_query(str(text or "")), dtype="float32").ravel()
+    except Exception:
+        logger.warning("Embedding da resposta indisponível", exc_info=True)
+        return None
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0 or vec.shape[0] != vecs.dim:
+        return None
+    return float(np.max(_l2_normalize(vecs.take(rows)) @ (vec / norm)))
+
+
+def _embeddings_client(api_key: str | None = None) -> GoogleGenerativeAIEmbeddings | None:
+    """Cliente de embeddings do corpus/query, compartilhado pelo processo (None sem chave de API)"""
+    return get_embeddings(EMBEDDING_MODEL, api_key)
+
+
+def refresh_indexes() -> list[str]:
+    """
+    Reconstrói fora do caminho da requisição os índices cuja fonte mudou
+    (arquivo JSON com outro mtime ou corpus Mongo com documentos novos)
+    O índice novo fica completo (inclusive vetores, se o anterior os tinha)
+    antes de substituir o antigo; leitores nunca veem um índice pela metade
+
+    Returns:
+        Namespaces recarregados
+    """
+    # Cada coleção é sincronizada uma vez por passada, mesmo servindo vários namespaces
+    for corpus in list(_mongo_corpora.values()):
+        try:
+            corpus.sync()
+        except Exception:
+            logger.warning("Falha ao sincronizar o corpus %s; mantendo o índice atual", corpus.label, exc_info=True)
+    reloaded = []
+    for namespace, current in list(_indexes.items()):
+        try:
+            if _source_version(namespace) == current.version:
                 continue
-            title = d.get("title") or d.get("titulo") or ""
-            section = d.get("section") or d.get("secao") or ""
-            content = d.get("content") or d.get("conteudo") or ""
-            full = "\n".join(x for x in [title, section, content] if x)
-            if full:
-                texts.append(full)
-        chunks: list[str] = []
-        for t in texts:
-            chunks.extend(_chunk_text(t))
-        _json_texts = chunks
-        _json_vecs = None
-        _json_mtime = mtime
-        _build_offline_index(raw_list)
-
-
-def retrieve_similar_context(query: str, top_k: int = 3) -> list[str]:
+            with _load_lock:
+                fresh = _build_index(namespace, current)
+            # Embeddings dos chunks novos fora do lock (cargas a frio de outros namespaces não esperam)
+            if current.vecs is not None and RAG_MODE in ("auto", "hybrid"):
+                try:
+                    emb = _embeddings_client()
+                    if emb is not None:
+                        fresh.assemble_vectors(emb)
+                except Exception:
+                    logger.warning("Falha ao gerar embeddings do corpus '%s' na recarga", namespace or "global", exc_info=True)
+            with _load_lock:
+                if _indexes.get(namespace) is current:
+                    _publish(namespace, fresh)
+                    reloaded.append(namespace)
+        except Exception:
+            logger.warning("Falha ao recarregar o corpus '%s'; mantendo o índice atual", namespace or "global", exc_info=True)
+    return reloaded
+
+
+def warm_up_indexes() -> dict[str, int]:
     """
-    Recupera contextos similares à query usando embeddings ou BM25
+    Carrega os índices do corpus global e de todos os namespaces configurados
+    (usado no warm-up da aplicação)
+
+    Returns:
+        Mapa namespace -> número de chunks
+    """
+    return {ns: _ensure_loaded(ns).n_chunks for ns in ["", *RAG_NAMESPACES]}
+
+
+def warm_up_embeddings() -> dict[str, bool]:
+    """
+    Monta os vetores dos índices carregados (cache em disco / API), para que
+    a primeira consulta por embeddings não pague o embedding do corpus
+
+    Returns:
+        Mapa namespace -> vetores prontos
+    """
+    if RAG_MODE not in ("auto", "hybrid"):
+        return {}
+    emb = _embeddings_client()
+    if emb is None:
+        return {}
+    return {ns: index.assemble_vectors(emb) for ns, index in list(_indexes.items())}
+
+
+def _watch_loop(interval: float):
+    while not _watcher_stop.wait(interval):
+        refresh_indexes()
+
+
+def start_index_watcher(interval: float | None = None) -> bool:
+    """
+    Inicia (uma vez) a thread que observa as fontes dos corpora
+
+    Args:
+        interval: Segundos entre verificações (padrão: SINARA_INDEX_WATCH_INTERVAL; 0 desativa)
+    Returns:
+        True se o watcher está rodando
+    """
+    global _watcher
+    interval = INDEX_WATCH_INTERVAL if interval is None else float(interval)
+    if interval <= 0:
+        return False
+    with _watcher_lock:
+        if _watcher is None or not _watcher.is_alive():
+            _watcher_stop.clear()
+            _watcher = threading.Thread(
+                target=_watch_loop, args=(interval,), name="sinara-index-watcher", daemon=True
+            )
+            _watcher.start()
+    return True
+
+
+def stop_index_watcher(timeout: float | None = 5.0):
+    """Encerra a thread do watcher (se estiver rodando)"""
+    global _watcher
+    with _watcher_lock:
+        watcher, _watcher = _watcher, None
+        _watcher_stop.set()
+    if watcher is not None:
+        watcher.join(timeout)
+
+
+def namespace_for(agent: str | None) -> str:
+    """Namespace de recuperação de um agente ("" se não configurado)"""
+    name = (agent or "").strip().lower()
+    return name if name in RAG_NAMESPACES else ""
+
+
+@dataclass(frozen=True)
+class RetrievalHit:
+    """Um item recuperado: score, texto e sua origem no corpus"""
+    score: float
+    text: str
+    doc_id: int  # Posição do documento de origem no arquivo fonte do corpus
+    chunk_id: int | None = None  # Índice do chunk no namespace (None quando o item é o documento inteiro)
+    dense: float | None = None  # Cosseno query x item (igual ao score no modo embedding; None sem vetores)
+
+
+@dataclass
+class RetrievalResult:
+    """
+    Resultado de uma recuperação feita uma única vez por requisição
+    Cada agente fatia o resultado para o seu próprio top_k, sem nova busca
+
+    Attributes:
+        query: Consulta original
+        hits: Itens em ordem decrescente de relevância
+        top_k: Número de itens solicitados na busca
+        mode: "embedding", "hybrid" (chunks) ou "bm25" (documentos, ou chunks no modo híbrido)
+        namespace: Corpus consultado ("" = global)
+    """
+    query: str
+    hits: list[RetrievalHit] = field(default_factory=list)
+    top_k: int = 0
+    mode: str = "bm25"
+    namespace: str = ""
+
+    def similar_context(self, top_k: int = 3) -> list[str]:
+        """Equivalente a retrieve_similar_context (inclui ampliação dinâmica do K)"""
+        return [h.text for h in self.hits[:_dynamic_k(self.query, top_k)]]
+
+    def with_scores(self, top_k: int = 5) -> list[tuple[float, str]]:
+        """Equivalente a retrieve_similar_context_with_scores"""
+        return [(h.score, h.text) for h in self.hits[:max(1, int(top_k))]]
+
+    def top_dense_score(self) -> float | None:
+        """Cosseno da query com o melhor item, comparável entre modos de busca (None sem embeddings)"""
+        return self.hits[0].dense if self.hits else None
+
+    @property
+    def fingerprint(self) -> tuple[str, tuple[str, ...]]:
+        """Namespace e hashes dos trechos recuperados (ver context_is_current)"""
+        return self.namespace, tuple(_text_hash(h.text) for h in self.hits)
+
+    @property
+    def doc_ids(self) -> list[int]:
+        return [h.doc_id for h in self.hits]
+
+    @property
+    def chunk_ids(self) -> list[int | None]:
+        return [h.chunk_id for h in self.hits]
+
+
+def _dynamic_k(query: str, top_k: int) -> int:
+    """
+    Heurística: ampliar K para consultas de funcionalidades do sistema
+    (ex.: "bater ponto", "login", "página", "perfil")
     """
-    _ensure_loaded()
-    
-    # Heurística: ampliar K para consultas de funcionalidades do sistema (ex.: "bater ponto", "login", "página", "perfil")
     try:
         qn = _normalize(query)
         qtokens = set(_tokenize(qn))
         widen_kw = {"ponto", "bater", "registro", "login", "pagina", "perfil", "dashboard", "notificacao", "sistema", "web", "mobile"}
-        dyn_k = max(top_k, 8) if (qtokens & widen_kw) else top_k
+        return max(top_k, 8) if (qtokens & widen_kw) else top_k
     except Exception:
-        dyn_k = top_k
+        return top_k
+
+
+def retrieve(query: str, top_k: int = RETRIEVAL_TOP_K, namespace: str = "") -> RetrievalResult:
+    """
+    Executa a recuperação uma vez e devolve um RetrievalResult reutilizável
+    Usa embeddings (ou busca híbrida, conforme SINARA_RAG_MODE) quando há
+    chave de API; em falha, cai para BM25
+
+    Args:
+        query: Texto da consulta
+        top_k: Maior K que algum consumidor vai precisar
+        namespace: Corpus a consultar ("" = global; ver SINARA_RAG_NAMESPACES)
+    Returns:
+        RetrievalResult com os itens pontuados e os parâmetros usados
+    """
+    index = _ensure_loaded(namespace)
+    k = max(1, int(top_k))
 
     # Tenta usar embeddings
     api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    if api_key and _json_texts:
+    if api_key and index.n_chunks and RAG_MODE in ("auto", "hybrid"):
         try:
-            # Inicializa embeddings
-            emb = GoogleGenerativeAIEmbeddings(
-                model="models/text-embedding-004",
-                google_api_key=api_key
-            )
-            
-            # Gera embedding da query
-            query_vec = np.asarray(emb.embed_query(query), dtype="float32").ravel()
-            
-            # Gera ou recupera embeddings dos textos
-            global _json_vecs
-            if _json_vecs is None:
-                _json_vecs = []
-                for t in _json_texts:
-                    if not t:
-                        continue
-                    vec = np.asarray(emb.embed_query(t), dtype="float32").ravel()
-                    _json_vecs.append(vec)
-            
-            # Calcula similaridades
-            results = []
-            for t, v in zip(_json_texts, _json_vecs):
-                if not t:
-                    continue
-                    
-                # Similaridade por cosseno
-                norm_a = float(np.linalg.norm(query_vec))
-                norm_b = float(np.linalg.norm(v))
-                if norm_a and norm_b:
-                    sim = float(np.dot(query_vec, v) / (norm_a * norm_b))
-                    results.append((sim, t))
-                    
-            # Retorna top_k (dinâmico) mais similares
-            if results:
-                results.sort(key=lambda x: x[0], reverse=True)
-                return [t for _, t in results[:dyn_k]]
-                
+            emb = _embeddings_client(api_key)
+            query_vec = _embed_query(emb, query)
+
+            # Gera ou recupera embeddings dos textos (apenas os que faltam)
+            index.assemble_vectors(emb)
+
+            if RAG_MODE == "hybrid":
+                scored = index.hybrid_search(_tokenize(query), query_vec, k)
+                dense = index.dense_scores(scored, query_vec)
+                mode = "hybrid"
+            else:
+                scored = index.top_k_cosine(query_vec, k)
+                dense = [sc for sc, _ in scored]
+                mode = "embedding"
+            if scored:
+                return RetrievalResult(query, index.chunk_hits(scored, dense), k, mode, namespace)
         except Exception:
-            pass
-    
-    # Fallback para BM25
-    tokens = _tokenize(query)
-    scores = _bm25_scores(tokens)
-    scores.sort(key=lambda x: x[0], reverse=True)
-    
-    if not _doc_texts:
-        return []
-        
-    return [_doc_texts[i] for _, i in scores[:dyn_k]]
+            logger.warning("Busca por embeddings falhou; usando BM25", exc_info=True)
 
+    # Modo híbrido sem vetores: BM25 sobre os mesmos chunks (mesma unidade)
+    if RAG_MODE == "hybrid" and index.chunk_bm25 is not None and index.n_chunks:
+        bm = _bm25_scores(_tokenize(query), k, index.chunk_bm25)
+        return RetrievalResult(query, index.chunk_hits(bm), k, "bm25", namespace)
 
-def retrieve_similar_context_with_scores(query: str, top_k: int = 5):
+    # Fallback offline: BM25
+    bm = _bm25_scores(_tokenize(query), k, index.bm25)
+    return RetrievalResult(query, index.doc_hits(bm), k, "bm25", namespace)
+
+
+def retrieval_for_agent(
+    query: str, agent: str, retrieval: RetrievalResult | None = None
+) -> RetrievalResult | None:
+    """
+    Recuperação restrita ao namespace do agente
+    Reutiliza 'retrieval' quando ele já é do namespace certo; caso contrário,
+    busca de novo só no corpus do agente (o embedding da query vem do cache)
+
+    Args:
+        query: Texto da consulta
+        agent: Nome do agente (tecnico, assistente, organizacional, faq...)
+        retrieval: Recuperação já feita na requisição (normalmente global)
+    Returns:
+        RetrievalResult do namespace, ou o próprio 'retrieval' (inclusive None)
+        se o agente não tem namespace ou o namespace não retornou nada
+    """
+    ns = namespace_for(agent)
+    if not ns or (retrieval is not None and retrieval.namespace == ns):
+        return retrieval
+    k = retrieval.top_k if retrieval is not None else RETRIEVAL_TOP_K
+    try:
+        scoped = retrieve(query, k, ns)
+    except Exception:
+        logger.warning("Recuperação no namespace '%s' falhou; usando corpus global", ns, exc_info=True)
+        return retrieval
+    return scoped if scoped.hits else retrieval
+
+
+def retrieve_similar_context(query: str, top_k: int = 3, namespace: str = "") -> list[str]:
+    """
+    Recupera contextos similares à query usando embeddings ou BM25
+    """
+    dyn_k = _dynamic_k(query, top_k)
+    return retrieve(query, dyn_k, namespace).similar_context(top_k)
+
+
+def retrieve_similar_context_with_scores(query: str, top_k: int = 5, namespace: str = ""):
     """
     Similar ao retrieve_similar_context, mas inclui scores
     Útil para debugging e ajuste fino do sistema
@@ -258,59 +1507,11 @@ def retrieve_similar_context_with_scores(query: str, top_k: int = 5):
     Args:
         query: Texto da consulta
         top_k: Número de contextos a retornar
+        namespace: Corpus a consultar ("" = global)
     
     Returns:
         Lista de tuplas (score, texto) ordenada por relevância
     """
     load_dotenv(override=True)
-    _ensure_loaded()
-
-    api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-    emb = None
-    if api_key:
-        try:
-            emb = GoogleGenerativeAIEmbeddings(
-                model="models/text-embedding-004",
-                google_api_key=api_key,
-                transport="rest",
-            )
-        except Exception:
-            emb = None
-
-    if emb is not None and _json_texts:
-        query_vec = np.asarray(emb.embed_query(query), dtype="float32").ravel()
-        global _json_vecs
-        if _json_vecs is None:
-            _json_vecs = [
-                np.asarray(emb.embed_query(t) if t else np.zeros_like(query_vec), dtype="float32").ravel()
-                for t in _json_texts
-            ]
-
-        def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
-            na = float(np.linalg.norm(a))
-            nb = float(np.linalg.norm(b))
-            if na == 0.0 or nb == 0.0:
-                return 0.0
-            return float(np.dot(a, b) / (na * nb))
-
-        pairs = []
-        for t, v in zip(_json_texts, _json_vecs):
-            if not t:
-                continue
-            try:
-                s = cosine_sim(query_vec, v)
-                pairs.append((s, t))
-            except Exception:
-                continue
-        pairs.sort(key=lambda x: x[0], reverse=True)
-        k = max(1, int(top_k))
-        return pairs[:k]
-
-    # Fallback offline: BM25
-    qtoks = _tokenize(query)
-    bm = _bm25_scores(qtoks)
-    bm.sort(key=lambda x: x[0], reverse=True)
     k = max(1, int(top_k))
-    if not _doc_texts:
-        return []
-    return [(s, _doc_texts[i]) for s, i in bm[:k]]
+    return retrieve(query, k, namespace).with_scores(k)
@@ -0,0 +1,326 @@
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from ..utils.deadline import exception_chain, remaining_time
+
+"""
+Limitador de taxa (token bucket) das chamadas ao Gemini, no lado do cliente
+Cada tipo de chamada (chat, embed) tem um bucket por modelo, com a cota de
+SINARA_RATE_LIMITS. Quem não encontra token entra numa fila por prioridade
+(estágios do caminho crítico primeiro, indexação do corpus por último) e
+espera no máximo SINARA_RATE_MAX_WAIT ou o prazo da requisição. Assim a
+vazão fica no teto da cota, em vez de alternar entre rajadas e sequências de
+429. Um 429 que ainda assim chegue esvazia o bucket e pausa o modelo por
+SINARA_RATE_PENALTY. Com SINARA_RATE_BACKEND=sqlite, os buckets ficam num
+arquivo compartilhado pelos workers da mesma máquina.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_limits(raw: str) -> dict[str, tuple[float, float]]:
+    """
+    'chat=60,embed=1500/100,chat:gemini-2.5-pro=5' -> {chave: (por minuto, capacidade)}
+    A capacidade padrão é a cota de 5 s (mínimo 1); entradas inválidas são ignoradas
+    """
+    limits = {}
+    for item in (raw or "").split(","):
+        key, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            per_minute = float(rate)
+            capacity = float(burst) if burst else max(1.0, per_minute / 12)
+        except ValueError:
+            continue
+        if key.strip() and per_minute > 0:
+            limits[key.strip()] = (per_minute, capacity)
+    return limits
+
+
+# Chamadas por minuto por tipo ("chat", "embed") ou por tipo e modelo ("chat:<modelo>"); vazio = sem limite
+RATE_LIMITS = _parse_limits(os.getenv("SINARA_RATE_LIMITS", ""))
+# Espera máxima na fila, em segundos (limitada também pelo prazo da requisição)
+RATE_MAX_WAIT = float(os.getenv("SINARA_RATE_MAX_WAIT", "10"))
+# Pausa do bucket depois de um 429 do Gemini, em segundos
+RATE_PENALTY = float(os.getenv("SINARA_RATE_PENALTY", "5"))
+RATE_BACKEND = (os.getenv("SINARA_RATE_BACKEND") or "memory").strip().lower()  # memory | sqlite
+RATE_DB = os.getenv("SINARA_RATE_DB") or os.path.join(tempfile.gettempdir(), "sinara_ratelimit.sqlite")
+
+# Prioridades (menor = atendido antes)
+PRIORITY_HIGH = 0  # Guardrail, roteador, embedding da query
+PRIORITY_NORMAL = 1  # Geração e Judge
+PRIORITY_LOW = 2  # Hedging, indexação do corpus
+
+_priority: ContextVar[int] = ContextVar("sinara_call_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def call_priority(priority: int):
+    """Prioridade das chamadas ao Gemini feitas no contexto atual"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimitWaitExceeded(RuntimeError):
+    """Não houve cota disponível dentro da espera máxima (fila cheia por tempo demais)"""
+
+
+try:
+    from google.api_core import exceptions as _google_exc
+
+    # 429 do Gemini: ResourceExhausted (gRPC) ou TooManyRequests (REST)
+    _RATE_LIMITED_TYPES: tuple = (_google_exc.ResourceExhausted, _google_exc.TooManyRequests)
+except ImportError:
+    _RATE_LIMITED_TYPES = ()
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """Resposta 429 / cota esgotada do Gemini, inclusive embrulhada pelo LangChain (raise ... from)"""
+    return any(isinstance(e, _RATE_LIMITED_TYPES) for e in exception_chain(exc))
+
+
+class _MemoryBuckets:
+    """Buckets do processo (relógio monotônico)"""
+
+    def __init__(self):
+        self._state: dict[str, list[float]] = {}  # chave -> [tokens, atualizado_em, pausado_até]
+        self._lock = threading.Lock()
+
+    def take(self, key: str, per_second: float, capacity: float) -> float:
+        """Consome um token; retorna 0 se conseguiu, senão os segundos até haver um"""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(key, [capacity, now, 0.0])
+            tokens, updated, paused_until = state
+            if now < paused_until:
+                return paused_until - now
+            tokens = min(capacity, tokens + (now - updated) * per_second)
+            if tokens >= 1.0:
+                state[:] = [tokens - 1.0, now, paused_until]
+                return 0.0
+            state[:] = [tokens, now, paused_until]
+            return (1.0 - tokens) / per_second
+
+    def pause(self, key: str, seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(key, [0.0, now, 0.0])
+            state[:] = [0.0, now, max(state[2], now + seconds)]
+
+
+class _SQLiteBuckets:
+    """Buckets num arquivo SQLite compartilhado pelos processos (relógio de parede)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL, updated REAL, paused_until REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _update(self, key: str, fn) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            wait, state = fn(row, time.time())
+            conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)", (key, *state))
+            conn.execute("COMMIT")
+            return wait
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take(self, key: str, per_second: float, capacity: float) -> float:
+        def fn(row, now):
+            tokens, updated, paused_until = row if row else (capacity, now, 0.0)
+            if now < paused_until:
+                return paused_until - now, (tokens, updated, paused_until)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * per_second)
+            if tokens >= 1.0:
+                return 0.0, (tokens - 1.0, now, paused_until)
+            return (1.0 - tokens) / per_second, (tokens, now, paused_until)
+
+        return self._update(key, fn)
+
+    def pause(self, key: str, seconds: float):
+        def fn(row, now):
+            paused_until = row[2] if row else 0.0
+            return 0.0, (0.0, now, max(paused_until, now + seconds))
+
+        self._update(key, fn)
+
+
+@dataclass
+class _Queue:
+    cond: threading.Condition = field(default_factory=threading.Condition)
+    waiters: list = field(default_factory=list)  # heap de (prioridade, ordem de chegada)
+    acquired: int = 0
+    rejected: int = 0
+    throttled: int = 0  # 429 recebidos mesmo com o limitador
+    max_depth: int = 0
+    waits_ms: deque = field(default_factory=lambda: deque(maxlen=500))
+
+
+class RateLimiter:
+    """Token buckets por (tipo de chamada, modelo) com fila por prioridade e espera limitada"""
+
+    def __init__(self, limits: dict[str, tuple[float, float]], backend=None):
+        """
+        Args:
+            limits: {tipo ou tipo:modelo: (chamadas por minuto, capacidade)}
+            backend: Armazenamento dos buckets (padrão: memória do processo)
+        """
+        self.limits = limits
+        self._buckets = backend or _MemoryBuckets()
+        self._queues: dict[str, _Queue] = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _limit(self, kind: str, model: str) -> tuple[float, float] | None:
+        return self.limits.get(f"{kind}:{model}") or self.limits.get(kind)
+
+    def _queue(self, key: str) -> _Queue:
+        queue = self._queues.get(key)
+        if queue is None:
+            with self._lock:
+                queue = self._queues.setdefault(key, _Queue())
+        return queue
+
+    def acquire(self, kind: str, model: str, priority: int | None = None, max_wait: float | None = None):
+        """
+        Espera um token do bucket (tipo, modelo); sem limite configurado, retorna na hora
+
+        Args:
+            kind: Tipo de chamada ("chat" ou "embed")
+            model: Nome do modelo
+            priority: Prioridade na fila (padrão: a do contexto, ver call_priority)
+            max_wait: Espera máxima em segundos (padrão: SINARA_RATE_MAX_WAIT, limitado pelo prazo)
+        Raises:
+            RateLimitWaitExceeded: sem token dentro da espera máxima
+        """
+        limit = self._limit(kind, model)
+        if limit is None:
+            return
+        per_second, capacity = limit[0] / 60.0, limit[1]
+        key = f"{kind}:{model}"
+        max_wait = RATE_MAX_WAIT if max_wait is None else max_wait
+        remaining = remaining_time()
+        if remaining is not None:
+            max_wait = min(max_wait, remaining)
+        priority = _priority.get() if priority is None else priority
+
+        queue = self._queue(key)
+        start = time.monotonic()
+        entry = (priority, next(self._seq))
+        with queue.cond:
+            heapq.heappush(queue.waiters, entry)
+            queue.max_depth = max(queue.max_depth, len(queue.waiters))
+            try:
+                while True:
+                    # Só o primeiro da fila disputa o bucket; os demais esperam a vez
+                    wait = self._buckets.take(key, per_second, capacity) if queue.waiters[0] == entry else None
+                    if wait == 0.0:
+                        queue.acquired += 1
+                        queue.waits_ms.append((time.monotonic() - start) * 1000)
+                        return
+                    left = max_wait - (time.monotonic() - start)
+                    if left <= 0:
+                        queue.rejected += 1
+                        raise RateLimitWaitExceeded(
+                            f"sem cota para '{key}' em {max_wait:.1f} s (fila: {len(queue.waiters)})"
+                        )
+                    queue.cond.wait(min(left, wait) if wait is not None else left)
+            finally:
+                queue.waiters.remove(entry)
+                heapq.heapify(queue.waiters)
+                queue.cond.notify_all()
+
+    def penalize(self, kind: str, model: str):
+        """429 recebido: esvazia o bucket e pausa o modelo por SINARA_RATE_PENALTY"""
+        if self._limit(kind, model) is None:
+            return
+        key = f"{kind}:{model}"
+        self._buckets.pause(key, RATE_PENALTY)
+        queue = self._queue(key)
+        with queue.cond:
+            queue.throttled += 1
+        logger.warning("429 do Gemini em '%s'; bucket pausado por %.1f s", key, RATE_PENALTY)
+
+    def stats(self) -> dict:
+        """Por bucket: fila atual e máxima, chamadas liberadas/rejeitadas, 429 e tempos de espera (ms)"""
+        out = {}
+        with self._lock:
+            queues = dict(self._queues)
+        for key, q in queues.items():
+            with q.cond:
+                waits = sorted(q.waits_ms)
+                depth, acquired, rejected, throttled, max_depth = (
+                    len(q.waiters), q.acquired, q.rejected, q.throttled, q.max_depth
+                )
+            out[key] = {
+                "queue_depth": depth,
+                "max_queue_depth": max_depth,
+                "acquired": acquired,
+                "rejected": rejected,
+                "throttled_429": throttled,
+                "wait_ms_p50": round(waits[len(waits) // 2], 1) if waits else 0.0,
+                "wait_ms_p95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 1) if waits else 0.0,
+                "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+            }
+        return {"backend": RATE_BACKEND, "limits": self.limits, "buckets": out}
+
+
+def _make_backend():
+    if RATE_BACKEND == "sqlite" and RATE_LIMITS:
+        try:
+            return _SQLiteBuckets(RATE_DB)
+        except sqlite3.Error:
+            logger.warning("Buckets em %s indisponíveis; usando memória do processo", RATE_DB, exc_info=True)
+    return _MemoryBuckets()
+
+
+_limiter = RateLimiter(RATE_LIMITS, _make_backend())
+
+
+@contextmanager
+def rate_limited(kind: str, model: str):
+    """
+    Envolve uma chamada ao Gemini: espera a cota antes e, se a resposta for 429,
+    pausa o bucket do modelo
+    """
+    _limiter.acquire(kind, model)
+    try:
+        yield
+    except Exception as exc:
+        if is_rate_limited(exc):
+            _limiter.penalize(kind, model)
+        raise
+
+
+def rate_limiter_stats() -> dict:
+    return _limiter.stats()
@@ -0,0 +1,146 @@
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from ..utils.deadline import retry_with_jitter
+
+"""
+Streaming dos tokens gerados pelos agentes
+Os agentes chamam invoke_chain no lugar de chain.invoke: sem destino ativo o
+comportamento é o mesmo; com um TokenStream ativo (endpoint /chat/stream), a
+chain é consumida com chain.stream e cada trecho é repassado ao cliente
+enquanto a resposta completa é montada para o Judge. Falhas transitórias
+são repetidas dentro do prazo da requisição (ver utils.deadline).
+"""
+
+logger = logging.getLogger(__name__)
+
+_active_stream: ContextVar["TokenStream | None"] = ContextVar("sinara_token_stream", default=None)
+
+
+class TokenStream:
+    """
+    Destino dos tokens de uma requisição
+    Encaminha cada trecho como evento "token" (e "reset" quando uma geração
+    parcial é descartada). Com hold(), os eventos ficam retidos até release()
+    ou são descartados com discard() (rascunho especulativo antes do guardrail)
+    """
+
+    def __init__(self, emit: Callable[[str, dict], None]):
+        """
+        Args:
+            emit: Função que recebe (nome do evento, dados)
+        """
+        self._emit = emit
+        self._lock = threading.Lock()
+        self._held: list[tuple[str, dict]] | None = None
+        self._closed = False
+        self.streamed = False  # Algum token da geração atual foi emitido (ou retido)
+
+    def _send(self, event: str, data: dict):
+        with self._lock:
+            if self._closed:
+                return
+            if self._held is not None:
+                self._held.append((event, data))
+                return
+            self._emit(event, data)
+
+    def token(self, text: str):
+        self.streamed = True
+        self._send("token", {"text": text})
+
+    def reset(self):
+        """Descarta a geração parcial já emitida (ex.: modelo falhou no meio e outro vai gerar)"""
+        if self.streamed:
+            self.streamed = False
+            self._send("reset", {})
+
+    def hold(self):
+        with self._lock:
+            if self._held is None:
+                self._held = []
+
+    def release(self):
+        """Emite os eventos retidos e volta a emitir direto"""
+        with self._lock:
+            held, self._held = self._held or [], None
+            for event, data in held:
+                self._emit(event, data)
+
+    def discard(self):
+        """Descarta os eventos retidos (a geração não será usada)"""
+        with self._lock:
+            if self._held is not None:
+                self._held = []
+        self.streamed = False
+
+    def replace(self, text: str):
+        """
+        Substitui o que foi emitido por 'text' e fecha o destino: a geração que
+        ainda estiver em andamento (abandonada por prazo, ou perdedora do hedging)
+        não emite mais nada
+        """
+        with self._lock:
+            self._closed = True
+            self._held = None
+            if self.streamed:
+                self._emit("reset", {})
+            self.streamed = True
+            self._emit("token", {"text": text})
+
+
+@contextmanager
+def streaming_to(stream: TokenStream | None):
+    """Ativa 'stream' como destino dos tokens no contexto atual (e nas threads de estágio criadas nele)"""
+    token = _active_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _active_stream.reset(token)
+
+
+def current_stream() -> TokenStream | None:
+    return _active_stream.get()
+
+
+def reset_stream():
+    """Descarta a geração parcial do destino ativo (se houver)"""
+    stream = _active_stream.get()
+    if stream is not None:
+        stream.reset()
+
+
+def invoke_chain(chain, inputs: dict) -> str:
+    """
+    Executa a chain e devolve o texto da resposta
+    Com um TokenStream ativo, usa chain.stream e repassa cada trecho
+
+    Args:
+        chain: Runnable (prompt | modelo)
+        inputs: Variáveis do prompt
+    Returns:
+        Texto completo gerado
+    """
+    stream = _active_stream.get()
+    if stream is None:
+        output = retry_with_jitter(chain.invoke, inputs)
+        return getattr(output, "content", None) or str(output)
+    return retry_with_jitter(_stream_once, chain, inputs, stream)
+
+
+def _stream_once(chain, inputs: dict, stream: TokenStream) -> str:
+    parts: list[str] = []
+    try:
+        for chunk in chain.stream(inputs):
+            text = getattr(chunk, "content", chunk)
+            text = text if isinstance(text, str) else str(text)
+            if text:
+                parts.append(text)
+                stream.token(text)
+    except Exception:
+        stream.reset()
+        raise
+    return "".join(parts)
@@ -0,0 +1,177 @@
+import numpy as np
+
+"""
+Armazenamento dos vetores do corpus para busca por cosseno
+DenseVectors guarda float32; QuantizedVectors guarda float16 ou int8 com uma
+escala por vetor (2x / 4x menos memória), busca de forma aproximada e
+re-pontua os melhores candidatos com os vetores float32 exatos, lidos por mmap
+do cache em disco (páginas compartilhadas entre os workers pelo sistema).
+"""
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+# Linhas convertidas para float32 por vez na varredura quantizada (bloco cabe no cache da CPU)
+_BLOCK_ROWS = 512
+
+
+def _top_k_desc(sims: np.ndarray, k: int) -> np.ndarray:
+    """Índices dos k maiores valores, em ordem decrescente (estável em empates)"""
+    n = sims.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype="int64")
+    idx = np.argpartition(-sims, k - 1)[:k] if k < n else np.arange(n)
+    return idx[np.argsort(-sims[idx], kind="stable")]
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype="float32")
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0.0] = 1.0
+    return mat / norms
+
+
+class ExactRows:
+    """
+    Vetores float32 exatos de um subconjunto de linhas de uma matriz (tipicamente
+    o cache de embeddings aberto com mmap); normaliza sob demanda
+    """
+
+    def __init__(self, source: np.ndarray, rows: np.ndarray):
+        self.source = source  # (m, dim) float32, pode ser np.memmap
+        self.rows = np.asarray(rows, dtype="int64")  # linha em 'source' de cada vetor
+
+    def take(self, idx) -> np.ndarray:
+        return _normalize_rows(self.source[self.rows[np.asarray(idx, dtype="int64")]])
+
+
+class DenseVectors:
+    """Matriz float32 (n, dim) com linhas L2-normalizadas"""
+
+    dtype = "float32"
+
+    def __init__(self, mat: np.ndarray):
+        self.mat = np.ascontiguousarray(mat, dtype="float32")
+
+    def __len__(self) -> int:
+        return int(self.mat.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.mat.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.mat.nbytes)
+
+    def top_k(self, q: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """Top-k por produto interno com a query normalizada"""
+        sims = self.mat @ q
+        return [(float(sims[i]), int(i)) for i in _top_k_desc(sims, k)]
+
+    def top_k_rows(self, rows: np.ndarray, q: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """Top-k entre as linhas 'rows' (candidatos do índice ANN)"""
+        rows = np.asarray(rows, dtype="int64")
+        sims = self.mat[rows] @ q
+        return [(float(sims[j]), int(rows[j])) for j in _top_k_desc(sims, k)]
+
+    def scores(self, idx, q: np.ndarray) -> np.ndarray:
+        return self.mat[np.asarray(idx, dtype="int64")] @ q
+
+    def take(self, idx) -> np.ndarray:
+        return self.mat[np.asarray(idx, dtype="int64")]
+
+
+class QuantizedVectors:
+    """
+    Vetores quantizados com escala por vetor: x ≈ codes * scale
+    - float16: codes float16, escala 1
+    - int8: quantização simétrica, scale = max|x| / 127
+
+    A busca pontua todos os vetores de forma aproximada (em blocos, sem
+    materializar a matriz float32 inteira) e re-pontua os 'rescore' * k melhores
+    com os vetores exatos, quando disponíveis.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, exact: ExactRows | None = None, rescore: int = 4):
+        self.codes = codes  # (n, dim) float16 ou int8
+        self.scales = scales  # (n,) float32
+        self.exact = exact
+        self.rescore = max(1, int(rescore))
+
+    @classmethod
+    def from_float(
+        cls, mat: np.ndarray, dtype: str, exact: ExactRows | None = None, rescore: int = 4
+    ) -> "QuantizedVectors":
+        """
+        Quantiza uma matriz float32 de linhas normalizadas
+
+        Args:
+            mat: Matriz (n, dim)
+            dtype: "float16" ou "int8"
+            exact: Fonte dos vetores exatos para a re-pontuação (None = sem re-pontuação)
+            rescore: Fator de candidatos re-pontuados (rescore * k)
+        """
+        mat = np.asarray(mat, dtype="float32")
+        if dtype == "float16":
+            codes = mat.astype("float16")
+            scales = np.ones(mat.shape[0], dtype="float32")
+        elif dtype == "int8":
+            amax = np.abs(mat).max(axis=1) if mat.size else np.zeros(mat.shape[0], dtype="float32")
+            scales = (amax / 127.0).astype("float32")
+            scales[scales == 0.0] = 1.0
+            codes = np.clip(np.rint(mat / scales[:, None]), -127, 127).astype("int8")
+        else:
+            raise ValueError(f"dtype de quantização não suportado: {dtype}")
+        return cls(codes, scales, exact, rescore)
+
+    @property
+    def dtype(self) -> str:
+        return str(self.codes.dtype)
+
+    def __len__(self) -> int:
+        return int(self.codes.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.codes.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes + (self.exact.rows.nbytes if self.exact else 0))
+
+    def _approx_scores(self, q: np.ndarray) -> np.ndarray:
+        out = np.empty(len(self), dtype="float32")
+        for start in range(0, len(self), _BLOCK_ROWS):
+            block = self.codes[start:start + _BLOCK_ROWS].astype("float32")
+            out[start:start + _BLOCK_ROWS] = block @ q
+        return out * self.scales
+
+    def top_k(self, q: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """Top-k aproximado seguido de re-pontuação exata dos candidatos"""
+        return self._rescore(self._approx_scores(q), np.arange(len(self)), q, k)
+
+    def top_k_rows(self, rows: np.ndarray, q: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """Top-k entre as linhas 'rows' (candidatos do índice ANN), com a mesma re-pontuação"""
+        rows = np.asarray(rows, dtype="int64")
+        approx = (self.codes[rows].astype("float32") @ q) * self.scales[rows]
+        return self._rescore(approx, rows, q, k)
+
+    def _rescore(self, approx: np.ndarray, rows: np.ndarray, q: np.ndarray, k: int) -> list[tuple[float, int]]:
+        """Re-pontua os 'rescore' * k melhores candidatos com os vetores exatos, quando disponíveis"""
+        if self.exact is None:
+            return [(float(approx[j]), int(rows[j])) for j in _top_k_desc(approx, k)]
+        cand = rows[_top_k_desc(approx, k * self.rescore)]
+        exact = self.exact.take(cand) @ q
+        order = _top_k_desc(exact, k)
+        return [(float(exact[j]), int(cand[j])) for j in order]
+
+    def scores(self, idx, q: np.ndarray) -> np.ndarray:
+        return self.take(idx) @ q
+
+    def take(self, idx) -> np.ndarray:
+        """Vetores float32 das linhas pedidas (exatos se disponíveis, senão dequantizados)"""
+        idx = np.asarray(idx, dtype="int64")
+        if self.exact is not None:
+            return self.exact.take(idx)
+        return self.codes[idx].astype("float32") * self.scales[idx, None]
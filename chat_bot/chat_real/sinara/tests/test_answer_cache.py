@@ -0,0 +1,85 @@
+"""
+Testes do cache semântico de respostas finais (services.answer_cache)
+
+Uso (a partir de chat_bot/):
+    python -m pytest chat_real/sinara/tests/test_answer_cache.py
+"""
+
+import pytest
+
+from ..services.answer_cache import SemanticAnswerCache
+
+QUERY = "como bater o ponto no sistema"
+
+
+@pytest.fixture
+def cache():
+    return SemanticAnswerCache(maxsize=4, ttl=None, threshold=0.9)
+
+
+def test_query_equivalente_acerta(cache):
+    cache.store("faq", QUERY, [1.0, 0.0], "fp1", "resposta")
+
+    hit = cache.lookup("auto", "Como registro o ponto?", [0.99, 0.05])
+
+    assert hit is not None
+    assert (hit.answer, hit.agent, hit.query) == ("resposta", "faq", QUERY)
+    assert hit.similarity >= 0.9
+    assert cache.stats()["hits"] == 1
+
+
+def test_mesma_query_normalizada_acerta_sem_embedding(cache):
+    cache.store("faq", QUERY, None, "fp1", "resposta")
+
+    assert cache.lookup("faq", "  Como BATER o ponto no sistema ", None).similarity == 1.0
+
+
+def test_query_diferente_ou_outro_agente_erra(cache):
+    cache.store("faq", QUERY, [1.0, 0.0], "fp1", "resposta")
+
+    assert cache.lookup("auto", "qual a dose de cloro", [0.0, 1.0]) is None
+    assert cache.lookup("tecnico", QUERY, [1.0, 0.0]) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_contexto_alterado_invalida_a_entrada(cache):
+    cache.store("faq", QUERY, [1.0, 0.0], "fp1", "resposta")
+
+    assert cache.lookup("faq", QUERY, [1.0, 0.0], is_current=lambda fp: fp == "fp2") is None
+    stats = cache.stats()
+    assert (stats["invalidations"], stats["size"]) == (1, 0)
+
+
+def test_contexto_igual_mantem_a_entrada(cache):
+    cache.store("faq", QUERY, [1.0, 0.0], "fp1", "resposta")
+
+    assert cache.lookup("faq", QUERY, [1.0, 0.0], is_current=lambda fp: fp == "fp1") is not None
+    assert cache.stats()["invalidations"] == 0
+
+
+def test_resposta_restrita_a_sessao_nao_serve_a_outras(cache):
+    cache.store("assistente", QUERY, [1.0, 0.0], "fp1", "resposta da s1", session="s1")
+
+    assert cache.lookup("auto", QUERY, [1.0, 0.0], session="s2") is None
+    assert cache.lookup("auto", QUERY, [1.0, 0.0]) is None
+    assert cache.lookup("auto", QUERY, [1.0, 0.0], session="s1").answer == "resposta da s1"
+
+
+def test_resposta_sem_sessao_serve_a_todas(cache):
+    cache.store("faq", QUERY, [1.0, 0.0], "fp1", "resposta")
+
+    assert cache.lookup("auto", QUERY, [1.0, 0.0], session="s2") is not None
+
+
+def test_expiracao_e_descarte_lru():
+    cache = SemanticAnswerCache(maxsize=2, ttl=0, threshold=0.9)
+    cache.store("faq", QUERY, [1.0, 0.0], "fp1", "resposta")
+    assert cache.lookup("faq", QUERY, [1.0, 0.0]) is None
+    assert cache.stats()["expirations"] == 1
+
+    cache = SemanticAnswerCache(maxsize=2, ttl=None, threshold=0.9)
+    for i in range(3):
+        cache.store("faq", f"pergunta numero {i}", None, "fp", str(i))
+    assert len(cache) == 2
+    assert cache.lookup("faq", "pergunta numero 0", None) is None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,106 @@
+"""
+Testes do prazo por requisição e das retentativas (utils.deadline)
+
+Uso (a partir de chat_bot/):
+    python -m pytest chat_real/sinara/tests/test_deadline.py
+"""
+
+import pytest
+
+google_exc = pytest.importorskip("google.api_core.exceptions")
+
+from ..utils import deadline  # noqa: E402
+from ..utils.deadline import (  # noqa: E402
+    Deadline,
+    deadline_scope,
+    is_transient,
+    remaining_time,
+    retry_with_jitter,
+)
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    # Backoff zerado: os testes não dormem entre tentativas
+    monkeypatch.setattr(deadline, "RETRY_BASE_DELAY", 0.0)
+    monkeypatch.setattr(deadline, "RETRY_MIN_BUDGET", 1.0)
+
+
+def _failing(calls: list, exc: Exception, succeed_after: int | None = None):
+    def fn():
+        calls.append(1)
+        if succeed_after is not None and len(calls) > succeed_after:
+            return "ok"
+        raise exc
+    return fn
+
+
+def test_repete_falha_transitoria_e_devolve_o_resultado():
+    calls = []
+
+    assert retry_with_jitter(_failing(calls, google_exc.ServiceUnavailable("503"), 1), attempts=2) == "ok"
+    assert len(calls) == 2
+
+
+def test_respeita_o_numero_de_tentativas_sem_prazo():
+    calls = []
+
+    with pytest.raises(google_exc.ServiceUnavailable):
+        retry_with_jitter(_failing(calls, google_exc.ServiceUnavailable("503")), attempts=2)
+    assert len(calls) == 3
+
+
+def test_nao_repete_falha_permanente():
+    calls = []
+
+    with pytest.raises(ValueError):
+        retry_with_jitter(_failing(calls, ValueError("prompt inválido")), attempts=5)
+    assert len(calls) == 1
+
+
+def test_para_quando_o_prazo_nao_comporta_nova_tentativa():
+    calls = []
+
+    with deadline_scope(Deadline.after(0.5)), pytest.raises(google_exc.ServiceUnavailable):
+        retry_with_jitter(_failing(calls, google_exc.ServiceUnavailable("503")), attempts=5)
+    assert len(calls) == 1
+
+
+def test_repete_enquanto_o_prazo_comporta():
+    calls = []
+
+    with deadline_scope(Deadline.after(30)):
+        assert retry_with_jitter(_failing(calls, google_exc.ServiceUnavailable("503"), 2), attempts=5) == "ok"
+    assert len(calls) == 3
+
+
+def test_prazo_do_estagio_nao_passa_do_prazo_da_requisicao(monkeypatch):
+    monkeypatch.setattr(deadline, "STAGE_BUDGETS", {"agent": 20.0, "judge": 0.1})
+    request = Deadline.after(1.0)
+
+    assert request.for_stage("agent").remaining() <= 1.0
+    assert request.for_stage("judge").remaining() <= 0.1
+    assert request.for_stage("desconhecido") is request
+    assert Deadline.after(0).remaining() is None
+
+
+def test_prazo_ativo_no_contexto():
+    assert remaining_time() is None
+    with deadline_scope(Deadline.after(5)):
+        assert 0 < remaining_time() <= 5
+    assert remaining_time() is None
+
+
+def test_is_transient_por_tipo_e_status():
+    def wrapped(exc):
+        try:
+            raise RuntimeError("falha no LangChain") from exc
+        except RuntimeError as outer:
+            return outer
+
+    assert is_transient(google_exc.ServiceUnavailable("indisponível"))
+    assert is_transient(wrapped(google_exc.TooManyRequests("quota")))
+    assert is_transient(TimeoutError())
+    assert is_transient(RuntimeError("503 Service Unavailable"))
+    assert not is_transient(google_exc.NotFound("model is not found"))
+    assert not is_transient(ValueError("internal representation inválida"))
@@ -0,0 +1,164 @@
+"""
+Testes dos circuit breakers dos modelos Gemini (services.model_health)
+
+Uso (a partir de chat_bot/):
+    python -m pytest chat_real/sinara/tests/test_model_health.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+google_exc = pytest.importorskip("google.api_core.exceptions")
+
+from ..services import model_health  # noqa: E402
+from ..services.model_health import (  # noqa: E402
+    ModelHealthRegistry,
+    NoModelAvailable,
+    call_with_fallback,
+)
+from ..services.rate_limiter import RateLimitWaitExceeded  # noqa: E402
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(model_health, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+@pytest.fixture
+def registry(monkeypatch, clock):
+    registry = ModelHealthRegistry()
+    monkeypatch.setattr(model_health, "_registry", registry)
+    monkeypatch.setattr(model_health, "MODEL_FAILURE_THRESHOLD", 3)
+    return registry
+
+
+def _state(registry: ModelHealthRegistry, model: str) -> str:
+    return registry.stats()["models"][model]["state"]
+
+
+def _first(registry: ModelHealthRegistry, models: list[str]) -> str | None:
+    """Primeiro candidato reservado (como numa requisição em que ele responde)"""
+    return next(iter(registry.attempts("g", models)), None)
+
+
+def _open(registry: ModelHealthRegistry, model: str):
+    for _ in range(3):
+        registry.record_failure(model, google_exc.ServiceUnavailable("503"))
+
+
+def test_falhas_transitorias_abrem_o_circuito_depois_do_limite(registry):
+    registry.record_failure("a", google_exc.ServiceUnavailable("503"))
+    registry.record_failure("a", google_exc.ServiceUnavailable("503"))
+    assert _state(registry, "a") == "closed"
+
+    registry.record_failure("a", google_exc.ServiceUnavailable("503"))
+    assert _state(registry, "a") == "open"
+    assert _first(registry, ["a", "b"]) == "b"
+
+
+def test_modelo_inexistente_abre_na_hora_com_cooldown_maximo(registry):
+    registry.record_failure("a", google_exc.NotFound("model is not found"))
+
+    assert _state(registry, "a") == "open"
+    assert registry.stats()["models"]["a"]["retry_in_s"] == pytest.approx(model_health.MODEL_MAX_COOLDOWN)
+
+
+def test_half_open_testa_uma_vez_e_fecha_com_sucesso(registry, clock):
+    _open(registry, "a")
+    clock.now += model_health.MODEL_COOLDOWN
+    assert _state(registry, "a") == "half_open"
+
+    assert _first(registry, ["a", "b"]) == "a"
+    # Com o teste em andamento, as demais requisições seguem para o próximo candidato
+    assert _first(registry, ["a", "b"]) == "b"
+
+    registry.record_success("g", "a")
+    assert _state(registry, "a") == "closed"
+    assert _first(registry, ["a", "b"]) == "a"
+
+
+def test_teste_half_open_que_falha_reabre_com_cooldown_dobrado(registry, clock):
+    _open(registry, "a")
+    clock.now += model_health.MODEL_COOLDOWN
+    assert _first(registry, ["a"]) == "a"
+
+    registry.record_failure("a", google_exc.ServiceUnavailable("503"))
+
+    assert _state(registry, "a") == "open"
+    expected = min(model_health.MODEL_MAX_COOLDOWN, 2 * model_health.MODEL_COOLDOWN)
+    assert registry.stats()["models"]["a"]["retry_in_s"] == pytest.approx(expected)
+
+
+def test_falhas_locais_e_permanentes_nao_contam_contra_o_modelo(registry):
+    for _ in range(5):
+        registry.record_failure("a", RateLimitWaitExceeded("sem cota"))
+        registry.record_failure("a", ValueError("prompt inválido"))
+
+    stats = registry.stats()["models"]["a"]
+    assert (stats["state"], stats["failures"]) == ("closed", 0)
+
+
+def test_em_regime_so_o_ultimo_modelo_bom_e_chamado(registry):
+    registry.record_failure("a", google_exc.ServiceUnavailable("503"))
+    registry.record_success("g", "b")
+
+    # "a" tem falha recente e fica atrás do último bom até passar o cooldown
+    assert _first(registry, ["a", "b"]) == "b"
+
+
+def test_call_with_fallback_passa_ao_proximo_em_modelo_inexistente(registry):
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        if model == "a":
+            raise google_exc.NotFound("model is not found")
+        return f"ok-{model}"
+
+    assert call_with_fallback("g", ["a", "b"], call) == "ok-b"
+    assert calls == ["a", "b"]
+    assert registry.stats()["groups"] == {"g": "b"}
+    assert _state(registry, "a") == "open"
+
+
+def test_call_with_fallback_repassa_outras_falhas(registry):
+    calls = []
+
+    def call(model):
+        calls.append(model)
+        raise google_exc.ServiceUnavailable("503")
+
+    with pytest.raises(google_exc.ServiceUnavailable):
+        call_with_fallback("g", ["a", "b"], call)
+    assert calls == ["a"]
+
+    calls.clear()
+    with pytest.raises(NoModelAvailable):
+        call_with_fallback("g", ["a", "b"], call, fall_through=lambda exc: True)
+    assert calls == ["a", "b"]
+
+
+def test_call_with_fallback_falha_local_libera_sem_contar(registry, clock):
+    _open(registry, "a")
+    clock.now += model_health.MODEL_COOLDOWN
+
+    def call(model):
+        raise RateLimitWaitExceeded("sem cota")
+
+    with pytest.raises(RateLimitWaitExceeded):
+        call_with_fallback("g", ["a", "b"], call, fall_through=lambda exc: True)
+
+    # O teste half-open reservado foi liberado: a próxima requisição testa "a" de novo
+    assert registry.stats()["models"]["a"]["failures"] == 3
+    assert _first(registry, ["a", "b"]) == "a"
@@ -0,0 +1,96 @@
+"""
+Testes do espelho do corpus no MongoDB (services.mongo_corpus) contra mongomock
+
+Uso (a partir de chat_bot/):
+    python -m pytest chat_real/sinara/tests/test_mongo_corpus.py
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from ..services.mongo_corpus import MongoCorpus  # noqa: E402
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _doc(pos: int, content: str, ts: datetime | None = T0, **extra) -> dict:
+    doc = {"title": f"Doc {pos}", "content": content, "position": pos, "content_hash": f"h{pos}", **extra}
+    if ts is not None:
+        doc["updated_at"] = ts
+    return doc
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient()["DB_Sinara"]["contexto"]
+
+
+@pytest.fixture
+def corpus(collection):
+    return MongoCorpus("DB_Sinara", "contexto", batch_size=2, collection=collection)
+
+
+def test_carga_a_frio_le_todos_na_ordem_de_position(collection, corpus):
+    collection.insert_many([_doc(2, "c"), _doc(0, "a"), _doc(1, "b", ts=None)])
+
+    assert corpus.sync() is True
+    assert corpus.synced and corpus.version == 1
+    assert [d["content"] for d in corpus.documents()] == ["a", "b", "c"]
+    # Projeção: nada além dos campos de texto e metadados
+    assert all("chunk_embeddings" not in d for d in corpus.documents())
+
+
+def test_sincronizacao_sem_mudancas_nao_altera_versao(collection, corpus):
+    collection.insert_many([_doc(0, "a"), _doc(1, "b")])
+    corpus.sync()
+
+    assert corpus.sync() is False
+    assert corpus.version == 1
+
+
+def test_sincronizacao_incremental_por_updated_at(collection, corpus):
+    collection.insert_many([_doc(0, "a"), _doc(1, "b")])
+    corpus.sync()
+
+    collection.update_one({"position": 1}, {"$set": {"content": "b2", "updated_at": T0 + timedelta(minutes=1)}})
+    collection.insert_one(_doc(2, "c", ts=T0 + timedelta(minutes=2)))
+
+    assert corpus.sync() is True
+    assert [d["content"] for d in corpus.documents()] == ["a", "b2", "c"]
+    assert corpus.version == 2
+
+
+def test_remocao_sai_do_espelho(collection, corpus):
+    collection.insert_many([_doc(0, "a"), _doc(1, "b"), _doc(2, "c")])
+    corpus.sync()
+
+    collection.delete_one({"position": 1})
+
+    assert corpus.sync() is True
+    assert [d["content"] for d in corpus.documents()] == ["a", "c"]
+
+
+def test_insercao_com_o_mesmo_updated_at_e_encontrada(collection, corpus):
+    collection.insert_one(_doc(0, "a"))
+    corpus.sync()
+
+    # Mesmo updated_at do último visto: não passa no filtro $gt, só na conferência de _id
+    collection.insert_one(_doc(1, "b"))
+
+    assert corpus.sync() is True
+    assert [d["content"] for d in corpus.documents()] == ["a", "b"]
+
+
+def test_stored_vectors_filtra_por_modelo_e_hash(collection, corpus):
+    collection.insert_many([
+        _doc(0, "a", chunk_hashes=["x", "y"], chunk_embeddings=[[1.0], [2.0]], embedding_model="m1"),
+        _doc(1, "b", chunk_hashes=["z"], chunk_embeddings=[[3.0]], embedding_model="m2"),
+        _doc(2, "c", chunk_hashes=["w"], chunk_embeddings=[[]], embedding_model="m1"),
+    ])
+
+    assert corpus.stored_vectors(["x", "z", "w"], "m1") == {"x": [1.0]}
+    assert corpus.stored_vectors(["z"], "m2") == {"z": [3.0]}
+    assert corpus.stored_vectors([], "m1") == {}
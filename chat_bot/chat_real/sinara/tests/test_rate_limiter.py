@@ -0,0 +1,148 @@
+"""
+Testes do limitador de taxa das chamadas ao Gemini (services.rate_limiter)
+
+Uso (a partir de chat_bot/):
+    python -m pytest chat_real/sinara/tests/test_rate_limiter.py
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ..services import rate_limiter
+from ..services.rate_limiter import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    RateLimiter,
+    RateLimitWaitExceeded,
+    _MemoryBuckets,
+    is_rate_limited,
+)
+from ..utils.deadline import Deadline, deadline_scope
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=clock.monotonic, time=time.time))
+    return clock
+
+
+def test_bucket_comeca_cheio_e_reabastece_na_taxa(clock):
+    buckets = _MemoryBuckets()
+
+    assert buckets.take("chat:m", 1.0, 2.0) == 0.0
+    assert buckets.take("chat:m", 1.0, 2.0) == 0.0
+    assert buckets.take("chat:m", 1.0, 2.0) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert buckets.take("chat:m", 1.0, 2.0) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert buckets.take("chat:m", 1.0, 2.0) == 0.0
+
+
+def test_reabastecimento_nao_passa_da_capacidade(clock):
+    buckets = _MemoryBuckets()
+    buckets.take("chat:m", 1.0, 2.0)
+
+    clock.now += 100
+    assert buckets.take("chat:m", 1.0, 2.0) == 0.0
+    assert buckets.take("chat:m", 1.0, 2.0) == 0.0
+    assert buckets.take("chat:m", 1.0, 2.0) > 0
+
+
+def test_pausa_depois_de_429_esvazia_o_bucket(clock):
+    buckets = _MemoryBuckets()
+    buckets.pause("chat:m", 5.0)
+
+    assert buckets.take("chat:m", 1.0, 2.0) == pytest.approx(5.0)
+    clock.now += 5.0
+    assert buckets.take("chat:m", 1.0, 2.0) == 0.0
+
+
+def test_sem_limite_configurado_libera_na_hora():
+    limiter = RateLimiter({})
+
+    for _ in range(100):
+        limiter.acquire("chat", "m", max_wait=0)
+    assert limiter.stats()["buckets"] == {}
+
+
+def test_espera_alem_do_maximo_levanta():
+    limiter = RateLimiter({"chat": (6.0, 1.0)})  # Um token a cada 10 s
+    limiter.acquire("chat", "m")
+
+    with pytest.raises(RateLimitWaitExceeded):
+        limiter.acquire("chat", "m", max_wait=0.05)
+
+    stats = limiter.stats()["buckets"]["chat:m"]
+    assert (stats["acquired"], stats["rejected"], stats["queue_depth"]) == (1, 1, 0)
+
+
+def test_espera_limitada_pelo_prazo_da_requisicao():
+    limiter = RateLimiter({"chat": (6.0, 1.0)})
+    limiter.acquire("chat", "m")
+
+    start = time.monotonic()
+    with deadline_scope(Deadline.after(0.05)), pytest.raises(RateLimitWaitExceeded):
+        limiter.acquire("chat", "m", max_wait=10)
+    assert time.monotonic() - start < 1.0
+
+
+def test_limite_por_modelo_prevalece_sobre_o_do_tipo():
+    limiter = RateLimiter({"chat": (6.0, 1.0), "chat:rapido": (6000.0, 100.0)})
+    limiter.acquire("chat", "lento")
+
+    for _ in range(10):
+        limiter.acquire("chat", "rapido", max_wait=0)
+    with pytest.raises(RateLimitWaitExceeded):
+        limiter.acquire("chat", "lento", max_wait=0)
+
+
+def test_prioridade_alta_passa_na_frente_na_fila():
+    limiter = RateLimiter({"chat": (240.0, 1.0)})  # Um token a cada 0,25 s
+    limiter.acquire("chat", "m")
+    order = []
+
+    def worker(name: str, priority: int):
+        limiter.acquire("chat", "m", priority=priority, max_wait=5)
+        order.append(name)
+
+    low = threading.Thread(target=worker, args=("baixa", PRIORITY_LOW))
+    high = threading.Thread(target=worker, args=("alta", PRIORITY_HIGH))
+    low.start()
+    time.sleep(0.05)  # A de baixa prioridade chega antes e já está esperando
+    high.start()
+    low.join(5)
+    high.join(5)
+
+    assert order == ["alta", "baixa"]
+    assert limiter.stats()["buckets"]["chat:m"]["max_queue_depth"] == 2
+
+
+def test_is_rate_limited_pelo_tipo_inclusive_embrulhado():
+    google_exc = pytest.importorskip("google.api_core.exceptions")
+
+    def wrapped(exc):
+        try:
+            raise RuntimeError("Error embedding content") from exc
+        except RuntimeError as outer:
+            return outer
+
+    assert is_rate_limited(google_exc.ResourceExhausted("quota"))
+    assert is_rate_limited(google_exc.TooManyRequests("quota"))
+    assert is_rate_limited(wrapped(google_exc.TooManyRequests("quota")))
+    # Texto parecido não basta: só o tipo do google.api_core conta
+    assert not is_rate_limited(RuntimeError("429 tokens no prompt"))
+    assert not is_rate_limited(ValueError("quota inválida"))
+    assert not is_rate_limited(google_exc.ServiceUnavailable("indisponível"))
@@ -0,0 +1,209 @@
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable
+
+"""
+Prazo (deadline) de uma requisição e orçamento de tempo por estágio
+O prazo é definido na entrada (configuração ou cabeçalho X-Deadline-Ms) e
+fica em uma ContextVar, então chega às threads dos estágios e às chamadas de
+LLM, Mongo e Postgres sem ser passado por parâmetro. Cada estágio recebe o
+menor entre o seu teto (SINARA_STAGE_BUDGETS) e o tempo restante; novas
+tentativas só acontecem se ainda couberem no prazo.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Prazo padrão de uma requisição, em segundos (0 = sem prazo); também é o teto do cabeçalho
+REQUEST_DEADLINE = float(os.getenv("SINARA_REQUEST_DEADLINE", "30"))
+# Retentativas (além da primeira chamada) para falhas transitórias de LLM
+STAGE_RETRIES = max(0, int(os.getenv("SINARA_STAGE_RETRIES", "1")))
+RETRY_BASE_DELAY = float(os.getenv("SINARA_RETRY_BASE_DELAY", "0.25"))
+# Tempo mínimo que precisa sobrar (além da espera) para valer uma nova tentativa
+RETRY_MIN_BUDGET = float(os.getenv("SINARA_RETRY_MIN_BUDGET", "1.0"))
+
+
+def _parse_budgets(raw: str) -> dict[str, float]:
+    """'agent=20,judge=8' -> {'agent': 20.0, 'judge': 8.0} (entradas inválidas são ignoradas)"""
+    budgets = {}
+    for item in (raw or "").split(","):
+        name, _, value = item.partition("=")
+        try:
+            budgets[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return budgets
+
+
+# Teto de cada estágio, em segundos
+STAGE_BUDGETS = _parse_budgets(
+    os.getenv("SINARA_STAGE_BUDGETS", "guardrail=6,retrieval=4,router=6,agent=20,judge=8")
+)
+
+
+class Deadline:
+    """Instante limite (relógio monotônico); None = sem prazo"""
+
+    def __init__(self, expires_at: float | None = None):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float | None) -> "Deadline":
+        """Prazo daqui a 'seconds' segundos (None ou <= 0: sem prazo)"""
+        if seconds is None or seconds <= 0:
+            return cls(None)
+        return cls(time.monotonic() + seconds)
+
+    @classmethod
+    def for_request(cls, header_ms: str | int | None = None) -> "Deadline":
+        """
+        Prazo de uma requisição: o do cabeçalho (ms), limitado a SINARA_REQUEST_DEADLINE
+
+        Args:
+            header_ms: Valor de X-Deadline-Ms (ausente ou inválido = prazo padrão)
+        """
+        seconds = REQUEST_DEADLINE if REQUEST_DEADLINE > 0 else None
+        try:
+            asked = float(header_ms) / 1000 if header_ms not in (None, "") else None
+        except (TypeError, ValueError):
+            asked = None
+        if asked is not None and asked > 0:
+            seconds = min(asked, seconds) if seconds is not None else asked
+        return cls.after(seconds)
+
+    def remaining(self) -> float | None:
+        """Segundos restantes (nunca negativo), ou None sem prazo"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def for_stage(self, stage: str) -> "Deadline":
+        """Prazo do estágio a partir de agora: o teto do estágio, sem passar do prazo da requisição"""
+        cap = STAGE_BUDGETS.get(stage)
+        if cap is None or cap <= 0:
+            return self
+        end = time.monotonic() + cap
+        return Deadline(end if self.expires_at is None else min(end, self.expires_at))
+
+
+_current: ContextVar[Deadline | None] = ContextVar("sinara_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline | None):
+    """Ativa 'deadline' no contexto atual (e nas threads de estágio agendadas nele)"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def run_within(deadline: Deadline | None, fn: Callable, *args, **kwargs) -> Any:
+    """Executa fn com 'deadline' ativo (para agendar um estágio com o seu próprio prazo)"""
+    with deadline_scope(deadline):
+        return fn(*args, **kwargs)
+
+
+def current_deadline() -> Deadline | None:
+    return _current.get()
+
+
+def remaining_time() -> float | None:
+    """Segundos restantes do prazo ativo, ou None sem prazo"""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+try:
+    from google.api_core import exceptions as _google_exc
+
+    # 429, 500, 502, 503, 504 e interrupções do gRPC (501 e demais 4xx não passam numa nova tentativa)
+    _TRANSIENT_TYPES: tuple = (
+        _google_exc.TooManyRequests,
+        _google_exc.ResourceExhausted,
+        _google_exc.InternalServerError,
+        _google_exc.BadGateway,
+        _google_exc.ServiceUnavailable,
+        _google_exc.GatewayTimeout,
+        _google_exc.DeadlineExceeded,
+        _google_exc.Aborted,
+    )
+except ImportError:
+    _TRANSIENT_TYPES = ()
+
+# Mensagens de erros transitórios sem o tipo do google.api_core (ex.: embrulhados pelo LangChain):
+# nomes dos tipos, falhas de rede e códigos HTTP/gRPC só no contexto de status
+_TRANSIENT = re.compile(
+    r"ResourceExhausted|TooManyRequests|InternalServerError|ServiceUnavailable|GatewayTimeout|BadGateway"
+    r"|DeadlineExceeded|deadline exceeded|too many requests|service unavailable|temporarily unavailable"
+    r"|\btimed out\b|\btimeout\b|connection (?:reset|refused|aborted|error)|reset by peer"
+    r"|\b(?:status(?: code)?|http(?: error)?|code)\s*[:=]?\s*(?:429|50[0234])\b",
+    re.IGNORECASE,
+)
+# Exceções do google.api_core começam a mensagem pelo código ("503 Service Unavailable")
+_LEADING_STATUS = re.compile(r"^\s*(?:429|50[0234])\b")
+
+
+def exception_chain(exc: BaseException):
+    """A exceção e as que ela embrulha explicitamente (raise ... from), sem repetir"""
+    seen = set()
+    while exc is not None and id(exc) not in seen and len(seen) < 8:
+        seen.add(id(exc))
+        yield exc
+        exc = exc.__cause__
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Falha que pode passar numa nova tentativa (rede, 429, 5xx); modelo inexistente não é"""
+    for e in exception_chain(exc):
+        msg = f"{type(e).__name__}: {e}"
+        if "NotFound" in msg or "is not found" in msg:
+            return False
+        if isinstance(e, (TimeoutError, ConnectionError) + _TRANSIENT_TYPES):
+            return True
+        if _TRANSIENT.search(msg) or _LEADING_STATUS.match(str(e)):
+            return True
+    return False
+
+
+def retry_with_jitter(
+    fn: Callable,
+    *args,
+    attempts: int | None = None,
+    retry_if: Callable[[BaseException], bool] = is_transient,
+    **kwargs,
+) -> Any:
+    """
+    Chama fn e repete falhas transitórias com backoff exponencial com jitter
+    (espera sorteada entre 0 e base * 2^tentativa), só enquanto o prazo ativo
+    comportar a espera mais RETRY_MIN_BUDGET
+
+    Args:
+        fn: Função a chamar
+        attempts: Retentativas além da primeira chamada (padrão: SINARA_STAGE_RETRIES)
+        retry_if: Diz se a exceção merece nova tentativa
+    Returns:
+        Resultado de fn (a última exceção é propagada)
+    """
+    attempts = STAGE_RETRIES if attempts is None else attempts
+    for attempt in range(attempts + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as exc:
+            if attempt >= attempts or not retry_if(exc):
+                raise
+            delay = random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt))
+            remaining = remaining_time()
+            if remaining is not None and remaining < delay + RETRY_MIN_BUDGET:
+                logger.info("Sem tempo para nova tentativa (%.2f s restantes): %s", remaining, exc)
+                raise
+            logger.warning("Falha transitória (tentativa %d); repetindo em %.2f s: %s", attempt + 1, delay, exc)
+            time.sleep(delay)
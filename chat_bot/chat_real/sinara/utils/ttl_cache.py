@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Union
+
+
+class TTLCache:
+    """
+    Cache LRU com expiração (TTL), seguro para uso entre threads
+
+    - maxsize: número máximo de entradas (as menos usadas são descartadas)
+    - ttl: tempo de vida padrão de cada entrada, em segundos (None = sem expiração)
+    - get_or_set: consultas concorrentes da mesma chave executam a função
+      geradora uma única vez (single-flight); as demais aguardam o resultado
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600.0):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float | None, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: dict[Hashable, threading.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable) -> tuple[bool, Any]:
+        # Chamado com o lock adquirido
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        expires, value = item
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                self.hits += 1
+                return value
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = (time.monotonic() + ttl) if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(
+        self,
+        key: Hashable,
+        factory: Callable[[], Any],
+        ttl: Union[float, Callable[[Any], Optional[float]], None] = None,
+    ) -> Any:
+        """
+        Retorna o valor em cache ou calcula com factory() (uma vez por chave)
+        Exceções de factory são propagadas e nada é armazenado
+        'ttl' pode ser uma função do valor calculado (ex.: TTLs diferentes por resultado)
+        """
+        while True:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    self.hits += 1
+                    return value
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self.misses += 1
+                    done = self._inflight[key] = threading.Event()
+                    break
+            # Outra thread já está calculando esta chave
+            waiter.wait()
+        try:
+            value = factory()
+            self.set(key, value, ttl(value) if callable(ttl) else ttl)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        """Métricas do cache (tamanho, acertos, falhas, taxa de acerto, descartes)"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+            }